@@ -14,30 +14,46 @@ for path in ["src/frontend", "src/backend"]:
         sys.path.append(abs_path)
 
 from src.frontend.st_docu_talk import StreamlitDocuTalk  # noqa: E402
-
-if "app" not in st.session_state:
-    st.session_state["app"] = StreamlitDocuTalk()
-    st.rerun()
-
-app : StreamlitDocuTalk = st.session_state["app"]
-
-if app.auth.logged_in is False:
-    pg = st.navigation(
-        [
-            st.Page("src/frontend/pages/auth.py", title="Auth")
-        ],
-        position="hidden"
-    )
-else:
-    pg = st.navigation(
-        [
-            st.Page("src/frontend/pages/home.py", title="Home", default=True),
-            st.Page("src/frontend/pages/chatbot.py", title="Docu Talk"),
-            st.Page("src/frontend/pages/create-chatbot.py", title="Create Chat Bot"),
-            st.Page("src/frontend/pages/settings.py", title="Settings"),
-            st.Page("src/frontend/pages/chatbot-settings.py", title="Chat Bot Settings")
-        ],
-        position="hidden"
-    )
-
-pg.run()
+from src.backend.docu_talk.warmup import start_warm_up  # noqa: E402
+from src.backend.utils.tracing import instrument, tracer  # noqa: E402
+
+instrument()
+start_warm_up()
+
+with tracer.start_as_current_span("streamlit.rerun") as span:
+
+    if "app" not in st.session_state:
+        st.session_state["app"] = StreamlitDocuTalk()
+        st.rerun()
+
+    app : StreamlitDocuTalk = st.session_state["app"]
+
+    if app.auth.logged_in is False:
+        pg = st.navigation(
+            [
+                st.Page("src/frontend/pages/auth.py", title="Auth")
+            ],
+            position="hidden"
+        )
+    else:
+        pg = st.navigation(
+            [
+                st.Page("src/frontend/pages/home.py", title="Home", default=True),
+                st.Page("src/frontend/pages/chatbot.py", title="Docu Talk"),
+                st.Page(
+                    "src/frontend/pages/create-chatbot.py",
+                    title="Create Chat Bot"
+                ),
+                st.Page("src/frontend/pages/settings.py", title="Settings"),
+                st.Page(
+                    "src/frontend/pages/chatbot-settings.py",
+                    title="Chat Bot Settings"
+                )
+            ],
+            position="hidden"
+        )
+
+    if span is not None:
+        span.set_attribute("streamlit.page", pg.title)
+
+    pg.run()
@@ -0,0 +1,183 @@
+"""
+Load test of the HTTP API (`src/backend/api/app.py`): simulated users log in, then
+ask questions to a chatbot in a loop, each waiting for the end of an answer before
+sending the next question.
+
+The API is started against the fake LLM, so that the test measures the service and
+not Gemini:
+
+    LLM_BACKEND=fake uvicorn src.backend.api.app:app --workers 4
+
+then loaded with:
+
+    python benchmarks/api_load.py --email user@example.com --password ... \\
+        --chatbot-id ... --users 50 --questions 10
+
+`FAKE_LLM_TTFT` and `FAKE_LLM_TOKENS_PER_SECOND` set the pace of the fake answers
+(see `src/backend/docu_talk/agents/chatbot/fake.py`). The simulated users share
+the test account, hence its conversation (restored up to `CONVERSATION_WINDOW`
+messages per question). The report gives the time to the first token, the duration
+of the answers (p50, p95, max) and the throughput.
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+def get_quantile(values: list[float], q: float) -> float:
+    """
+    Returns a quantile of values (nearest rank).
+    """
+
+    if len(values) == 0:
+        return float("nan")
+
+    values = sorted(values)
+
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+async def ask(
+        client: httpx.AsyncClient,
+        chatbot_id: str,
+        message: str,
+        model: str | None
+    ) -> tuple[float, float]:
+    """
+    Asks a question and reads the streamed answer.
+
+    Returns
+    -------
+    tuple of float
+        The time to the first token and the duration, in seconds.
+    """
+
+    start_time = time.perf_counter()
+    ttft = None
+
+    async with client.stream(
+        "POST",
+        f"/chatbots/{chatbot_id}/messages",
+        json={"message": message, "model": model}
+    ) as response:
+
+        response.raise_for_status()
+
+        async for line in response.aiter_lines():
+            if line == "event: token" and ttft is None:
+                ttft = time.perf_counter() - start_time
+            elif line == "event: error":
+                raise RuntimeError("The answer failed")
+
+    return ttft, time.perf_counter() - start_time
+
+async def simulate_user(
+        args: argparse.Namespace,
+        token: str,
+        user: int,
+        results: dict[str, list]
+    ) -> None:
+    """
+    Asks `args.questions` questions, one after the other.
+    """
+
+    async with httpx.AsyncClient(
+        base_url=args.url,
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=args.timeout
+    ) as client:
+
+        for question in range(args.questions):
+            try:
+                ttft, duration = await ask(
+                    client,
+                    args.chatbot_id,
+                    f"Question {question} of user {user}: what does the document say?",
+                    args.model
+                )
+                results["ttft"].append(ttft)
+                results["duration"].append(duration)
+            except (httpx.HTTPError, RuntimeError) as e:
+                results["errors"].append(str(e))
+
+async def run(args: argparse.Namespace) -> list[str]:
+    """
+    Runs the simulated users concurrently.
+    """
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        response = await client.post(
+            "/auth/token",
+            json={"email": args.email, "password": args.password}
+        )
+        response.raise_for_status()
+        token = response.json()["access_token"]
+
+    results = {"ttft": [], "duration": [], "errors": []}
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[
+        simulate_user(args, token, user, results) for user in range(args.users)
+    ])
+    elapsed = time.perf_counter() - start_time
+
+    lines = [
+        f"{args.users} users x {args.questions} questions on {args.url}",
+        "",
+        f"{'metric':<12}{'p50':>10}{'p95':>10}{'max':>10}  (s)"
+    ]
+    for metric in ["ttft", "duration"]:
+        values = [value for value in results[metric] if value is not None]
+        lines.append(
+            f"{metric:<12}{get_quantile(values, 0.5):>10.3f}"
+            f"{get_quantile(values, 0.95):>10.3f}"
+            f"{max(values, default=float('nan')):>10.3f}"
+        )
+
+    lines += [
+        "",
+        f"answers     {len(results['duration'])} in {elapsed:.1f}s "
+        f"({len(results['duration']) / elapsed:.1f}/s)",
+        f"errors      {len(results['errors'])}"
+    ]
+
+    return lines
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API URL")
+    parser.add_argument("--email", required=True, help="Email of the test user")
+    parser.add_argument("--password", required=True, help="Password of the test user")
+    parser.add_argument("--chatbot-id", required=True, help="Chatbot to ask")
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=20,
+        help="Number of concurrent users (default is 20)"
+    )
+    parser.add_argument(
+        "--questions",
+        type=int,
+        default=5,
+        help="Number of questions per user (default is 5)"
+    )
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="Model to ask (default is the API's DEFAULT_MODEL)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=120,
+        help="Timeout of a request in seconds (default is 120)"
+    )
+    args = parser.parse_args()
+
+    print("\n".join(asyncio.run(run(args))))
@@ -0,0 +1,178 @@
+"""
+Render time and payload size of the emails (see `EmailTemplate`).
+
+Each template is rendered as before ("previous": `string.Template` and `html2text`
+on each send, with the logo inlined in base64) and compiled, with the logo
+attached by content ID ("cid") or hosted ("url"). The payload is the MIME message
+sent to SES; for bulk sends ("bulk"), only the data of each recipient is sent:
+
+    python benchmarks/email_templates.py
+
+The report is written to `benchmarks/results/email_templates.txt`.
+"""
+
+import json
+import os
+import sys
+import time
+from string import Template
+
+from html2text import html2text
+
+sys.path.append(".")
+
+from src.backend.mailing.mailing_bot import SUBJECTS  # noqa: E402
+from src.backend.mailing.rendering import EmailTemplate, build_message  # noqa: E402
+from src.backend.utils.file_io import get_encoded_image, recursive_read  # noqa: E402
+
+LOGO_PATH = os.path.join("src", "frontend", "assets", "logo_docu_talk.png")
+LOGO_URL = "https://docu-talk-ai-apps.streamlit.app/app/static/logo_docu_talk.png"
+
+DATA = {
+    "first_name": "Camille",
+    "id": "camille.martin@example.com",
+    "password": "Xk8#pQ2!vL9m",
+    "sharing_name": "alex.durand@example.com",
+    "chatbot_name": "Employment contract & labour law"
+}
+
+
+def time_call(func, *args, repeat: int = 2000) -> float:
+    """
+    Times a call, best of several runs.
+
+    Parameters
+    ----------
+    func : Callable
+        The function.
+    *args
+        The arguments of the function.
+    repeat : int, optional
+        The number of runs (default is 2000).
+
+    Returns
+    -------
+    float
+        The duration in seconds.
+    """
+
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start_time)
+
+    return min(durations)
+
+def render_previous(html: str, subject: str, encoded_logo: str) -> dict[str, str]:
+    """
+    Renders an email as `MailingBot` did before the compiled templates.
+    """
+
+    values = {**DATA, "logo": encoded_logo}
+    body_html = Template(html).substitute(values)
+
+    return {
+        "subject": Template(subject).substitute(values),
+        "body_html": body_html,
+        "body_text": html2text(body_html)
+    }
+
+def get_payload_size(email: dict[str, str], inline_images: dict | None) -> int:
+    """
+    Returns the size of the MIME message of an email in bytes.
+    """
+
+    message = build_message(
+        sender="support@ai-apps.cloud",
+        recipient="camille.martin@example.com",
+        inline_images=inline_images,
+        **email
+    )
+
+    return len(message.as_bytes())
+
+def run() -> list[str]:
+    """
+    Compares the render times and payload sizes of the templates.
+
+    Returns
+    -------
+    list of str
+        The lines of the report.
+    """
+
+    emails = recursive_read(
+        folder=os.path.join("src", "backend", "mailing", "templates"),
+        extensions=(".html")
+    )
+
+    encoded_logo = get_encoded_image(path=LOGO_PATH)
+    with open(LOGO_PATH, "rb") as f:
+        logo = f.read()
+
+    lines = [
+        f"Logo: {len(logo)} bytes ({len(encoded_logo)} in base64)",
+        "",
+        f"{'template':<16}{'mode':<10}{'render (us)':>13}{'payload (bytes)':>17}"
+    ]
+
+    for name in sorted(emails):
+
+        previous_html = emails[name].replace(
+            "$logo_src",
+            "data:image/png;base64,$logo"
+        )
+        cid = EmailTemplate(
+            name=name,
+            subject=SUBJECTS[name],
+            body_html=emails[name],
+            constants={"logo_src": "cid:logo"},
+            inline_images={"logo": logo}
+        )
+        url = EmailTemplate(
+            name=name,
+            subject=SUBJECTS[name],
+            body_html=emails[name],
+            constants={"logo_src": LOGO_URL}
+        )
+
+        data = {slot: DATA[slot] for slot in set(cid.html[1] + cid.subject[1])}
+
+        rows = [
+            (
+                "previous",
+                time_call(render_previous, previous_html, SUBJECTS[name], encoded_logo),
+                get_payload_size(
+                    render_previous(previous_html, SUBJECTS[name], encoded_logo),
+                    None
+                )
+            ),
+            (
+                "cid",
+                time_call(cid.render, data),
+                get_payload_size(cid.render(data), cid.inline_images)
+            ),
+            (
+                "url",
+                time_call(url.render, data),
+                get_payload_size(url.render(data), None)
+            ),
+            ("bulk", None, len(json.dumps(data)))
+        ]
+
+        for mode, duration, size in rows:
+            render = "-" if duration is None else f"{duration * 1e6:.1f}"
+            lines.append(f"{name:<16}{mode:<10}{render:>13}{size:>17}")
+
+    return lines
+
+if __name__ == "__main__":
+
+    report = "\n".join(run())
+    print(report)
+
+    path = os.path.join(os.path.dirname(__file__), "results", "email_templates.txt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(report + "\n")
@@ -0,0 +1,199 @@
+"""
+Prompt size and latency of the icon selection modes (see
+`ChatBotService.generate_icon`).
+
+Offline, the icon prompt is built for sample chatbot descriptions with all of the
+icon names ("full") and with the local shortlist ("shortlist"), and the local
+selection ("local") is timed. Tokens are estimated as characters / 4:
+
+    python benchmarks/icons.py
+
+With `--live`, each mode is also run against Gemini (needs the Vertex AI
+credentials), and the actual token counts and latencies are reported:
+
+    python benchmarks/icons.py --live
+
+The report is written to `benchmarks/results/icons.txt`.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(".")
+
+from src.backend.docu_talk.agents.chatbot.chatbot import (  # noqa: E402
+    get_icons,
+    get_prompts,
+)
+from src.backend.docu_talk.agents.chatbot.icon_index import (  # noqa: E402
+    get_icon_index,
+)
+
+CHARACTERS_PER_TOKEN = 4
+
+DESCRIPTIONS = [
+    "This chatbot answers questions about the employment contract and the labour "
+    "law obligations of the company.",
+    "An assistant for the user manual of a washing machine, covering installation, "
+    "programs and maintenance.",
+    "Explore the annual financial report of a bank: revenue, balance sheet, "
+    "capital ratios and risk management.",
+    "Medical guidelines for the treatment of type 2 diabetes in hospital patients.",
+    "A collection of Italian recipes, from pasta to desserts, with cooking tips.",
+    "Course material for an introduction to machine learning and statistics.",
+    "The travel insurance policy: coverage, exclusions and claims procedure.",
+    "Technical documentation of a REST API for a cloud storage service.",
+    "Safety data sheets of the chemicals used in the laboratory.",
+    "The rules and regulations of the local football club and its competitions.",
+    "Installation and maintenance guide of solar panels for residential buildings.",
+    "The onboarding handbook for new employees: benefits, holidays and IT tools.",
+]
+
+
+def time_call(func, *args, repeat: int = 20) -> float:
+    """
+    Times a call, best of several runs.
+
+    Parameters
+    ----------
+    func : Callable
+        The function.
+    *args
+        The arguments of the function.
+    repeat : int, optional
+        The number of runs (default is 20).
+
+    Returns
+    -------
+    float
+        The duration in seconds.
+    """
+
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start_time)
+
+    return min(durations)
+
+def run_offline() -> list[str]:
+    """
+    Compares the prompt sizes of the modes, and times the local selection.
+
+    Returns
+    -------
+    list of str
+        The lines of the report.
+    """
+
+    start_time = time.perf_counter()
+    icon_index = get_icon_index()
+    build_time = time.perf_counter() - start_time
+
+    names = list(get_icons().keys())
+    template = get_prompts()["icon"]
+
+    full_sizes, shortlist_sizes, shortlist_times, local_times = [], [], [], []
+    for description in DESCRIPTIONS:
+
+        full_sizes.append(
+            len(template.format(icons=names, chatbot_description=description))
+        )
+
+        candidates = icon_index.shortlist(description)
+        shortlist_sizes.append(
+            len(template.format(icons=candidates, chatbot_description=description))
+        )
+
+        shortlist_times.append(time_call(icon_index.shortlist, description))
+        local_times.append(time_call(icon_index.best, description))
+
+    full_chars = statistics.mean(full_sizes)
+    shortlist_chars = statistics.mean(shortlist_sizes)
+
+    lines = [
+        f"{len(names)} icons, {len(DESCRIPTIONS)} descriptions, index built in "
+        f"{build_time * 1000:.1f} ms",
+        "",
+        f"{'mode':<10}{'prompt (chars)':>16}{'prompt (~tokens)':>18}"
+        f"{'local time (ms)':>17}",
+        f"{'full':<10}{full_chars:>16.0f}"
+        f"{full_chars / CHARACTERS_PER_TOKEN:>18.0f}{'-':>17}",
+        f"{'shortlist':<10}{shortlist_chars:>16.0f}"
+        f"{shortlist_chars / CHARACTERS_PER_TOKEN:>18.0f}"
+        f"{statistics.mean(shortlist_times) * 1000:>17.2f}",
+        f"{'local':<10}{0:>16}{0:>18}{statistics.mean(local_times) * 1000:>17.2f}",
+        "",
+        "Local choices:"
+    ]
+    for description in DESCRIPTIONS:
+        lines.append(f"  {icon_index.best(description):<24}{description[:60]}...")
+
+    return lines
+
+def run_live() -> list[str]:
+    """
+    Runs each mode against Gemini.
+
+    Returns
+    -------
+    list of str
+        The lines of the report.
+    """
+
+    from dotenv import load_dotenv
+    from src.backend.docu_talk.agents.chatbot.chatbot import ChatBotService
+
+    load_dotenv()
+
+    service = ChatBotService(documents=[], storage_manager=None)
+
+    lines = [
+        "",
+        f"{'mode':<10}{'tokens (mean)':>15}{'latency p50 (s)':>17}"
+        f"{'latency max (s)':>17}"
+    ]
+    for mode in ["full", "shortlist", "local"]:
+
+        tokens, durations = [], []
+        for description in DESCRIPTIONS:
+
+            start_time = time.perf_counter()
+            service.generate_icon(description=description, mode=mode)
+            durations.append(time.perf_counter() - start_time)
+
+            usages = service.last_usages
+            tokens.append(usages["qty"] if usages is not None else 0)
+
+        lines.append(
+            f"{mode:<10}{statistics.mean(tokens):>15.0f}"
+            f"{statistics.median(durations):>17.2f}{max(durations):>17.2f}"
+        )
+
+    return lines
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Also run each mode against Gemini"
+    )
+    args = parser.parse_args()
+
+    lines = run_offline()
+    if args.live:
+        lines += run_live()
+
+    report = "\n".join(lines)
+    print(report)
+
+    path = os.path.join(os.path.dirname(__file__), "results", "icons.txt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(report + "\n")
@@ -0,0 +1,113 @@
+"""
+Startup-time profile of the application modules.
+
+Runs `python -X importtime` on the modules imported by `app.py` before the first
+page renders, and writes the slowest imports (by cumulative time) to
+`benchmarks/results/importtime.txt`. The warm-up (heavy artefacts and modules that
+are deferred to first use) is then timed separately.
+
+Usage (from the repository root, with the application secrets available):
+
+    python benchmarks/importtime.py
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+MODULES = [
+    "src.frontend.st_docu_talk",
+    "src.backend.utils.tracing"
+]
+
+PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def get_import_times(modules: list[str]) -> list[tuple[str, int, int, int]]:
+    """
+    Imports modules in a fresh interpreter with `-X importtime`.
+
+    Parameters
+    ----------
+    modules : list of str
+        The modules to import.
+
+    Returns
+    -------
+    list of tuple
+        (module, self time in us, cumulative time in us, nesting level) for each
+        imported module.
+    """
+
+    process = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    import_times = []
+    for line in process.stderr.splitlines():
+        match = PATTERN.match(line)
+        if match is not None:
+            self_us, cumulative_us, indent, module = match.groups()
+            level = (len(indent) - 1) // 2
+            import_times.append((module, int(self_us), int(cumulative_us), level))
+
+    return import_times
+
+def get_warm_up_durations() -> dict[str, float]:
+    """
+    Times the warm-up steps in a fresh interpreter.
+
+    Returns
+    -------
+    dict
+        The duration of each step in seconds.
+    """
+
+    process = subprocess.run(  # noqa: S603
+        [
+            sys.executable,
+            "-c",
+            "import json; from src.backend.docu_talk.warmup import warm_up; "
+            "print(json.dumps(warm_up()))"
+        ],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    import json
+
+    return json.loads(process.stdout.splitlines()[-1])
+
+if __name__ == "__main__":
+
+    import_times = get_import_times(MODULES)
+
+    total_us = sum(t[1] for t in import_times)
+    top_level = [t for t in import_times if t[3] <= 2]
+    slowest = sorted(top_level, key=lambda t: t[2], reverse=True)[:30]
+
+    lines = [
+        f"Python {sys.version.split()[0]} - import of {', '.join(MODULES)}",
+        f"Total: {total_us / 1000:.1f} ms ({len(import_times)} modules)",
+        "",
+        f"{'cumulative (ms)':>16}{'self (ms)':>12}  module"
+    ]
+    for module, self_us, cumulative_us, _ in slowest:
+        lines.append(f"{cumulative_us / 1000:>16.1f}{self_us / 1000:>12.1f}  {module}")
+
+    lines += ["", "Deferred to first use (warm-up):"]
+    for step, duration in get_warm_up_durations().items():
+        lines.append(f"{duration * 1000:>16.1f}  {step}")
+
+    report = "\n".join(lines)
+    print(report)
+
+    path = os.path.join(os.path.dirname(__file__), "results", "importtime.txt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(report + "\n")
@@ -0,0 +1,296 @@
+"""
+Fuzzing and benchmark of the structured-output parser (`src/backend/utils/parsing.py`)
+against the previous regex-based implementation.
+
+* Fuzzing: model outputs are generated for each expected structure (`Desc`, `Icon`,
+  `SuggestedPrompts`, `Source`), wrapped in code fences, prose, apostrophes,
+  markdown links and trailing text, then parsed by both implementations. An output
+  is recovered when the parsed value matches the generated one.
+* Adversarial inputs: long outputs with unbalanced or deeply nested brackets, timed
+  for growing sizes. The previous implementation is stopped after `--timeout`
+  seconds per regex search.
+
+    python benchmarks/parsing.py
+
+The report is written to `benchmarks/results/parsing.txt`.
+"""
+
+import argparse
+import ast
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(".")
+
+import regex  # noqa: E402
+from src.backend.docu_talk.agents.chatbot.validation import (  # noqa: E402
+    Desc,
+    Icon,
+    Source,
+    SuggestedPrompts,
+)
+from src.backend.utils.parsing import (  # noqa: E402
+    extract_model,
+    extract_models,
+)
+
+WORDS = (
+    "contract law invoice policy manual report the a of employee's user's it's "
+    'data chart {braces} [brackets] "quoted" revenue risk page section'
+).split()
+
+
+class SearchTimeoutError(Exception):
+    pass
+
+def legacy_parse_str(text: str):
+    for parser in (ast.literal_eval, json.loads):
+        try:
+            return parser(text)
+        except (SyntaxError, ValueError, json.decoder.JSONDecodeError):
+            continue
+    raise ValueError("Pattern not found")
+
+def legacy_search(pattern: str, text: str, timeout: float, *args) -> str | None:
+    try:
+        match = regex.search(pattern, text, *args, timeout=timeout)
+    except TimeoutError as e:
+        raise SearchTimeoutError() from e
+    return None if match is None else match.group(0)
+
+def legacy_extract_dict(text: str, timeout: float) -> dict:
+    try:
+        d = legacy_parse_str(text)
+        if isinstance(d, dict):
+            return d
+    except (ValueError, MemoryError, RecursionError):
+        pass
+    for pattern in [r"\{(?:[^{}]|(?R))*\}", r"\{\n([\s\S]*?)\n\}", r"\{([\s\S]*?)\}"]:
+        match = legacy_search(pattern, text, timeout)
+        if match is not None:
+            return legacy_parse_str(match)
+    raise ValueError("Pattern not found")
+
+def legacy_extract_list(text: str, timeout: float) -> list:
+    for pattern in [r"\[\[.*?\]\]", r"\[.*?\]"]:
+        match = legacy_search(pattern, text, timeout, regex.DOTALL)
+        if match is not None:
+            try:
+                return legacy_parse_str(match)
+            except ValueError:
+                return []
+    return []
+
+def legacy_extract_list_of_dicts(text: str, timeout: float) -> list[dict]:
+    try:
+        parsed = legacy_parse_str(text)
+        if isinstance(parsed, list):
+            return parsed
+        if isinstance(parsed, dict):
+            return [parsed]
+    except (ValueError, MemoryError, RecursionError):
+        pass
+    dict_list = []
+    for match in regex.findall(r"\{[\s\S]*?\}", text, timeout=timeout):
+        try:
+            parsed = legacy_parse_str(match)
+            if isinstance(parsed, dict):
+                dict_list.append(parsed)
+        except ValueError:
+            continue
+    return dict_list
+
+def legacy_parse(kind: str, text: str, timeout: float):
+    """
+    Parses an output as `ChatBotService` did before the scanner.
+    """
+
+    if kind == "prompts":
+        return SuggestedPrompts(items=legacy_extract_list(text, timeout)).items
+    if kind == "sources":
+        return [Source(**d).model_dump() for d in legacy_extract_list_of_dicts(
+            text, timeout
+        )]
+    model = Desc if kind == "desc" else Icon
+    return model(**legacy_extract_dict(text, timeout)).model_dump()
+
+def parse(kind: str, text: str, timeout: float):
+    """
+    Parses an output as `ChatBotService` does.
+    """
+
+    if kind == "prompts":
+        return extract_model(text, SuggestedPrompts).items
+    if kind == "sources":
+        return [s.model_dump() for s in extract_models(text, Source)[0]]
+    model = Desc if kind == "desc" else Icon
+    return extract_model(text, model).model_dump()
+
+def random_text(rng: random.Random, nb_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(nb_words))
+
+def generate(rng: random.Random, kind: str) -> tuple[object, str]:
+    """
+    Generates an expected value and a noisy model output that contains it.
+    """
+
+    if kind == "desc":
+        value = {"title": random_text(rng, 3), "description": random_text(rng, 12)}
+    elif kind == "icon":
+        value = {"name": rng.choice(["gavel", "school", "policy"]), "color": "#1a73e8"}
+    elif kind == "prompts":
+        value = [random_text(rng, 8) + "?" for _ in range(rng.randint(3, 5))]
+    else:
+        value = [
+            {
+                "filename": f"{random_text(rng, 1)}.pdf",
+                "page": rng.randint(1, 300),
+                "citation": random_text(rng, 10)
+            }
+            for _ in range(rng.randint(1, 4))
+        ]
+
+    if rng.random() < 0.5:
+        literal = json.dumps(value, indent=rng.choice([None, 2]))
+    else:
+        literal = repr(value)
+
+    prefix = rng.choice([
+        "",
+        "Here is the answer:\n",
+        "Sure! See [the manual](https://example.com) for details.\n",
+        f"{random_text(rng, 10)}\n",
+        "Note: the user's request {was} ambiguous.\n"
+    ])
+    if rng.random() < 0.5:
+        literal = f"```{rng.choice(['json', 'python', ''])}\n{literal}\n```"
+    suffix = rng.choice([
+        "",
+        "\nLet me know if you need anything else.",
+        f"\n{random_text(rng, 15)}",
+        "\n(I hope it's useful) [1]",
+        "\n{unfinished"
+    ])
+
+    return value, prefix + literal + suffix
+
+def try_parse(
+        func,
+        kind: str,
+        text: str,
+        timeout: float
+    ):
+    """
+    Parses an output, returning None when it fails. Timeouts are raised.
+    """
+
+    try:
+        return func(kind, text, timeout)
+    except SearchTimeoutError:
+        raise
+    except Exception:
+        return None
+
+def fuzz(nb_cases: int, timeout: float, seed: int = 0) -> list[str]:
+    """
+    Counts the outputs recovered by both implementations.
+    """
+
+    # Seeded for reproducible cases, not for security
+    rng = random.Random(seed)  # noqa: S311
+
+    lines = [
+        f"Fuzzing ({nb_cases} outputs per structure, seed {seed}): recovered outputs",
+        "",
+        f"{'structure':<12}{'previous':>10}{'scanner':>10}"
+    ]
+    for kind in ["desc", "icon", "prompts", "sources"]:
+
+        recovered = {"previous": 0, "scanner": 0}
+        for _ in range(nb_cases):
+
+            value, text = generate(rng, kind)
+
+            for name, func in [("previous", legacy_parse), ("scanner", parse)]:
+                try:
+                    output = try_parse(func, kind, text, timeout)
+                except SearchTimeoutError:
+                    output = None
+                recovered[name] += output == value
+
+        lines.append(
+            f"{kind:<12}{recovered['previous']:>10}{recovered['scanner']:>10}"
+        )
+
+    return lines
+
+ADVERSARIAL = {
+    "unclosed braces": lambda n: "{" * n,
+    "unclosed object": lambda n: '{"title": "' + "a" * n,
+    "braces in prose": lambda n: "x{y" * (n // 3),
+    "deep nesting": lambda n: "[" * (n // 2) + "]" * (n // 2),
+    "unbalanced mix": lambda n: "{[" * (n // 4) + "]}" * (n // 8),
+    "truncated list": lambda n: '{"items": [' + '"abc", ' * (n // 7),
+}
+
+def time_adversarial(sizes: list[int], timeout: float) -> list[str]:
+    """
+    Times `extract_dict`-style parsing of adversarial outputs.
+    """
+
+    lines = [
+        "",
+        f"Adversarial outputs: time to parse a `Desc` (ms, '>' = stopped after "
+        f"{timeout:g}s)",
+        "",
+        f"{'input':<18}{'size':>9}{'previous':>12}{'scanner':>12}"
+    ]
+    for name, make in ADVERSARIAL.items():
+        for size in sizes:
+
+            text = make(size)
+            durations = []
+            for func in (legacy_parse, parse):
+
+                start_time = time.perf_counter()
+                try:
+                    try_parse(func, "desc", text, timeout)
+                except SearchTimeoutError:
+                    durations.append(f">{timeout * 1000:.0f}")
+                    continue
+                durations.append(f"{(time.perf_counter() - start_time) * 1000:.1f}")
+
+            lines.append(f"{name:<18}{size:>9}{durations[0]:>12}{durations[1]:>12}")
+
+    return lines
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--cases",
+        type=int,
+        default=500,
+        help="Number of fuzzed outputs per structure (default is 500)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=5,
+        help="Timeout of a regex search of the previous implementation (default is 5)"
+    )
+    args = parser.parse_args()
+
+    lines = fuzz(args.cases, args.timeout)
+    lines += time_adversarial([1000, 10000, 100000], args.timeout)
+
+    report = "\n".join(lines)
+    print(report)
+
+    path = os.path.join(os.path.dirname(__file__), "results", "parsing.txt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(report + "\n")
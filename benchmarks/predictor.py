@@ -0,0 +1,208 @@
+"""
+Accuracy and latency of the compact predictor (boosted stumps) against the pickled
+random forests.
+
+The data is exported from the metric tables first (needs the database):
+
+    python benchmarks/predictor.py --export benchmarks/data
+
+then compared offline:
+
+    python benchmarks/predictor.py benchmarks/data
+
+For each metric, records are split chronologically (first 80% for training, last
+20% for evaluation). Both backends are evaluated as they are served, one record
+at a time through `Predictor.predict`. Note that the pickles were trained on the
+whole table, evaluation records included, which favours them.
+The report is written to `benchmarks/results/predictor.txt`.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(".")
+
+import numpy as np  # noqa: E402
+from src.backend.docu_talk.agents.predictor.compact import (  # noqa: E402
+    BoostedStumps,
+    StumpEnsemble,
+)
+from src.backend.docu_talk.agents.predictor.features import (  # noqa: E402
+    FeatureSchema,
+)
+from src.backend.docu_talk.agents.predictor.predictor import (  # noqa: E402
+    Predictor,
+    metrics,
+)
+
+
+def load_records(path: str) -> list[dict]:
+    """
+    Loads exported records, sorted by timestamp.
+
+    Parameters
+    ----------
+    path : str
+        The JSON Lines file.
+
+    Returns
+    -------
+    list of dict
+        The records.
+    """
+
+    import json
+
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    return sorted(records, key=lambda r: r["timestamp"])
+
+def time_calls(func, records: list[dict], repeat: int = 3) -> float:
+    """
+    Measures the mean latency of a prediction function.
+
+    Parameters
+    ----------
+    func : Callable
+        The function, called with one record.
+    records : list of dict
+        The records.
+    repeat : int, optional
+        The number of passes over the records (default is 3).
+
+    Returns
+    -------
+    float
+        The mean latency in microseconds.
+    """
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            func(record)
+
+    return (time.perf_counter() - start_time) / (repeat * len(records)) * 10**6
+
+def compare(
+        predictor: Predictor,
+        metric: str,
+        records: list[dict]
+    ) -> list[str]:
+    """
+    Compares both backends on one metric.
+
+    Parameters
+    ----------
+    predictor : Predictor
+        A predictor (no database connection is needed).
+    metric : str
+        The metric.
+    records : list of dict
+        The exported records of the metric.
+
+    Returns
+    -------
+    list of str
+        The report lines.
+    """
+
+    split = int(len(records) * 0.8)
+    train, test = records[:split], records[split:]
+    y_test = np.array([r["value"] for r in test], dtype=float)
+
+    pickle_path = os.path.join(Predictor.models_folder, f"{metric}.pickle")
+    start_time = time.perf_counter()
+    forest, forest_schema, _ = Predictor.read_artefact(
+        metric, extensions=("pickle",)
+    )
+    forest_load = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    schema = FeatureSchema.fit(train)
+    stumps = BoostedStumps().fit(
+        schema.encode_many(train),
+        [r["value"] for r in train]
+    )
+    stumps_fit = time.perf_counter() - start_time
+
+    def predict_with(model, schema):
+        def predict(record):
+            Predictor.models[metric] = model
+            Predictor.schemas[metric] = schema
+            return predictor.predict(metric=metric, data=record)
+        return predict
+
+    predict_forest = predict_with(forest, forest_schema)
+    predict_stumps = predict_with(
+        StumpEnsemble.from_models({"mean": stumps}),
+        schema
+    )
+
+    forest_mae = np.mean(np.abs([predict_forest(r) for r in test] - y_test))
+    stumps_mae = np.mean(np.abs([predict_stumps(r) for r in test] - y_test))
+    baseline_mae = np.mean(np.abs(np.mean([r["value"] for r in train]) - y_test))
+
+    sample = test[:200]
+    forest_latency = time_calls(predict_forest, sample)
+    stumps_latency = time_calls(predict_stumps, sample)
+
+    stumps_size = sum(a.nbytes for a in stumps.to_arrays().values())
+
+    return [
+        f"## {metric} ({len(train)} train / {len(test)} test records)",
+        f"{'':<22}{'MAE':>12}{'latency (us)':>15}{'size (kB)':>12}",
+        f"{'mean baseline':<22}{baseline_mae:>12.3f}",
+        f"{'random forest':<22}{forest_mae:>12.3f}{forest_latency:>15.1f}"
+        f"{os.path.getsize(pickle_path) / 1000:>12.1f}"
+        f"   (load {forest_load * 1000:.0f} ms)",
+        f"{'boosted stumps':<22}{stumps_mae:>12.3f}{stumps_latency:>15.1f}"
+        f"{stumps_size / 1000:>12.1f}   (fit {stumps_fit * 1000:.0f} ms)",
+        ""
+    ]
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("folder", help="Folder of the exported {metric}.jsonl files")
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="Export the metric tables to the folder instead of comparing"
+    )
+    args = parser.parse_args()
+
+    if args.export:
+        predictor = Predictor()
+        os.makedirs(args.folder, exist_ok=True)
+        for metric in metrics:
+            n = predictor.export_data(
+                metric=metric,
+                path=os.path.join(args.folder, f"{metric}.jsonl")
+            )
+            print(f"{metric}: {n} records exported")
+        sys.exit(0)
+
+    # The models are swapped in by hand, no database connection nor reload needed
+    predictor = Predictor.__new__(Predictor)
+    Predictor.reload_interval = float("inf")
+
+    lines = []
+    for metric in metrics:
+        # Only the metrics with a pickled random forest can be compared
+        if not os.path.exists(
+            os.path.join(Predictor.models_folder, f"{metric}.pickle")
+        ):
+            continue
+        records = load_records(os.path.join(args.folder, f"{metric}.jsonl"))
+        lines += compare(predictor, metric, records)
+
+    report = "\n".join(lines)
+    print(report)
+
+    path = os.path.join(os.path.dirname(__file__), "results", "predictor.txt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(report)
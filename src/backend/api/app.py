@@ -0,0 +1,581 @@
+"""
+A headless HTTP API over `DocuTalk` and `ChatBotService`.
+
+    uvicorn src.backend.api.app:app --workers 4
+
+Each worker holds one `DocuTalk`, created at startup: its MongoDB connection pool,
+Cloud Storage client, caches and background threads are shared by the requests the
+worker serves. The endpoints are synchronous and run in the worker's thread pool
+(`API_THREADS` threads, default is 40); answers are streamed as Server-Sent Events.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Generator, Iterator
+
+from anyio import to_thread
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, HTTPException, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel
+from src.backend.docu_talk.base import ChatBot
+from src.backend.docu_talk.docu_talk import DocuTalk
+from src.backend.docu_talk.exceptions import (
+    BadOutputFormatError,
+    ServerBusyError,
+    TooManyAttemptsError,
+    UnknownModelError,
+)
+from src.backend.docu_talk.warmup import is_warm, start_warm_up
+from src.backend.utils.auth import generate_token, verify_token
+from src.backend.utils.file_io import get_nb_pages_pdf
+from src.backend.utils.tracing import instrument
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# The limits and credits of the front-end apply to the API
+path = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, "frontend", "config.json"
+)
+with open(path) as f:
+    CONFIG = json.load(f)
+
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", CONFIG["models"]["basic"])
+
+
+class LoginRequest(BaseModel):
+    email: str
+    password: str
+
+class QuestionRequest(BaseModel):
+    message: str
+    model: str | None = None
+    document_ids: list[str] | None = None
+
+class SourcesRequest(BaseModel):
+    model: str | None = None
+    document_ids: list[str] | None = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the resources shared by the requests of a worker.
+    """
+
+    instrument()
+    start_warm_up()
+
+    to_thread.current_default_thread_limiter().total_tokens = int(
+        os.getenv("API_THREADS", "40")
+    )
+
+    app.state.docu_talk = DocuTalk()
+
+    yield
+
+    app.state.docu_talk.telemetry.flush()
+
+app = FastAPI(title="Docu Talk", lifespan=lifespan)
+
+bearer = HTTPBearer()
+
+def get_docu_talk(request: Request) -> DocuTalk:
+    """
+    Returns the `DocuTalk` of the worker.
+    """
+
+    return request.app.state.docu_talk
+
+def get_user_id(
+        credentials: HTTPAuthorizationCredentials = Depends(bearer)
+    ) -> str:
+    """
+    Authenticates a request by its bearer token (see `/auth/token`).
+
+    Returns
+    -------
+    str
+        The user's email.
+    """
+
+    user_id = verify_token(
+        token=credentials.credentials,
+        secret_key=os.getenv("TOKEN_SECRET_KEY")
+    )
+
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    return user_id
+
+def get_user_chatbot(
+        docu_talk: DocuTalk,
+        user_id: str,
+        chatbot_id: str
+    ) -> dict:
+    """
+    Retrieves a chatbot the user has access to.
+
+    Returns
+    -------
+    dict
+        The chatbot, with the role of the user ("user_role").
+
+    Raises
+    ------
+    HTTPException
+        404 if the chatbot does not exist or the user has no access to it.
+    """
+
+    chatbots = docu_talk.get_user_chatbots(user_id)
+
+    if chatbot_id not in chatbots:
+        raise HTTPException(status_code=404, detail="Chatbot not found")
+
+    return chatbots[chatbot_id]
+
+def check_credits(
+        docu_talk: DocuTalk,
+        user_id: str
+    ) -> None:
+    """
+    Checks that the user has credits left this week.
+
+    Raises
+    ------
+    HTTPException
+        402 if the weekly amount of the user is consumed.
+    """
+
+    user = docu_talk.db.get_data(table="Users", filter={"email": user_id})[0]
+
+    if docu_talk.get_consumed_price(user_id) >= user["period_dollar_amount"]:
+        raise HTTPException(status_code=402, detail="No credits left this week")
+
+def check_model(
+        docu_talk: DocuTalk,
+        model: str | None
+    ) -> str:
+    """
+    Checks that a model is priced.
+
+    Returns
+    -------
+    str
+        The model, `DEFAULT_MODEL` if None.
+
+    Raises
+    ------
+    HTTPException
+        400 if the model is not in the ServiceModels table.
+    """
+
+    model = model or DEFAULT_MODEL
+
+    try:
+        docu_talk.pricing.resolve(model)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    return model
+
+def get_total_pages(
+        chatbot: ChatBot,
+        document_ids: list[str] | None
+    ) -> tuple[int, int]:
+    """
+    Counts the selected documents of a chatbot and their pages.
+
+    Returns
+    -------
+    tuple of int
+        The number of documents and the total number of pages.
+    """
+
+    documents = [
+        document for document in chatbot.service.documents
+        if document_ids is None or document["id"] in document_ids
+    ]
+
+    return len(documents), sum(document["nb_pages"] for document in documents)
+
+def format_event(
+        event: str,
+        data: dict
+    ) -> str:
+    """
+    Formats a Server-Sent Event.
+
+    Parameters
+    ----------
+    event : str
+        The event type.
+    data : dict
+        The payload, sent as JSON.
+
+    Returns
+    -------
+    str
+        The event.
+    """
+
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def stream_events(events: Iterator[str]) -> StreamingResponse:
+    """
+    Streams events. As the status is already sent, an error while streaming is
+    reported by an "error" event.
+    """
+
+    def generate() -> Generator[str, None, None]:
+        try:
+            yield from events
+        except BadOutputFormatError as e:
+            yield format_event("error", {"detail": str(e)})
+        except Exception as e:
+            logger.exception(e)
+            yield format_event("error", {"detail": "Internal error"})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def store_usage(
+        docu_talk: DocuTalk,
+        user_id: str,
+        usages: dict
+    ) -> dict:
+    """
+    Stores the usages of a Gemini call.
+
+    Returns
+    -------
+    dict
+        The usages and their price.
+    """
+
+    price = docu_talk.store_usages(user_id, usages)
+
+    return {**usages, "price": price}
+
+@app.get("/health")
+def health() -> dict:
+    return {"status": "ok", "warm": is_warm()}
+
+@app.post("/auth/token")
+def login(
+        credentials: LoginRequest,
+        request: Request,
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> dict:
+    """
+    Exchanges an email and a password for a bearer token. The attempts are
+    throttled per email and client address (behind a proxy, run uvicorn with
+    `--proxy-headers`).
+    """
+
+    try:
+        logged_in = docu_talk.check_login(
+            email=credentials.email,
+            password=credentials.password,
+            ip_address=request.client.host if request.client else None
+        )
+    except TooManyAttemptsError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.message,
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        ) from e
+    except ServerBusyError as e:
+        raise HTTPException(status_code=503, detail=e.message) from e
+
+    if not logged_in:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    token = generate_token(
+        user_id=credentials.email,
+        secret_key=os.getenv("TOKEN_SECRET_KEY"),
+        expiration_hours=CONFIG["token_expiration_hours"]
+    )
+
+    return {"access_token": token, "token_type": "bearer"}
+
+@app.get("/chatbots")
+def list_chatbots(
+        user_id: str = Depends(get_user_id),
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> list[dict]:
+    """
+    Lists the chatbots of the user (icons are served by `/chatbots/{id}/icon`).
+    """
+
+    chatbots = docu_talk.get_user_chatbots(user_id)
+
+    return [
+        {
+            "id": chatbot_id,
+            "title": chatbot["title"],
+            "description": chatbot["description"],
+            "access": chatbot["access"],
+            "user_role": chatbot["user_role"]
+        }
+        for chatbot_id, chatbot in chatbots.items()
+    ]
+
+@app.get("/chatbots/{chatbot_id}")
+def get_chatbot(
+        chatbot_id: str,
+        user_id: str = Depends(get_user_id),
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> dict:
+    """
+    Describes a chatbot: its documents and suggested prompts.
+    """
+
+    chatbot = get_user_chatbot(docu_talk, user_id, chatbot_id)
+    descriptor = docu_talk.get_chatbot_descriptor(chatbot_id)
+
+    return {
+        "id": chatbot_id,
+        "version": descriptor.version,
+        "title": descriptor.title,
+        "description": descriptor.description,
+        "access": descriptor.access,
+        "user_role": chatbot["user_role"],
+        "icon_hash": descriptor.icon_hash,
+        "documents": [
+            {
+                "id": document["id"],
+                "filename": document["filename"],
+                "nb_pages": document["nb_pages"]
+            }
+            for document in descriptor.documents
+        ],
+        "suggested_prompts": [p["prompt"] for p in descriptor.suggested_prompts]
+    }
+
+@app.get("/chatbots/{chatbot_id}/icon")
+def get_chatbot_icon(
+        chatbot_id: str,
+        user_id: str = Depends(get_user_id),
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> Response:
+    """
+    Returns the icon of a chatbot (PNG), cacheable by its hash.
+    """
+
+    get_user_chatbot(docu_talk, user_id, chatbot_id)
+    descriptor = docu_talk.get_chatbot_descriptor(chatbot_id)
+
+    return Response(
+        content=descriptor.icon,
+        media_type="image/png",
+        headers={"ETag": f'"{descriptor.icon_hash}"'}
+    )
+
+@app.get("/chatbots/{chatbot_id}/conversation")
+def get_conversation(
+        chatbot_id: str,
+        user_id: str = Depends(get_user_id),
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> list[dict]:
+    """
+    Returns the current conversation of the user with a chatbot.
+    """
+
+    get_user_chatbot(docu_talk, user_id, chatbot_id)
+
+    return docu_talk.get_conversation(user_id=user_id, chatbot_id=chatbot_id)
+
+@app.delete("/chatbots/{chatbot_id}/conversation", status_code=204)
+def reset_conversation(
+        chatbot_id: str,
+        user_id: str = Depends(get_user_id),
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> None:
+    """
+    Starts a new conversation with a chatbot.
+    """
+
+    get_user_chatbot(docu_talk, user_id, chatbot_id)
+
+    docu_talk.start_chat(chatbot_id, user_id).service.reset_conversation()
+
+@app.post("/chatbots/{chatbot_id}/messages")
+def ask_chatbot(
+        chatbot_id: str,
+        question: QuestionRequest,
+        user_id: str = Depends(get_user_id),
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> StreamingResponse:
+    """
+    Asks a question, continuing the conversation of the user with the chatbot. The
+    answer is streamed as "token" events, followed by a "usage" event and a "done"
+    event.
+    """
+
+    get_user_chatbot(docu_talk, user_id, chatbot_id)
+    check_credits(docu_talk, user_id)
+    model = check_model(docu_talk, question.model)
+
+    # The conversation is restored from the Conversations table, so that any
+    # worker of any instance can continue it
+    chatbot = docu_talk.start_chat(chatbot_id, user_id)
+    nb_documents, total_pages = get_total_pages(chatbot, question.document_ids)
+
+    def events() -> Generator[str, None, None]:
+
+        start_time = time.perf_counter()
+
+        answer = chatbot.service.ask(
+            message=question.message,
+            model=model,
+            document_ids=question.document_ids
+        )
+        for part in answer:
+            yield format_event("token", {"text": part})
+
+        usages = store_usage(docu_talk, user_id, chatbot.service.last_usages)
+
+        docu_talk.predictor.log_ask_chatbot_metrics(
+            duration=time.perf_counter() - start_time,
+            token_count=usages["qty"],
+            nb_documents=nb_documents,
+            total_pages=total_pages,
+            model=model,
+            chatbot_id=chatbot_id,
+            ttft=chatbot.service.last_ttft
+        )
+
+        yield format_event("usage", usages)
+        yield format_event("done", {})
+
+    return stream_events(events())
+
+@app.post("/chatbots/{chatbot_id}/sources")
+def identify_sources(
+        chatbot_id: str,
+        request: SourcesRequest,
+        user_id: str = Depends(get_user_id),
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> StreamingResponse:
+    """
+    Identifies the sources of the last answer. Each source (filename, page,
+    citation and signed URL) is streamed as a "source" event as soon as it is
+    written, followed by a "usage" event and a "done" event.
+    """
+
+    get_user_chatbot(docu_talk, user_id, chatbot_id)
+    check_credits(docu_talk, user_id)
+    model = check_model(docu_talk, request.model)
+
+    chatbot = docu_talk.start_chat(chatbot_id, user_id)
+    if len(chatbot.service.messages) == 0:
+        raise HTTPException(status_code=409, detail="The conversation is empty")
+
+    nb_documents, total_pages = get_total_pages(chatbot, request.document_ids)
+
+    def events() -> Generator[str, None, None]:
+
+        start_time = time.perf_counter()
+
+        try:
+            sources = chatbot.service.stream_last_message_sources(
+                model=model,
+                document_ids=request.document_ids
+            )
+            for source in sources:
+                yield format_event("source", source)
+        finally:
+            # The tokens are consumed even if the output could not be parsed
+            usages = getattr(chatbot.service, "last_usages", None)
+            if usages is not None:
+                usages = store_usage(docu_talk, user_id, usages)
+
+        docu_talk.predictor.log_ask_chatbot_metrics(
+            duration=time.perf_counter() - start_time,
+            token_count=usages["qty"],
+            nb_documents=nb_documents,
+            total_pages=total_pages,
+            model=model,
+            chatbot_id=chatbot_id
+        )
+
+        yield format_event("usage", usages)
+        yield format_event("done", {})
+
+    return stream_events(events())
+
+@app.post("/chatbots/{chatbot_id}/documents", status_code=201)
+def upload_documents(
+        chatbot_id: str,
+        files: list[UploadFile],
+        user_id: str = Depends(get_user_id),
+        docu_talk: DocuTalk = Depends(get_docu_talk)
+    ) -> list[dict]:
+    """
+    Adds PDF documents to a chatbot the user administers, within the limits of the
+    front-end (number of documents and pages per chatbot).
+    """
+
+    chatbot = get_user_chatbot(docu_talk, user_id, chatbot_id)
+    if chatbot["user_role"] != "Admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+
+    documents = []
+    for file in files:
+
+        pdf_bytes = file.file.read()
+        try:
+            nb_pages = get_nb_pages_pdf(pdf_bytes)
+        except Exception as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{file.filename} is not a valid PDF"
+            ) from e
+
+        documents.append(
+            {"filename": file.filename, "bytes": pdf_bytes, "nb_pages": nb_pages}
+        )
+
+    descriptor = docu_talk.get_chatbot_descriptor(chatbot_id)
+    limits = CONFIG["limits"]
+
+    nb_documents = len(descriptor.documents) + len(documents)
+    if nb_documents > limits["max_nb_doc_per_chatbot"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A chatbot has at most {limits['max_nb_doc_per_chatbot']} "
+            "documents"
+        )
+
+    total_pages = sum(d["nb_pages"] for d in descriptor.documents + tuple(documents))
+    if total_pages > limits["max_nb_pages_per_chatbot"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A chatbot has at most {limits['max_nb_pages_per_chatbot']} "
+            "pages"
+        )
+
+    for document in documents:
+        docu_talk.add_document(
+            chatbot_id=chatbot_id,
+            created_by=user_id,
+            filename=document["filename"],
+            pdf_bytes=document["bytes"],
+            nb_pages=document["nb_pages"]
+        )
+
+    return [
+        {"filename": document["filename"], "nb_pages": document["nb_pages"]}
+        for document in documents
+    ]
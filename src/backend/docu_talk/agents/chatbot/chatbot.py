@@ -1,38 +1,257 @@
+import itertools
 import json
 import logging
 import os
-from typing import Generator, Tuple
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import cache
+from typing import (
+    Any,
+    Callable,
+    Generator,
+    Iterator,
+    Literal,
+    Tuple,
+    get_args,
+    get_origin,
+)
 
+from google.api_core.exceptions import GoogleAPICallError, InvalidArgument
+from pydantic import ValidationError
 from src.backend.docu_talk.agents.chatbot.generator import Gemini
+from src.backend.docu_talk.agents.chatbot.icon_index import (
+    get_icon_color,
+    get_icon_index,
+)
 from src.backend.docu_talk.agents.chatbot.icons import get_icon_bytes
 from src.backend.docu_talk.agents.storage import GoogleCloudStorageManager
 from src.backend.docu_talk.exceptions import BadOutputFormatError
-from src.backend.utils.file_io import recursive_read
-from src.backend.utils.parsing import extract_dict, extract_list, extract_list_of_dicts
+from src.backend.utils.file_io import (
+    append_record,
+    read_records,
+    recursive_read,
+    write_records,
+)
+from src.backend.utils.parsing import (
+    UnfoundPatternError,
+    extract_model,
+    extract_models,
+    iter_streamed_dicts,
+)
+from src.backend.utils.tracing import tracer
 
 from .validation import Desc, Icon, Source, SuggestedPrompts
 
 logger = logging.getLogger(__name__)
 
-path = os.path.join(os.path.dirname(__file__), "src", "icons.json")
-with open(path) as f:
-    ICONS = json.load(f)
+# The fields of the exports of `ChatBotService.ask_batch`
+BATCH_FIELDS = [
+    "index",
+    "question",
+    "answer",
+    "model",
+    "input_tokens",
+    "cached_tokens",
+    "output_tokens"
+]
+
+@cache
+def get_icons() -> dict[str, str]:
+    """
+    Loads the Material icons (name to code point), on first use.
 
-PROMPTS = recursive_read(
-    os.path.join(os.path.dirname(__file__), "src", "prompts"),
-    extensions=(".txt")
-)
+    Returns
+    -------
+    dict
+        The icon code points keyed by icon name.
+    """
+
+    path = os.path.join(os.path.dirname(__file__), "src", "icons.json")
+    with open(path) as f:
+        icons = json.load(f)
+
+    return icons
+
+@cache
+def get_prompts() -> dict[str, str]:
+    """
+    Loads the prompt templates, on first use.
+
+    Returns
+    -------
+    dict
+        The prompts keyed by file name.
+    """
+
+    prompts = recursive_read(
+        os.path.join(os.path.dirname(__file__), "src", "prompts"),
+        extensions=(".txt")
+    )
+
+    return prompts
+
+def record_parse(
+        call: str,
+        outcome: Literal["native", "fallback", "failed"]
+    ) -> None:
+    """
+    Counts how the output of a structured call was parsed: by the response schema
+    ("native"), by the fallback parser ("fallback"), or not at all ("failed").
+
+    Parameters
+    ----------
+    call : str
+        The call type (e.g. "title_description").
+    outcome : Literal
+        The outcome.
+    """
+
+    with parse_stats_lock:
+        counts = parse_stats.setdefault(
+            call, {"native": 0, "fallback": 0, "failed": 0}
+        )
+        counts[outcome] += 1
+
+    span = tracer.current_span.get()
+    if span is not None:
+        span.set_attribute("llm.parse", outcome)
+
+    if outcome != "native":
+        stats = get_parse_stats()[call]
+        logger.warning(
+            f"`{call}` output parsed by: {outcome} (failure rate "
+            f"{stats['failure_rate']:.1%}, fallback rate {stats['fallback_rate']:.1%} "
+            f"over {stats['calls']} calls)"
+        )
+
+def get_parse_stats() -> dict[str, dict[str, float]]:
+    """
+    Returns the parsing outcomes of the structured calls of the process.
+
+    Returns
+    -------
+    dict
+        Per call type, the counts of each outcome, the number of calls, the failure
+        rate (outputs that could not be parsed) and the fallback rate (outputs that
+        did not match the response schema).
+    """
+
+    with parse_stats_lock:
+        stats = {call: dict(counts) for call, counts in parse_stats.items()}
+
+    for counts in stats.values():
+        counts["calls"] = sum(counts.values())
+        counts["failure_rate"] = counts["failed"] / counts["calls"]
+        counts["fallback_rate"] = (
+            (counts["fallback"] + counts["failed"]) / counts["calls"]
+        )
+
+    return stats
+
+def resume_batch(
+        questions: list[str],
+        export_path: str
+    ) -> dict[int, dict]:
+    """
+    Reads the answers of a batch already exported (same position and text), and
+    rewrites the export with them only.
+
+    Parameters
+    ----------
+    questions : list of str
+        The questions of the batch.
+    export_path : str
+        The JSON Lines or CSV file of the answers.
+
+    Returns
+    -------
+    dict
+        The results of the answered questions, keyed by index, without usages.
+    """
+
+    records = [
+        record for record in read_records(export_path)
+        if 0 <= int(record["index"]) < len(questions)
+        and questions[int(record["index"])] == record["question"]
+    ]
+
+    # Drops the record cut by an interrupted run before appending
+    write_records(export_path, records, BATCH_FIELDS)
+
+    return {
+        int(record["index"]): {
+            "index": int(record["index"]),
+            "question": record["question"],
+            "answer": record["answer"],
+            "usages": None
+        }
+        for record in records
+    }
+
+def collect_answer(
+        future: Future,
+        index: int,
+        question: str,
+        export_path: str | None = None
+    ) -> dict:
+    """
+    Returns the result of a question of a batch, appended to the export when it
+    was answered.
+
+    Parameters
+    ----------
+    future : Future
+        The answer of the question.
+    index : int
+        The position of the question.
+    question : str
+        The question.
+    export_path : str or None, optional
+        The JSON Lines or CSV file of the answers (default is None, no export).
+
+    Returns
+    -------
+    dict
+        The result: "index", "question", and either "answer" and "usages" or
+        "error".
+    """
+
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.warning(f"Question {index} of the batch failed: {e}")
+        return {"index": index, "question": question, "error": str(e)}
+
+    if export_path is not None:
+        append_record(export_path, {**result, **result["usages"]}, BATCH_FIELDS)
+
+    return result
+
+parse_stats: dict[str, dict[str, int]] = {}
+parse_stats_lock = threading.Lock()
 
 class ChatBotService:
     """
     A service class for managing chatbot interactions, including generating titles,
     icons, suggested prompts, and handling user queries.
+
+    Structured outputs are requested with a response schema (JSON mode), unless
+    `STRUCTURED_OUTPUT` is "false" or the model rejects it, in which case they are
+    extracted from the free text answer.
     """
 
+    structured_output = os.getenv("STRUCTURED_OUTPUT", "true").lower() != "false"
+
+    # The models that rejected a response schema
+    models_without_schema: set[str] = set()
+
     def __init__(
             self,
             documents: list,
-            storage_manager: GoogleCloudStorageManager
+            storage_manager: GoogleCloudStorageManager,
+            load_messages: Callable[[], list[dict]] | None = None,
+            on_message: Callable[[str, str], None] | None = None
         ) -> None:
         """
         Initializes the ChatBotService with documents and a storage manager.
@@ -43,18 +262,35 @@ class ChatBotService:
             A list of documents to associate with the chatbot.
         storage_manager : GoogleCloudStorageManager
             The storage manager for handling file storage operations.
+        load_messages : Callable or None, optional
+            Returns the messages of a previous conversation, called on the first
+            access to `messages` (default is None, the conversation starts empty).
+        on_message : Callable or None, optional
+            Called with the role and content of each new message, and with the
+            "reset" role when the conversation is reset (default is None).
         """
 
         self.documents = documents
 
-        self.gemini = Gemini(
+        # `LLM_BACKEND=fake` answers without Vertex AI, e.g. for load tests
+        if os.getenv("LLM_BACKEND", "gemini") == "fake":
+            from src.backend.docu_talk.agents.chatbot.fake import FakeGemini
+            llm_class = FakeGemini
+        else:
+            llm_class = Gemini
+
+        self.gemini = llm_class(
             project_id=os.getenv("GCP_PROJECT_ID"),
             location=os.getenv("GCP_LOCATION")
         )
 
         self.storage_manager = storage_manager
 
-        self.messages = []
+        self.load_messages = load_messages
+        self.on_message = on_message
+        self._messages: list[dict] | None = None
+
+        self.last_ttft: float | None = None
 
     def get_documents_contents(
             self,
@@ -90,6 +326,45 @@ class ChatBotService:
 
         return documents_contents
 
+    @property
+    def messages(self) -> list[dict]:
+        """
+        The messages of the conversation, restored with `load_messages` on first
+        access.
+        """
+
+        if self._messages is None:
+            self._messages = (
+                self.load_messages() if self.load_messages is not None else []
+            )
+
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages: list[dict]) -> None:
+        self._messages = messages
+
+    def add_message(
+            self,
+            role: Literal["user", "assistant"],
+            content: str
+        ) -> None:
+        """
+        Appends a message to the conversation and hands it to `on_message`.
+
+        Parameters
+        ----------
+        role : Literal
+            The author of the message.
+        content : str
+            The message.
+        """
+
+        self.messages.append({"role": role, "content": content})
+
+        if self.on_message is not None:
+            self.on_message(role, content)
+
     def reset_conversation(self) -> None:
         """
         Resets the conversation history of the chatbot.
@@ -97,17 +372,25 @@ class ChatBotService:
 
         self.messages = []
 
+        if self.on_message is not None:
+            self.on_message("reset", "")
+
     def return_streamed_response(
             self,
-            stream: Generator
+            stream: Generator,
+            start_time: float | None = None
         ) -> Generator:
         """
-        Handles streaming responses from the generative model.
+        Handles streaming responses from the generative model. The time to the
+        first part is stored in `last_ttft`.
 
         Parameters
         ----------
         stream : Generator
             A generator yielding parts of the response.
+        start_time : float or None, optional
+            The `time.perf_counter()` value when the query was sent (default is
+            None, the time to the first part is not measured).
 
         Yields
         ------
@@ -119,17 +402,108 @@ class ChatBotService:
         for part in stream:
 
             if isinstance(part, str):
+                if start_time is not None and answer == "":
+                    self.last_ttft = time.perf_counter() - start_time
                 answer += part
                 yield part
             else:
                 self.last_usages = part
 
-        self.messages.append(
-            {
-                "role": "assistant",
-                "content": answer
-            }
-        )
+        self.add_message(role="assistant", content=answer)
+
+    def supports_response_schema(self, model: str) -> bool:
+        """
+        Whether to request the structured outputs of a model with a response schema.
+
+        Parameters
+        ----------
+        model : str
+            The model.
+
+        Returns
+        -------
+        bool
+            False if structured outputs are disabled or the model rejected a schema.
+        """
+
+        return self.structured_output and model not in self.models_without_schema
+
+    def get_structured_answer(
+            self,
+            call: str,
+            messages: list,
+            model: str,
+            response_schema: Any
+        ) -> Any:
+        """
+        Asks for a structured output and parses it. The response schema is sent when
+        the backend supports it, and the free text parser is used as a fallback.
+
+        Parameters
+        ----------
+        call : str
+            The call type, used for the parsing statistics (see `get_parse_stats`).
+        messages : list
+            The messages.
+        model : str
+            The model to use.
+        response_schema : Any
+            A model of `validation.py`, or a list of them.
+
+        Returns
+        -------
+        Any
+            The parsed output.
+
+        Raises
+        ------
+        BadOutputFormatError
+            If the output cannot be parsed.
+        """
+
+        response = None
+        if self.supports_response_schema(model):
+            try:
+                response = self.gemini.get_answer(
+                    messages=messages,
+                    stream=False,
+                    model=model,
+                    temperature=0,
+                    response_schema=response_schema
+                )
+            except InvalidArgument as e:
+                logger.warning(f"`{model}` rejected the response schema: {e}")
+                ChatBotService.models_without_schema.add(model)
+
+        if response is None:
+            response = self.gemini.get_answer(
+                messages=messages,
+                stream=False,
+                model=model,
+                temperature=0
+            )
+
+        self.last_usages = response["usages"]
+
+        if response.get("parsed") is not None:
+            record_parse(call, "native")
+            return response["parsed"]
+
+        try:
+            if get_origin(response_schema) is list:
+                item_model = get_args(response_schema)[0]
+                parsed, invalid = extract_models(response["answer"], item_model)
+                for d in invalid:
+                    logger.warning(f"Failed to process extracted {call}: {d}")
+            else:
+                parsed = extract_model(response["answer"], response_schema)
+        except UnfoundPatternError as e:
+            record_parse(call, "failed")
+            raise BadOutputFormatError("Bad LLM output format") from e
+
+        record_parse(call, "fallback")
+
+        return parsed
 
     def generate_title_description(
             self,
@@ -150,39 +524,45 @@ class ChatBotService:
         """
 
         messages = self.get_documents_contents()
-        messages.append({"role": "user", "parts": [PROMPTS["title_description"]]})
+        messages.append(
+            {"role": "user", "parts": [get_prompts()["title_description"]]}
+        )
 
-        response = self.gemini.get_answer(
+        desc = self.get_structured_answer(
+            call="title_description",
             messages=messages,
-            stream=False,
             model=model,
-            temperature=0
+            response_schema=Desc
         )
 
-        self.last_usages = response["usages"]
-
-        try:
-            desc = extract_dict(response["answer"])
-            Desc(**desc)
-        except Exception as e:
-            raise BadOutputFormatError("Bad LLM output format") from e
-
-        return desc["title"], desc["description"]
+        return desc.title, desc.description
 
     def generate_icon(
             self,
             description: str,
             model: str = "gemini-1.5-flash-002",
+            mode: Literal["shortlist", "full", "local"] | None = None,
+            nb_candidates: int = 30
         ) -> bytes:
         """
         Generates an icon for the chatbot based on its description.
 
+        The candidate icons are shortlisted locally from the description (see
+        `IconIndex`) and only their names are sent to the LLM. In "local" mode, the
+        best candidate is used without calling the LLM (`last_usages` is then None),
+        and in "full" mode all of the icon names are sent.
+
         Parameters
         ----------
         description : str
             The chatbot's description.
         model : str, optional
             The model to use for icon generation (default is "gemini-1.5-flash-002").
+        mode : Literal or None, optional
+            "shortlist", "full" or "local" (default is the `ICON_SELECTION_MODE`
+            environment variable, or "shortlist").
+        nb_candidates : int, optional
+            The number of shortlisted icons (default is 30).
 
         Returns
         -------
@@ -190,30 +570,46 @@ class ChatBotService:
             The generated icon in binary format.
         """
 
-        prompt = PROMPTS["icon"].format(
-            icons=list(ICONS.keys()),
-            chatbot_description=description
-        )
+        mode = mode or os.getenv("ICON_SELECTION_MODE", "shortlist")
 
-        response = self.gemini.get_answer(
-            messages=[{"role": "user", "parts": [prompt]}],
-            stream=False,
-            model=model,
-            temperature=0
-        )
+        icon_index = get_icon_index()
 
-        self.last_usages = response["usages"]
+        if mode == "local":
+
+            self.last_usages = None
+
+            return get_icon_bytes(
+                icon_id=get_icons()[icon_index.best(description)],
+                color=get_icon_color(description)
+            )
+
+        if mode == "full":
+            candidates = list(get_icons().keys())
+        else:
+            candidates = icon_index.shortlist(description, k=nb_candidates)
+
+        prompt = get_prompts()["icon"].format(
+            icons=candidates,
+            chatbot_description=description
+        )
 
         try:
-            icon = extract_dict(response["answer"])
-            Icon(**icon)
-            icon_id = ICONS.get(icon["name"], "f06c")
-        except Exception:
-            icon_id = "f06c"
+            icon = self.get_structured_answer(
+                call="icon",
+                messages=[{"role": "user", "parts": [prompt]}],
+                model=model,
+                response_schema=Icon
+            )
+            name, color = icon.name, icon.color
+        except BadOutputFormatError:
+            name, color = candidates[0], get_icon_color(description)
+
+        if name not in get_icons():
+            name = candidates[0]
 
         icon_bytes = get_icon_bytes(
-            icon_id=icon_id,
-            color=icon["color"]
+            icon_id=get_icons()[name],
+            color=color
         )
 
         return icon_bytes
@@ -237,24 +633,18 @@ class ChatBotService:
         """
 
         messages = self.get_documents_contents()
-        messages.append({"role": "user", "parts": [PROMPTS["suggested_prompts"]]})
+        messages.append(
+            {"role": "user", "parts": [get_prompts()["suggested_prompts"]]}
+        )
 
-        response = self.gemini.get_answer(
+        suggested_prompts = self.get_structured_answer(
+            call="suggested_prompts",
             messages=messages,
-            stream=False,
             model=model,
-            temperature=0
+            response_schema=SuggestedPrompts
         )
 
-        self.last_usages = response["usages"]
-
-        try:
-            suggested_prompts = extract_list(response["answer"])
-            SuggestedPrompts(items=suggested_prompts)
-        except Exception as e:
-            raise BadOutputFormatError("Bad LLM output format") from e
-
-        return suggested_prompts
+        return suggested_prompts.items
 
     def ask(
             self,
@@ -280,12 +670,10 @@ class ChatBotService:
             A generator yielding parts of the response.
         """
 
-        self.messages.append(
-            {
-                "role": "user",
-                "content": message
-            }
-        )
+        start_time = time.perf_counter()
+        self.last_ttft = None
+
+        self.add_message(role="user", content=message)
 
         messages = self.get_documents_contents(document_ids=document_ids)
         messages.extend(
@@ -296,10 +684,219 @@ class ChatBotService:
             messages=messages,
             stream=True,
             model=model,
-            context=PROMPTS["context_ask"]
+            context=get_prompts()["context_ask"]
+        )
+
+        return self.return_streamed_response(response, start_time=start_time)
+
+    def ask_batch(
+            self,
+            questions: list[str],
+            model: str = "gemini-1.5-flash-002",
+            document_ids: list | None = None,
+            concurrency: int = 4,
+            export_path: str | None = None,
+            on_answer: Callable[[dict], None] | None = None
+        ) -> list[dict]:
+        """
+        Answers independent questions on the documents (e.g. a questionnaire),
+        outside of the conversation. The questions are sent concurrently, at the
+        pace of the rate limiter (see `get_rate_limiter`), after the documents and
+        the instructions are cached once on Vertex AI (`create_cached_context`);
+        when they cannot be cached (e.g. below the minimum size of a cache), they
+        are sent with each question.
+
+        Each answer is appended to the export as soon as it is received. With an
+        existing export, the batch is resumed: the questions already answered (same
+        position and text) are not asked again. Failed questions are not exported,
+        so that they are asked again on the next run.
+
+        Parameters
+        ----------
+        questions : list of str
+            The questions.
+        model : str, optional
+            The model to use (default is "gemini-1.5-flash-002").
+        document_ids : list or None, optional
+            A list of document IDs to include in the context (default is None).
+        concurrency : int, optional
+            The maximum number of questions in flight (default is 4).
+        export_path : str or None, optional
+            A JSON Lines or CSV file (by its extension) the answers are appended to
+            (default is None, no export).
+        on_answer : Callable or None, optional
+            Called with each new result, e.g. to store its usages (default is None).
+
+        Returns
+        -------
+        list of dict
+            The result of each question, in order: "index", "question", and either
+            "answer" and "usages" (None for resumed answers) or "error".
+        """
+
+        results: dict[int, dict] = {}
+        if export_path is not None:
+            results = resume_batch(questions, export_path)
+
+        pending = [i for i in range(len(questions)) if i not in results]
+        if len(pending) == 0:
+            return [results[i] for i in range(len(questions))]
+
+        context = get_prompts()["context_ask"]
+        cached_context = self.create_batch_context(model, context, document_ids)
+
+        def answer(index: int) -> dict:
+
+            messages = [{"role": "user", "parts": [questions[index]]}]
+            if cached_context is None:
+                messages = self.get_documents_contents(document_ids) + messages
+
+            response = self.gemini.get_answer(
+                messages=messages,
+                model=model,
+                context=context if cached_context is None else None,
+                cached_context=cached_context,
+                wait_for_quota=True
+            )
+
+            return {
+                "index": index,
+                "question": questions[index],
+                "answer": response["answer"],
+                "usages": response["usages"]
+            }
+
+        try:
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+                futures = {executor.submit(answer, i): i for i in pending}
+
+                for future in as_completed(futures):
+
+                    index = futures[future]
+                    result = collect_answer(
+                        future,
+                        index,
+                        questions[index],
+                        export_path
+                    )
+                    results[index] = result
+
+                    if on_answer is not None:
+                        on_answer(result)
+
+        finally:
+            if cached_context is not None:
+                self.delete_batch_context(cached_context)
+
+        return [results[i] for i in range(len(questions))]
+
+    def create_batch_context(
+            self,
+            model: str,
+            context: str,
+            document_ids: list | None = None
+        ) -> str | None:
+        """
+        Caches the documents and the instructions of a batch on Vertex AI.
+
+        Parameters
+        ----------
+        model : str
+            The model to use.
+        context : str
+            The instructions.
+        document_ids : list or None, optional
+            A list of document IDs to include in the context (default is None).
+
+        Returns
+        -------
+        str or None
+            The name of the cached context, or None if it cannot be cached.
+        """
+
+        try:
+            return self.gemini.create_cached_context(
+                messages=self.get_documents_contents(document_ids=document_ids),
+                model=model,
+                context=context
+            )
+        except GoogleAPICallError as e:
+            logger.info(f"Documents not cached, sent with each question: {e}")
+            return None
+
+    def delete_batch_context(self, cached_context: str) -> None:
+        """
+        Deletes the cached context of a batch, logging a failure.
+        """
+
+        try:
+            self.gemini.delete_cached_context(cached_context)
+        except GoogleAPICallError as e:
+            logger.warning(f"Failed to delete the cached context: {e}")
+
+    def get_sources_messages(
+            self,
+            document_ids: list | None = None
+        ) -> list[dict]:
+        """
+        Builds the messages asking for the sources of the last message.
+
+        Parameters
+        ----------
+        document_ids : list or None, optional
+            A list of document IDs to include in the context (default is None).
+
+        Returns
+        -------
+        list of dict
+            The messages.
+        """
+
+        messages = self.get_documents_contents(document_ids=document_ids)
+        messages.extend(
+            [{"role": m["role"], "parts": [m["content"]]} for m in self.messages]
+        )
+        messages.append(
+            {"role": "user", "parts": [get_prompts()["source_identification"]]}
+        )
+
+        return messages
+
+    def get_source(self, source: Source) -> dict | None:
+        """
+        Links an extracted source to its document, with a signed URL to its page.
+
+        Parameters
+        ----------
+        source : Source
+            The extracted source.
+
+        Returns
+        -------
+        dict or None
+            The source with its URL, or None if its file is not a document of the
+            chatbot.
+        """
+
+        uri = next(
+            (
+                document["uri"]
+                for document in self.documents
+                if document["filename"] == source.filename
+            ),
+            None
         )
+        if uri is None:
+            return None
+
+        signed_url = self.storage_manager.generate_signed_url(uri)
 
-        return self.return_streamed_response(response)
+        extracted_source = source.model_dump()
+        extracted_source["url"] = f"{signed_url}#page={source.page}"
+
+        return extracted_source
 
     def get_last_message_sources(
             self,
@@ -322,50 +919,121 @@ class ChatBotService:
             A list of source dictionaries containing file metadata and signed URLs.
         """
 
-        messages = self.get_documents_contents(document_ids=document_ids)
-        messages.extend(
-            [{"role": m["role"], "parts": [m["content"]]} for m in self.messages]
+        extracted_sources = self.get_structured_answer(
+            call="sources",
+            messages=self.get_sources_messages(document_ids=document_ids),
+            model=model,
+            response_schema=list[Source]
         )
-        messages.append({"role": "user", "parts": [PROMPTS["source_identification"]]})
 
-        response = self.gemini.get_answer(
+        sources = []
+        for extracted_source in extracted_sources:
+
+            source = self.get_source(extracted_source)
+            if source is not None:
+                sources.append(source)
+
+        return sources
+
+    def open_sources_stream(
+            self,
+            messages: list,
+            model: str
+        ) -> Tuple[Iterator, bool]:
+        """
+        Sends the request of `stream_last_message_sources`, with the response
+        schema if the model supports it, or else without it.
+
+        Parameters
+        ----------
+        messages : list
+            The messages asking for the sources.
+        model : str
+            The model to use for source identification.
+
+        Returns
+        -------
+        tuple of Iterator and bool
+            The streamed response, and whether it follows the response schema.
+        """
+
+        if self.supports_response_schema(model):
+            stream = self.gemini.get_answer(
+                messages=messages,
+                stream=True,
+                model=model,
+                temperature=0,
+                response_schema=list[Source]
+            )
+            try:
+                # The request is sent on the first iteration
+                return itertools.chain([next(stream)], stream), True
+            except InvalidArgument as e:
+                logger.warning(f"`{model}` rejected the response schema: {e}")
+                ChatBotService.models_without_schema.add(model)
+
+        stream = self.gemini.get_answer(
             messages=messages,
-            stream=False,
+            stream=True,
             model=model,
             temperature=0
         )
 
-        self.last_usages = response["usages"]
+        return stream, False
 
-        try:
-            extracted_sources = extract_list_of_dicts(response["answer"])
-        except Exception as e:
-            raise BadOutputFormatError("Bad LLM output format") from e
+    def stream_last_message_sources(
+            self,
+            model: str = "gemini-1.5-flash-002",
+            document_ids: list | None = None
+        ) -> Generator[dict, None, None]:
+        """
+        Streams the sources for the last message in the conversation: each source
+        is validated, linked to its document and yielded as soon as the model has
+        written it. The usages are stored in `last_usages` at the end. As in
+        `get_structured_answer`, a model that rejects the response schema is asked
+        again without it, and the parsing outcome is counted once streamed.
 
-        filenames = [document["filename"] for document in self.documents]
-        sources = []
-        for extracted_source in extracted_sources:
+        Parameters
+        ----------
+        model : str, optional
+            The model to use for source identification.
+        document_ids : list or None, optional
+            A list of document IDs to include in the context (default is None).
+
+        Yields
+        ------
+        dict
+            The sources, with file metadata and signed URLs.
+        """
+
+        stream, native = self.open_sources_stream(
+            messages=self.get_sources_messages(document_ids=document_ids),
+            model=model
+        )
+
+        def get_chunks() -> Generator[str, None, None]:
+            for part in stream:
+                if isinstance(part, str):
+                    yield part
+                else:
+                    self.last_usages = part
 
+        nb_extracted = 0
+        for extracted_source in iter_streamed_dicts(get_chunks()):
+
+            nb_extracted += 1
             try:
-                Source(**extracted_source)
-            except Exception as e:
+                source = self.get_source(Source(**extracted_source))
+            except ValidationError:
                 logger.warning(
-                    f"Failed to process extracted source: {extracted_source}. "
-                    f"Error: {e}"
+                    f"Failed to process extracted source: {extracted_source}"
                 )
                 continue
 
-            if extracted_source["filename"] not in filenames:
-                continue
-
-            uri = next(
-                document["uri"]
-                for document in self.documents
-                if document["filename"] == extracted_source["filename"]
-            )
-            signed_url = self.storage_manager.generate_signed_url(uri)
-            extracted_source["url"] = f"{signed_url}#page={extracted_source['page']}"
-
-            sources.append(extracted_source)
+            if source is not None:
+                yield source
 
-        return sources
+        if native:
+            record_parse("sources", "native")
+        else:
+            record_parse("sources", "fallback" if nb_extracted else "failed")
@@ -0,0 +1,307 @@
+import json
+import os
+import time
+from typing import Any, Generator
+from uuid import uuid4
+
+from pydantic import TypeAdapter, ValidationError
+from src.backend.docu_talk.agents.chatbot.generator import get_response_schema
+from src.backend.docu_talk.agents.chatbot.scheduler import get_rate_limiter
+
+WORDS = (
+    "the document states that the contract covers the services described in "
+    "section two and that the parties agree on the terms of payment delivery and "
+    "termination as detailed in the annex"
+).split()
+
+
+class FakeGemini:
+    """
+    A stand-in for `Gemini` that answers without calling Vertex AI, for load tests
+    and local development (`LLM_BACKEND=fake`). Answers are deterministic words,
+    streamed at a configurable pace, and structured outputs follow the response
+    schema.
+
+    The pace is set by `FAKE_LLM_TTFT` (seconds before the first part, default is
+    0.5), `FAKE_LLM_TOKENS_PER_SECOND` (default is 100) and `FAKE_LLM_NB_TOKENS`
+    (tokens per answer, default is 200). Each document is counted as
+    `FAKE_LLM_DOCUMENT_TOKENS` input tokens (default is 10000).
+    """
+
+    def __init__(
+            self,
+            project_id: str | None = None,
+            location: str | None = None
+        ) -> None:
+        """
+        Reads the pace of the answers. The arguments of `Gemini` are ignored.
+
+        Parameters
+        ----------
+        project_id : str or None, optional
+            Ignored.
+        location : str or None, optional
+            Ignored.
+        """
+
+        self.ttft = float(os.getenv("FAKE_LLM_TTFT", "0.5"))
+        self.tokens_per_second = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "100"))
+        self.nb_tokens = int(os.getenv("FAKE_LLM_NB_TOKENS", "200"))
+        self.document_tokens = int(os.getenv("FAKE_LLM_DOCUMENT_TOKENS", "10000"))
+
+        # The token count of each cached context
+        self.cached_contexts: dict[str, int] = {}
+
+    def count_tokens(self, messages: list) -> int:
+        """
+        Estimates the token count of messages.
+
+        Parameters
+        ----------
+        messages : list
+            The messages.
+
+        Returns
+        -------
+        int
+            The token count.
+        """
+
+        nb_tokens = 0
+        for message in messages:
+            for part in message["parts"]:
+                if part.startswith("gs://"):
+                    nb_tokens += self.document_tokens
+                else:
+                    nb_tokens += len(part) // 4 + 1
+
+        return nb_tokens
+
+    def get_usages(
+            self,
+            model: str,
+            messages: list,
+            nb_output_tokens: int,
+            cached_context: str | None = None
+        ) -> dict[str, str | int]:
+        """
+        Counts the tokens of a fake answer, as `generator.get_usages` does.
+
+        Parameters
+        ----------
+        model : str
+            The model.
+        messages : list
+            The messages.
+        nb_output_tokens : int
+            The number of generated tokens.
+        cached_context : str or None, optional
+            The cached context that preceded the messages (default is None).
+
+        Returns
+        -------
+        dict
+            The usages.
+        """
+
+        nb_cached_tokens = self.cached_contexts.get(cached_context, 0)
+        nb_input_tokens = self.count_tokens(messages) + nb_cached_tokens
+
+        usages = {
+            "model": model,
+            "unit": "tokens",
+            "qty": nb_input_tokens + nb_output_tokens,
+            "input_tokens": nb_input_tokens,
+            "cached_tokens": nb_cached_tokens,
+            "output_tokens": nb_output_tokens
+        }
+
+        return usages
+
+    def get_example(self, schema: dict) -> Any:
+        """
+        Builds a value that matches a response schema.
+
+        Parameters
+        ----------
+        schema : dict
+            The schema (see `get_response_schema`).
+
+        Returns
+        -------
+        Any
+            The value.
+        """
+
+        if "enum" in schema:
+            return schema["enum"][0]
+
+        schema_type = schema.get("type")
+        if schema_type == "object":
+            return {
+                name: self.get_example(property_schema)
+                for name, property_schema in schema.get("properties", {}).items()
+            }
+        if schema_type == "array":
+            return [self.get_example(schema.get("items", {}))]
+        if schema_type == "integer":
+            return 1
+        if schema_type == "number":
+            return 1.0
+        if schema_type == "boolean":
+            return True
+
+        return " ".join(WORDS[:8])
+
+    def get_answer(
+            self,
+            messages: list,
+            model: str = "gemini-1.5-pro-002",
+            stream: bool = False,
+            context: str | None = None,
+            response_schema: Any | None = None,
+            cached_context: str | None = None,
+            wait_for_quota: bool = False,
+            **kwargs
+        ):
+        """
+        Returns a fake response, in the formats of `Gemini.get_answer`. Requests go
+        through the rate limiter, as Gemini's do.
+
+        Parameters
+        ----------
+        messages : list
+            The messages.
+        model : str, optional
+            The model, reported in the usages (default is "gemini-1.5-pro-002").
+        stream : bool, optional
+            Whether to stream the response (default is False).
+        context : str or None, optional
+            Ignored.
+        response_schema : Any or None, optional
+            The type of the expected response (default is None, free text).
+        cached_context : str or None, optional
+            The name of a cached context (see `create_cached_context`), counted as
+            cached input tokens (default is None).
+        wait_for_quota : bool, optional
+            Whether to wait for the rate limiter (default is False).
+
+        Returns
+        -------
+        Generator or dict
+            A streamed response or a complete response depending on the mode.
+        """
+
+        if wait_for_quota:
+            get_rate_limiter().acquire()
+        else:
+            get_rate_limiter().consume()
+
+        if response_schema is not None:
+            answer = json.dumps(self.get_example(get_response_schema(response_schema)))
+        else:
+            answer = " ".join(WORDS[i % len(WORDS)] for i in range(self.nb_tokens))
+
+        if stream:
+            return self.get_streamed_response(answer, model, messages, cached_context)
+
+        time.sleep(self.ttft + len(answer.split()) / self.tokens_per_second)
+
+        response = {
+            "answer": answer,
+            "usages": self.get_usages(
+                model, messages, len(answer.split()), cached_context
+            )
+        }
+
+        if response_schema is not None:
+            try:
+                response["parsed"] = TypeAdapter(response_schema).validate_json(answer)
+            except ValidationError:
+                response["parsed"] = None
+
+        return response
+
+    def create_cached_context(
+            self,
+            messages: list,
+            model: str = "gemini-1.5-pro-002",
+            context: str | None = None,
+            ttl: float = 3600
+        ) -> str:
+        """
+        Fakes the caching of messages (see `Gemini.create_cached_context`).
+
+        Parameters
+        ----------
+        messages : list
+            The messages to cache.
+        model : str, optional
+            Ignored.
+        context : str or None, optional
+            Ignored.
+        ttl : float, optional
+            Ignored.
+
+        Returns
+        -------
+        str
+            The name of the cached context.
+        """
+
+        name = f"cachedContents/{uuid4()}"
+        self.cached_contexts[name] = self.count_tokens(messages)
+
+        return name
+
+    def delete_cached_context(self, name: str) -> None:
+        """
+        Deletes a fake cached context.
+
+        Parameters
+        ----------
+        name : str
+            The name of the cached context.
+        """
+
+        self.cached_contexts.pop(name, None)
+
+    def get_streamed_response(
+            self,
+            answer: str,
+            model: str,
+            messages: list,
+            cached_context: str | None = None,
+            words_per_part: int = 5
+        ) -> Generator:
+        """
+        Streams an answer, a few words per part, then its usages.
+
+        Parameters
+        ----------
+        answer : str
+            The answer.
+        model : str
+            The model.
+        messages : list
+            The messages.
+        cached_context : str or None, optional
+            The cached context that preceded the messages (default is None).
+        words_per_part : int, optional
+            The number of words of a part (default is 5).
+
+        Yields
+        ------
+        str or dict
+            Streamed content parts and usage information.
+        """
+
+        time.sleep(self.ttft)
+
+        words = answer.split(" ")
+        for i in range(0, len(words), words_per_part):
+            part = " ".join(words[i:i + words_per_part])
+            time.sleep(len(part.split()) / self.tokens_per_second)
+            yield part if i == 0 else " " + part
+
+        yield self.get_usages(model, messages, len(words), cached_context)
@@ -1,18 +1,41 @@
-from typing import Generator
+import copy
+from datetime import timedelta
+from functools import cache
+from typing import TYPE_CHECKING, Any, Generator
 
-import vertexai
 from google.api_core.exceptions import ResourceExhausted
+from pydantic import TypeAdapter, ValidationError
+from src.backend.docu_talk.agents.chatbot.scheduler import get_rate_limiter
 from src.backend.utils.decorators import retry_with_exponential_backoff
 from src.backend.utils.misc import get_param_or_env
-from vertexai.generative_models import GenerativeModel, SafetySetting
 
+if TYPE_CHECKING:
+    from vertexai.generative_models import (
+        GenerationConfig,
+        GenerativeModel,
+        SafetySetting,
+    )
 
-class Gemini:
+# The JSON schema keys supported by the response schemas of Vertex AI
+SCHEMA_KEYS = {
+    "type", "format", "description", "enum", "items", "properties", "required"
+}
+
+
+@cache
+def get_safety_settings() -> list["SafetySetting"]:
     """
-    A class to interface with the Gemini generative model for content generation and
-    handling safety settings.
+    Builds the safety settings sent with every request (vertexai is imported on
+    first use, as it is slow to import).
+
+    Returns
+    -------
+    list of SafetySetting
+        The safety settings.
     """
 
+    from vertexai.generative_models import SafetySetting
+
     safety_settings = [
         SafetySetting(
             category=SafetySetting.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
@@ -32,6 +55,86 @@ class Gemini:
         ),
     ]
 
+    return safety_settings
+
+@cache
+def get_response_schema(response_schema: Any) -> dict:
+    """
+    Converts a type (e.g. a pydantic model of `validation.py`, or a list of them)
+    into the response schema of Vertex AI: references are inlined and unsupported
+    keys (titles, defaults) are dropped.
+
+    Parameters
+    ----------
+    response_schema : Any
+        The type of the expected response.
+
+    Returns
+    -------
+    dict
+        The OpenAPI schema.
+    """
+
+    json_schema = TypeAdapter(response_schema).json_schema()
+    definitions = json_schema.get("$defs", {})
+
+    def convert(schema: dict) -> dict:
+
+        if "$ref" in schema:
+            schema = definitions[schema["$ref"].split("/")[-1]]
+
+        converted = {k: v for k, v in schema.items() if k in SCHEMA_KEYS}
+        if "items" in converted:
+            converted["items"] = convert(converted["items"])
+        if "properties" in converted:
+            converted["properties"] = {
+                name: convert(property_schema)
+                for name, property_schema in converted["properties"].items()
+            }
+
+        return converted
+
+    return convert(json_schema)
+
+def get_usages(
+        model_version: str,
+        usage_metadata
+    ) -> dict[str, str | int]:
+    """
+    Reads the token counts of a response.
+
+    Parameters
+    ----------
+    model_version : str
+        The model version of the response.
+    usage_metadata : GenerationResponse.UsageMetadata
+        The usage metadata of the (last chunk of the) response.
+
+    Returns
+    -------
+    dict
+        The model, the unit ("tokens"), the total token count ("qty"), and the
+        prompt ("input_tokens", cached ones included), cached ("cached_tokens") and
+        candidate ("output_tokens") token counts.
+    """
+
+    usages = {
+        "model": model_version,
+        "unit": "tokens",
+        "qty": usage_metadata.total_token_count,
+        "input_tokens": usage_metadata.prompt_token_count,
+        "cached_tokens": getattr(usage_metadata, "cached_content_token_count", 0),
+        "output_tokens": usage_metadata.candidates_token_count
+    }
+
+    return usages
+
+class Gemini:
+    """
+    A class to interface with the Gemini generative model for content generation and
+    handling safety settings.
+    """
+
     def __init__(
             self,
             project_id: str | None = None,
@@ -48,6 +151,8 @@ class Gemini:
             The Vertex AI location (default is None, fetched from the environment).
         """
 
+        import vertexai
+
         project_id = get_param_or_env(project_id, "GEMINI_PROJECT_ID")
         location = get_param_or_env(location, "GEMINI_LOCATION")
 
@@ -107,11 +212,19 @@ class Gemini:
             model: str = "gemini-1.5-pro-002",
             stream: bool = False,
             context: str | None = None,
+            response_schema: Any | None = None,
+            cached_context: str | None = None,
+            wait_for_quota: bool = False,
             **kwargs
         ):
         """
         Retrieves a response from the Gemini model, with options for streaming or
-        non-streaming.
+        non-streaming. With a response schema, the model is constrained to answer
+        in JSON (see `get_response_schema`), and the non-streamed answer is parsed.
+
+        Every request goes through the rate limiter of the process (see
+        `get_rate_limiter`): interactive requests are sent at once, background ones
+        (`wait_for_quota`) wait for the quota.
 
         Parameters
         ----------
@@ -123,26 +236,59 @@ class Gemini:
             Whether to stream the response (default is False).
         context : str or None, optional
             Context or system instruction for the model (default is None).
+        response_schema : Any or None, optional
+            The type of the expected response, e.g. a pydantic model (default is
+            None, free text).
+        cached_context : str or None, optional
+            The name of a cached context (see `create_cached_context`) that precedes
+            the messages, with its own system instruction (default is None).
+        wait_for_quota : bool, optional
+            Whether to wait for the rate limiter (default is False).
 
         Returns
         -------
         Generator or dict
-            A streamed response or a complete response depending on the mode.
+            A streamed response or a complete response depending on the mode. With a
+            response schema, the complete response has a "parsed" key, the validated
+            answer or None if it does not match the schema.
         """
 
-        client = GenerativeModel(
-            model_name=model,
-            system_instruction=context
-        )
+        from vertexai.generative_models import GenerationConfig, GenerativeModel
+
+        if wait_for_quota:
+            get_rate_limiter().acquire()
+        else:
+            get_rate_limiter().consume()
+
+        if cached_context is not None:
+            from vertexai.preview.generative_models import (
+                GenerativeModel as PreviewGenerativeModel,
+            )
+            client = PreviewGenerativeModel.from_cached_content(
+                cached_content=cached_context
+            )
+        else:
+            client = GenerativeModel(
+                model_name=model,
+                system_instruction=context
+            )
 
         contents = self.get_contents(messages)
 
+        generation_config = kwargs
+        if response_schema is not None:
+            generation_config = GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=copy.deepcopy(get_response_schema(response_schema)),
+                **kwargs
+            )
+
         if stream is True:
 
             response = self.get_streamed_response(
                 client=client,
                 contents=contents,
-                **kwargs
+                generation_config=generation_config
             )
 
         else:
@@ -150,16 +296,82 @@ class Gemini:
             response = self.get_unstreamed_response(
                 client=client,
                 contents=contents,
-                **kwargs
+                generation_config=generation_config
             )
 
+            if response_schema is not None:
+                try:
+                    response["parsed"] = TypeAdapter(response_schema).validate_json(
+                        response["answer"]
+                    )
+                except ValidationError:
+                    response["parsed"] = None
+
         return response
 
+    def create_cached_context(
+            self,
+            messages: list,
+            model: str = "gemini-1.5-pro-002",
+            context: str | None = None,
+            ttl: float = 3600
+        ) -> str:
+        """
+        Caches messages (e.g. the documents of a chatbot) on Vertex AI, so that the
+        requests that start with them are not billed their full input price.
+
+        Parameters
+        ----------
+        messages : list
+            The messages to cache.
+        model : str, optional
+            The model name (default is "gemini-1.5-pro-002").
+        context : str or None, optional
+            Context or system instruction for the model (default is None).
+        ttl : float, optional
+            The lifetime of the cache in seconds (default is 3600).
+
+        Returns
+        -------
+        str
+            The name of the cached context.
+
+        Raises
+        ------
+        google.api_core.exceptions.GoogleAPICallError
+            If the context cannot be cached, e.g. it is below the minimum size.
+        """
+
+        from vertexai.preview.caching import CachedContent
+
+        cached_content = CachedContent.create(
+            model_name=model,
+            system_instruction=context,
+            contents=self.get_contents(messages),
+            ttl=timedelta(seconds=ttl)
+        )
+
+        return cached_content.name
+
+    def delete_cached_context(self, name: str) -> None:
+        """
+        Deletes a cached context before it expires.
+
+        Parameters
+        ----------
+        name : str
+            The name of the cached context.
+        """
+
+        from vertexai.preview.caching import CachedContent
+
+        CachedContent(cached_content_name=name).delete()
+
     def get_streamed_response(
             self,
-            client: GenerativeModel,
+            client: "GenerativeModel",
             contents: list,
-            **kwargs
+            generation_config: "dict | GenerationConfig"
         ) -> Generator:
         """
         Retrieves a streamed response from the Gemini model.
@@ -170,39 +382,33 @@ class Gemini:
             The initialized Gemini model client.
         contents : list
             The structured content to send to the model.
-        kwargs : dict
-            Additional configuration options for the generation.
+        generation_config : dict or GenerationConfig
+            The configuration options for the generation.
 
         Yields
         ------
         str or dict
-            Streamed content parts and usage information.
+            Streamed content parts and usage information (see `get_usages`).
         """
 
         completion = client.generate_content(
             contents=contents,
-            generation_config=kwargs,
+            generation_config=generation_config,
             stream=True,
-            safety_settings=self.safety_settings
+            safety_settings=get_safety_settings()
         )
 
         for chunk in completion:
             part = chunk.candidates[0].content.parts[0].text
             yield part
 
-        usages = {
-            "model": chunk._raw_response.model_version,
-            "unit": "characters",
-            "qty": chunk.usage_metadata.total_token_count
-        }
-
-        yield usages
+        yield get_usages(chunk._raw_response.model_version, chunk.usage_metadata)
 
     def get_unstreamed_response(
             self,
-            client: GenerativeModel,
+            client: "GenerativeModel",
             contents: list,
-            **kwargs
+            generation_config: "dict | GenerationConfig"
         ) -> dict[str, str | dict[str, str | int]]:
         """
         Retrieves a complete, unstreamed response from the Gemini model.
@@ -213,29 +419,29 @@ class Gemini:
             The initialized Gemini model client.
         contents : list
             The structured content to send to the model.
-        kwargs : dict
-            Additional configuration options for the generation.
+        generation_config : dict or GenerationConfig
+            The configuration options for the generation.
 
         Returns
         -------
         dict
-            A dictionary containing the answer and usage information.
+            A dictionary containing the answer and usage information (see
+            `get_usages`).
         """
 
         completion = client.generate_content(
             contents=contents,
-            generation_config=kwargs,
+            generation_config=generation_config,
             stream=False,
-            safety_settings=self.safety_settings
+            safety_settings=get_safety_settings()
         )
 
         response = {
             "answer": completion.text,
-            "usages": {
-                "model": completion._raw_response.model_version,
-                "unit": "characters",
-                "qty": completion.to_dict()["usage_metadata"]["total_token_count"]
-            }
+            "usages": get_usages(
+                completion._raw_response.model_version,
+                completion.usage_metadata
+            )
         }
 
         return response
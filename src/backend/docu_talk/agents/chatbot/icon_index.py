@@ -0,0 +1,270 @@
+import json
+import math
+import os
+import re
+import zlib
+from functools import cache
+
+import numpy as np
+
+# Returned (in this order) when the description matches too few icons
+DEFAULT_ICONS = [
+    "description", "article", "menu_book", "forum", "lightbulb", "topic",
+    "library_books", "school", "work", "insights", "public", "smart_toy"
+]
+
+# Dark colours, picked when no LLM chooses the icon colour
+ICON_COLORS = [
+    "#1a73e8", "#0b8043", "#d93025", "#8430ce", "#e37400", "#007b83", "#3c4043",
+    "#b06000", "#174ea6", "#a50e0e"
+]
+
+# Weight of the curated keywords of an icon, relative to the words of its name
+KEYWORD_WEIGHT = 1.0
+
+STOPWORDS = {
+    "a", "about", "all", "an", "and", "answer", "answers", "any", "are", "as",
+    "ask", "assistant", "at", "based", "be", "by", "can", "chatbot", "content",
+    "contents", "detail", "details", "document", "documents", "for", "from", "has",
+    "have", "help", "helps", "how", "in", "including", "information", "into", "is",
+    "it", "its", "more", "of", "on", "or", "other", "provide", "provides",
+    "question", "questions", "related", "specific", "such", "that", "the", "their",
+    "them", "these", "this", "to", "user", "users", "using", "various", "what",
+    "which", "with", "you", "your"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def stem(word: str) -> str:
+    """
+    Strips the plural of an English word.
+
+    Parameters
+    ----------
+    word : str
+        The lowercase word.
+
+    Returns
+    -------
+    str
+        The stem.
+    """
+
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def tokenize(text: str) -> list[str]:
+    """
+    Splits a text (or an icon name) into stemmed words, stop words excluded.
+
+    Parameters
+    ----------
+    text : str
+        The text.
+
+    Returns
+    -------
+    list of str
+        The tokens.
+    """
+
+    return [
+        stem(word)
+        for word in TOKEN_PATTERN.findall(text.lower().replace("_", " "))
+        if word not in STOPWORDS
+    ]
+
+class IconIndex:
+    """
+    A TF-IDF index of the Material icons, used to shortlist the icons that match a
+    chatbot description without sending all of their names to the LLM. Each icon
+    is indexed by the words of its name and by curated keywords
+    (`src/icon_keywords.json`), which weigh less.
+    """
+
+    def __init__(
+            self,
+            icons: dict[str, str],
+            keywords: dict[str, list[str]] | None = None
+        ) -> None:
+        """
+        Builds the index.
+
+        Parameters
+        ----------
+        icons : dict
+            The icon code points keyed by icon name.
+        keywords : dict or None, optional
+            Extra words keyed by icon name (default is None).
+        """
+
+        keywords = keywords or {}
+
+        self.names = list(icons)
+
+        # Term frequencies of the name words and of the keywords of each icon
+        documents = []
+        for name in self.names:
+            name_terms: dict[str, float] = {}
+            for token in tokenize(name):
+                name_terms[token] = name_terms.get(token, 0) + 1
+            keyword_terms = {
+                token: KEYWORD_WEIGHT
+                for token in tokenize(" ".join(keywords.get(name, [])))
+                if token not in name_terms
+            }
+            documents.append((name_terms, keyword_terms))
+
+        document_frequencies: dict[str, int] = {}
+        for name_terms, keyword_terms in documents:
+            for token in name_terms.keys() | keyword_terms.keys():
+                document_frequencies[token] = document_frequencies.get(token, 0) + 1
+
+        self.idf = {
+            token: math.log((1 + len(documents)) / (1 + df)) + 1
+            for token, df in document_frequencies.items()
+        }
+
+        # Inverted index of the TF-IDF vectors: token -> (icon indices, weights).
+        # The vectors are normalized by the norm of the name words only, so that
+        # the keywords (aliases) do not dilute the name of a curated icon.
+        postings: dict[str, tuple[list[int], list[float]]] = {}
+        for i, (name_terms, keyword_terms) in enumerate(documents):
+
+            weights = {
+                token: tf * self.idf[token]
+                for token, tf in (name_terms | keyword_terms).items()
+            }
+            norm = math.sqrt(sum(weights[token] ** 2 for token in name_terms)) or 1
+
+            for token, weight in weights.items():
+                indices, values = postings.setdefault(token, ([], []))
+                indices.append(i)
+                values.append(weight / norm)
+
+        self.postings = {
+            token: (np.array(indices), np.array(values))
+            for token, (indices, values) in postings.items()
+        }
+
+    def score(self, text: str) -> np.ndarray:
+        """
+        Scores every icon against a text (cosine similarity of the TF-IDF vectors,
+        up to the norm of the text, which does not change the ranking).
+
+        Parameters
+        ----------
+        text : str
+            The text, e.g. a chatbot description.
+
+        Returns
+        -------
+        np.ndarray
+            The score of each icon, in the order of `names`.
+        """
+
+        counts: dict[str, int] = {}
+        for token in tokenize(text):
+            if token in self.postings:
+                counts[token] = counts.get(token, 0) + 1
+
+        scores = np.zeros(len(self.names))
+        for token, count in counts.items():
+            indices, values = self.postings[token]
+            scores[indices] += count * self.idf[token] * values
+
+        return scores
+
+    def shortlist(
+            self,
+            text: str,
+            k: int = 30
+        ) -> list[str]:
+        """
+        Returns the icons that best match a text, completed with generic icons
+        when fewer than `k` icons match.
+
+        Parameters
+        ----------
+        text : str
+            The text, e.g. a chatbot description.
+        k : int, optional
+            The number of icons (default is 30).
+
+        Returns
+        -------
+        list of str
+            The icon names, best first.
+        """
+
+        scores = self.score(text)
+
+        nb_matches = int(np.count_nonzero(scores))
+        top = np.argsort(-scores, kind="stable")[:min(k, nb_matches)]
+        names = [self.names[i] for i in top]
+
+        known = set(self.names)
+        for name in DEFAULT_ICONS:
+            if len(names) >= k:
+                break
+            if name in known and name not in names:
+                names.append(name)
+
+        return names
+
+    def best(self, text: str) -> str:
+        """
+        Returns the icon that best matches a text.
+
+        Parameters
+        ----------
+        text : str
+            The text, e.g. a chatbot description.
+
+        Returns
+        -------
+        str
+            The icon name.
+        """
+
+        return self.shortlist(text, k=1)[0]
+
+def get_icon_color(text: str) -> str:
+    """
+    Picks a colour for an icon, deterministically from a text.
+
+    Parameters
+    ----------
+    text : str
+        The text, e.g. a chatbot description.
+
+    Returns
+    -------
+    str
+        The colour, as a hex code.
+    """
+
+    return ICON_COLORS[zlib.crc32(text.encode()) % len(ICON_COLORS)]
+
+@cache
+def get_icon_index() -> IconIndex:
+    """
+    Builds the icon index, on first use.
+
+    Returns
+    -------
+    IconIndex
+        The index of the Material icons.
+    """
+
+    from src.backend.docu_talk.agents.chatbot.chatbot import get_icons
+
+    path = os.path.join(os.path.dirname(__file__), "src", "icon_keywords.json")
+    with open(path) as f:
+        keywords = json.load(f)
+
+    return IconIndex(icons=get_icons(), keywords=keywords)
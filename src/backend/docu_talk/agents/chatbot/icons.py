@@ -1,16 +1,89 @@
 import io
 import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
-from PIL import Image, ImageDraw, ImageFont
+if TYPE_CHECKING:
+    from PIL import Image, ImageFont
 
+FONT_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "src",
+    "MaterialIcons-Regular.ttf"
+)
 
+
+@lru_cache(maxsize=8)
+def get_font(size: int) -> "ImageFont.FreeTypeFont":
+    """
+    Loads the Material icons font at a size, once per size.
+
+    Parameters
+    ----------
+    size : int
+        The font size in pixels.
+
+    Returns
+    -------
+    ImageFont.FreeTypeFont
+        The font.
+    """
+
+    from PIL import ImageFont
+
+    return ImageFont.truetype(FONT_PATH, size)
+
+def render_glyph(
+        icon_id: str,
+        size: int
+    ) -> "Image.Image":
+    """
+    Rasterises an icon, centred in a square.
+
+    Parameters
+    ----------
+    icon_id : str
+        The Unicode identifier for the icon, represented as a hexadecimal string.
+    size : int
+        The size (width and height) of the square in pixels.
+
+    Returns
+    -------
+    Image.Image
+        The coverage of the icon, as a grayscale ("L") image.
+    """
+
+    from PIL import Image, ImageDraw
+
+    font = get_font(size)
+    text = chr(int("0x" + icon_id, 16))
+
+    mask = Image.new("L", (size, size), 0)
+
+    draw = ImageDraw.Draw(mask)
+    text_bbox = draw.textbbox((0, 0), text=text, font=font)
+    text_width = text_bbox[2] - text_bbox[0]
+    text_height = text_bbox[3] - text_bbox[1]
+
+    draw.text(
+        ((size - text_width) / 2, (size - text_height) / 2),
+        text=text,
+        font=font,
+        fill=255
+    )
+
+    return mask
+
+@lru_cache(maxsize=256)
 def get_icon_bytes(
         icon_id: str,
         size: int = 256,
         color: str = "black"
     ) -> bytes:
     """
-    Generates an icon as a PNG image and returns its binary representation.
+    Generates an icon as a PNG image and returns its binary representation. The
+    icons are a small discrete space (icon, size, colour), the latest ones are
+    kept in memory.
 
     Parameters
     ----------
@@ -27,32 +100,60 @@ def get_icon_bytes(
         The binary content of the generated PNG icon.
     """
 
-    font_path = os.path.join(
-        os.path.dirname(__file__),
-        "src",
-        "MaterialIcons-Regular.ttf"
-    )
+    from PIL import Image
 
-    # Load the font
-    font = ImageFont.truetype(font_path, size)
+    # Fill the icon with the colour, its coverage being the transparency
+    image = Image.new("RGBA", (size, size), color)
+    image.putalpha(render_glyph(icon_id, size))
 
-    # Create a blank image with a transparent background
-    image = Image.new("RGBA", (size, size), (255, 255, 255, 0))
+    byte_array = io.BytesIO()
+    image.save(byte_array, format="PNG")
 
-    # Draw the icon on the image
-    draw = ImageDraw.Draw(image)
-    text_bbox = draw.textbbox((0, 0), text=chr(int("0x" + icon_id, 16)), font=font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
+    return byte_array.getvalue()
 
-    draw.text(
-        ((size - text_width) / 2, (size - text_height) / 2),
-        text=chr(int("0x" + icon_id, 16)),  # Icon unicode
-        font=font,
-        fill=color
-    )
+@lru_cache(maxsize=256)
+def get_thumbnail(
+        image_bytes: bytes,
+        size: int = 40,
+        format: str = "PNG"
+    ) -> bytes:
+    """
+    Downsizes an image (e.g. a chatbot icon) for the listings. Streamlit serves an
+    image that is not larger than its display width as is, instead of resizing it
+    on every rerun.
+
+    Parameters
+    ----------
+    image_bytes : bytes
+        The image.
+    size : int, optional
+        The maximum width and height in pixels (default is 40).
+    format : str, optional
+        The format of the thumbnail, e.g. "PNG" or "WEBP" (default is "PNG").
+
+    Returns
+    -------
+    bytes
+        The thumbnail, or the image itself if it cannot be read.
+    """
+
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        return image_bytes
+
+    if max(image.size) <= size and image.format == format:
+        return image_bytes
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    image.thumbnail((size, size), resample=Image.LANCZOS)
 
     byte_array = io.BytesIO()
-    image.save(byte_array, format="PNG")
+    image.save(byte_array, format=format)
 
     return byte_array.getvalue()
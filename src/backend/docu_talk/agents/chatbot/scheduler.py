@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter, shared by the threads of a process.
+
+    The bucket is refilled at `rate_per_minute` tokens per minute, up to `capacity`
+    tokens. `acquire` waits for a token (background work such as batches), while
+    `consume` takes it at once, possibly leaving the bucket in debt (interactive
+    requests): background work then waits until the debt is repaid, so that it
+    yields to the users.
+    """
+
+    def __init__(
+            self,
+            rate_per_minute: float,
+            capacity: float = 1.0
+        ) -> None:
+        """
+        Initializes a full bucket.
+
+        Parameters
+        ----------
+        rate_per_minute : float
+            The number of tokens added per minute.
+        capacity : float, optional
+            The maximum number of tokens, i.e. the burst size (default is 1).
+        """
+
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self) -> None:
+        """
+        Adds the tokens earned since the last update. Must be called with the lock.
+        """
+
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def consume(self, amount: float = 1.0) -> None:
+        """
+        Takes tokens without waiting.
+
+        Parameters
+        ----------
+        amount : float, optional
+            The number of tokens (default is 1).
+        """
+
+        with self.lock:
+            self.refill()
+            self.tokens -= amount
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """
+        Takes tokens if they are available, without waiting.
+
+        Parameters
+        ----------
+        amount : float, optional
+            The number of tokens (default is 1).
+
+        Returns
+        -------
+        float
+            0 if the tokens were taken, otherwise the time until they are available
+            in seconds.
+        """
+
+        with self.lock:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Takes tokens, waiting until they are available.
+
+        Parameters
+        ----------
+        amount : float, optional
+            The number of tokens (default is 1).
+
+        Returns
+        -------
+        float
+            The time waited in seconds.
+        """
+
+        start_time = time.monotonic()
+
+        while True:
+
+            with self.lock:
+                self.refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return time.monotonic() - start_time
+                wait = (amount - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+def get_rate_limiter() -> TokenBucket:
+    """
+    Returns the process-wide rate limiter of the LLM requests, created on first
+    call. `LLM_REQUESTS_PER_MINUTE` sets its rate (default is 60) and `LLM_BURST`
+    its capacity (default is 5).
+
+    Returns
+    -------
+    TokenBucket
+        The rate limiter.
+    """
+
+    global rate_limiter
+
+    if rate_limiter is None:
+        with rate_limiter_lock:
+            if rate_limiter is None:
+                rate_limiter = TokenBucket(
+                    rate_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+                    capacity=float(os.getenv("LLM_BURST", "5"))
+                )
+
+    return rate_limiter
+
+rate_limiter: TokenBucket | None = None
+rate_limiter_lock = threading.Lock()
@@ -0,0 +1,523 @@
+import numpy as np
+
+
+def weighted_quantile(
+        values: np.ndarray,
+        weights: np.ndarray,
+        alpha: float
+    ) -> float:
+    """
+    Computes a weighted quantile.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The values.
+    weights : np.ndarray
+        The weight of each value.
+    alpha : float
+        The quantile, between 0 and 1.
+
+    Returns
+    -------
+    float
+        The smallest value whose cumulative weight reaches `alpha`.
+    """
+
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    index = np.searchsorted(cumulative, alpha * cumulative[-1], side="left")
+
+    return float(values[order][min(index, len(values) - 1)])
+
+def find_best_split(
+        candidates: list[tuple[int, np.ndarray, np.ndarray]],
+        w: np.ndarray,
+        residuals: np.ndarray,
+        total_w: float
+    ) -> tuple | None:
+    """
+    Finds the stump that best fits the residuals, among the candidate thresholds
+    of every feature.
+
+    Parameters
+    ----------
+    candidates : list of tuple
+        Per feature, its index, its candidate thresholds and the bin of each
+        sample (x[:, j] <= thresholds[k] <=> bins <= k).
+    w : np.ndarray
+        The weight of each sample.
+    residuals : np.ndarray
+        The weighted negative gradient of each sample.
+    total_w : float
+        The sum of the weights.
+
+    Returns
+    -------
+    tuple or None
+        The gain, the feature, the threshold, the mean residual on the left and on
+        the right, and the mask of the samples on the left; None if no threshold
+        splits the samples.
+    """
+
+    total_r = residuals.sum()
+    best = None
+
+    for j, feature_thresholds, bins in candidates:
+
+        n_thresholds = len(feature_thresholds)
+        if n_thresholds == 0:
+            continue
+
+        left_w = np.cumsum(np.bincount(bins, w, n_thresholds + 1))[:-1]
+        left_r = np.cumsum(np.bincount(bins, residuals, n_thresholds + 1))[:-1]
+        right_w = total_w - left_w
+        right_r = total_r - left_r
+
+        valid = (left_w > 0) & (right_w > 0)
+        if not valid.any():
+            continue
+
+        safe_left_w = np.where(valid, left_w, 1)
+        safe_right_w = np.where(valid, right_w, 1)
+        gain = np.where(
+            valid,
+            left_r**2 / safe_left_w + right_r**2 / safe_right_w,
+            -np.inf
+        )
+        k = int(np.argmax(gain))
+
+        if best is None or gain[k] > best[0]:
+            best = (
+                gain[k],
+                j,
+                feature_thresholds[k],
+                left_r[k] / left_w[k],
+                right_r[k] / right_w[k],
+                bins <= k
+            )
+
+    return best
+
+class BoostedStumps:
+    """
+    A gradient-boosted ensemble of decision stumps (depth-1 trees), compiled to
+    flat NumPy arrays. A prediction is a single vectorised comparison over all the
+    stumps, so it needs neither pandas nor scikit-learn.
+
+    With the default least-squares loss the model predicts the mean, with the
+    quantile (pinball) loss it predicts the `alpha` quantile.
+    """
+
+    def __init__(
+            self,
+            n_estimators: int = 200,
+            learning_rate: float = 0.1,
+            max_thresholds: int = 64,
+            alpha: float | None = None
+        ) -> None:
+        """
+        Initializes an untrained model.
+
+        Parameters
+        ----------
+        n_estimators : int, optional
+            The number of stumps (default is 200).
+        learning_rate : float, optional
+            The shrinkage applied to each stump (default is 0.1).
+        max_thresholds : int, optional
+            The maximum number of candidate thresholds per feature, taken at
+            quantiles of the feature (default is 64).
+        alpha : float or None, optional
+            The quantile to predict, between 0 and 1 (default is None, the mean).
+        """
+
+        self.n_estimators = n_estimators
+        self.learning_rate = learning_rate
+        self.max_thresholds = max_thresholds
+        self.alpha = alpha
+
+        self.n_features = 0
+        self.base = 0.0
+        self.features = np.zeros(0, dtype=np.int32)
+        self.thresholds = np.zeros(0)
+        self.left_values = np.zeros(0)
+        self.right_values = np.zeros(0)
+
+    def get_thresholds(self, values: np.ndarray) -> np.ndarray:
+        """
+        Computes the candidate thresholds of a feature.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            The values of the feature.
+
+        Returns
+        -------
+        np.ndarray
+            The candidate thresholds, halfway between consecutive distinct values.
+        """
+
+        unique = np.unique(values)
+        if len(unique) > self.max_thresholds + 1:
+            unique = np.unique(
+                np.quantile(values, np.linspace(0, 1, self.max_thresholds + 1))
+            )
+
+        return (unique[:-1] + unique[1:]) / 2
+
+    def fit(
+            self,
+            x: np.ndarray,
+            y: np.ndarray,
+            sample_weight: np.ndarray | None = None
+        ) -> "BoostedStumps":
+        """
+        Fits the model by gradient boosting. Splits are chosen on the negative
+        gradient of the loss; with the quantile loss, leaf values are then set to
+        the `alpha` quantile of the residuals of the leaf.
+
+        Parameters
+        ----------
+        x : np.ndarray
+            The feature matrix, of shape (n_samples, n_features).
+        y : np.ndarray
+            The target values.
+        sample_weight : np.ndarray or None, optional
+            The weight of each sample (default is uniform).
+
+        Returns
+        -------
+        BoostedStumps
+            The fitted model.
+        """
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        w = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight)
+
+        self.n_features = x.shape[1]
+        if self.alpha is None:
+            self.base = float(np.average(y, weights=w))
+        else:
+            self.base = weighted_quantile(y, w, self.alpha)
+        prediction = np.full(len(y), self.base)
+
+        # Samples are binned once: x[:, j] <= thresholds[k] <=> bins[j] <= k
+        candidates = []
+        for j in range(x.shape[1]):
+            feature_thresholds = self.get_thresholds(x[:, j])
+            bins = np.searchsorted(feature_thresholds, x[:, j], side="left")
+            candidates.append((j, feature_thresholds, bins))
+
+        total_w = w.sum()
+        features, thresholds, left_values, right_values = [], [], [], []
+        for _ in range(self.n_estimators):
+
+            if self.alpha is None:
+                residuals = (y - prediction) * w
+            else:
+                residuals = np.where(y > prediction, self.alpha, self.alpha - 1) * w
+            best = find_best_split(candidates, w, residuals, total_w)
+
+            if best is None:
+                break
+
+            _, j, threshold, left, right, mask = best
+            if self.alpha is not None:
+                left = weighted_quantile(
+                    (y - prediction)[mask], w[mask], self.alpha
+                )
+                right = weighted_quantile(
+                    (y - prediction)[~mask], w[~mask], self.alpha
+                )
+            left *= self.learning_rate
+            right *= self.learning_rate
+
+            prediction += np.where(mask, left, right)
+
+            features.append(j)
+            thresholds.append(threshold)
+            left_values.append(left)
+            right_values.append(right)
+
+        self.features = np.array(features, dtype=np.int32)
+        self.thresholds = np.array(thresholds)
+        self.left_values = np.array(left_values)
+        self.right_values = np.array(right_values)
+
+        return self
+
+    def predict(self, x: np.ndarray | list) -> np.ndarray:
+        """
+        Predicts the target of one or several feature vectors.
+
+        Parameters
+        ----------
+        x : np.ndarray or list
+            A feature vector, or a matrix of shape (n_samples, n_features).
+
+        Returns
+        -------
+        np.ndarray
+            The predictions, of shape (n_samples,).
+        """
+
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+
+        left = x[:, self.features] <= self.thresholds
+        contributions = np.where(left, self.left_values, self.right_values)
+
+        return self.base + contributions.sum(axis=1)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """
+        Exports the model as NumPy arrays.
+
+        Returns
+        -------
+        dict
+            The arrays describing the model.
+        """
+
+        return {
+            "alpha": np.array(np.nan if self.alpha is None else self.alpha),
+            "n_features": np.array(self.n_features),
+            "base": np.array(self.base),
+            "features": self.features,
+            "thresholds": self.thresholds,
+            "left_values": self.left_values,
+            "right_values": self.right_values
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "BoostedStumps":
+        """
+        Rebuilds a model from the arrays of `to_arrays`.
+
+        Parameters
+        ----------
+        arrays : dict
+            The arrays describing the model.
+
+        Returns
+        -------
+        BoostedStumps
+            The model.
+        """
+
+        alpha = float(arrays["alpha"]) if "alpha" in arrays else np.nan
+
+        model = cls(
+            n_estimators=len(arrays["features"]),
+            alpha=None if np.isnan(alpha) else alpha
+        )
+        model.n_features = int(arrays["n_features"])
+        model.base = float(arrays["base"])
+        model.features = np.asarray(arrays["features"], dtype=np.int32)
+        model.thresholds = np.asarray(arrays["thresholds"], dtype=float)
+        model.left_values = np.asarray(arrays["left_values"], dtype=float)
+        model.right_values = np.asarray(arrays["right_values"], dtype=float)
+
+        return model
+
+class StumpEnsemble:
+    """
+    Several boosted-stumps models (heads), e.g. quantiles of a metric or models of
+    several metrics, compiled together. The heads read from one concatenated
+    feature vector and are all evaluated by one vectorised comparison.
+    """
+
+    def __init__(
+            self,
+            heads: list[str],
+            n_features: int,
+            bases: np.ndarray,
+            head_ids: np.ndarray,
+            features: np.ndarray,
+            thresholds: np.ndarray,
+            left_values: np.ndarray,
+            right_values: np.ndarray
+        ) -> None:
+        """
+        Initializes the ensemble from its compiled arrays.
+
+        Parameters
+        ----------
+        heads : list of str
+            The names of the heads.
+        n_features : int
+            The length of the feature vector.
+        bases : np.ndarray
+            The base value of each head.
+        head_ids : np.ndarray
+            The head of each stump.
+        features : np.ndarray
+            The feature of each stump, indexed in the concatenated feature vector.
+        thresholds : np.ndarray
+            The threshold of each stump.
+        left_values : np.ndarray
+            The value of each stump when the feature is below its threshold.
+        right_values : np.ndarray
+            The value of each stump otherwise.
+        """
+
+        self.heads = heads
+        self.n_features = n_features
+        self.bases = bases
+        self.head_ids = head_ids
+        self.features = features
+        self.thresholds = thresholds
+        self.left_values = left_values
+        self.right_values = right_values
+
+        # Sums the stump contributions of each head with one matrix product
+        self.assignment = np.zeros((len(head_ids), len(heads)))
+        self.assignment[np.arange(len(head_ids)), head_ids] = 1
+
+    @classmethod
+    def from_models(cls, models: dict[str, BoostedStumps]) -> "StumpEnsemble":
+        """
+        Compiles models sharing the same features.
+
+        Parameters
+        ----------
+        models : dict
+            The models keyed by head name.
+
+        Returns
+        -------
+        StumpEnsemble
+            The ensemble.
+        """
+
+        models_list = list(models.values())
+
+        return cls(
+            heads=list(models),
+            n_features=max(model.n_features for model in models_list),
+            bases=np.array([model.base for model in models_list]),
+            head_ids=np.concatenate([
+                np.full(len(model.features), i, dtype=np.int32)
+                for i, model in enumerate(models_list)
+            ]),
+            features=np.concatenate([model.features for model in models_list]),
+            thresholds=np.concatenate([model.thresholds for model in models_list]),
+            left_values=np.concatenate([model.left_values for model in models_list]),
+            right_values=np.concatenate([model.right_values for model in models_list])
+        )
+
+    @classmethod
+    def concat(cls, ensembles: dict[str, "StumpEnsemble"]) -> "StumpEnsemble":
+        """
+        Compiles ensembles reading different feature vectors, which are expected
+        concatenated in the same order. Head names are prefixed with the name of
+        their ensemble ("{name}:{head}").
+
+        Parameters
+        ----------
+        ensembles : dict
+            The ensembles keyed by name.
+
+        Returns
+        -------
+        StumpEnsemble
+            The ensemble.
+        """
+
+        heads, bases, head_ids, features = [], [], [], []
+        offset = 0
+        for name, ensemble in ensembles.items():
+            head_ids.append(ensemble.head_ids + len(heads))
+            heads += [f"{name}:{head}" for head in ensemble.heads]
+            bases.append(ensemble.bases)
+            features.append(ensemble.features + offset)
+            offset += ensemble.n_features
+
+        ensembles_list = list(ensembles.values())
+
+        return cls(
+            heads=heads,
+            n_features=offset,
+            bases=np.concatenate(bases),
+            head_ids=np.concatenate(head_ids),
+            features=np.concatenate(features),
+            thresholds=np.concatenate([e.thresholds for e in ensembles_list]),
+            left_values=np.concatenate([e.left_values for e in ensembles_list]),
+            right_values=np.concatenate([e.right_values for e in ensembles_list])
+        )
+
+    def predict(self, x: np.ndarray | list) -> np.ndarray:
+        """
+        Predicts all the heads of one or several feature vectors.
+
+        Parameters
+        ----------
+        x : np.ndarray or list
+            A feature vector, or a matrix of shape (n_samples, n_features).
+
+        Returns
+        -------
+        np.ndarray
+            The predictions, of shape (n_samples, n_heads).
+        """
+
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+
+        left = x[:, self.features] <= self.thresholds
+        contributions = np.where(left, self.left_values, self.right_values)
+
+        return self.bases + contributions @ self.assignment
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """
+        Exports the ensemble as NumPy arrays.
+
+        Returns
+        -------
+        dict
+            The arrays describing the ensemble.
+        """
+
+        return {
+            "heads": np.array(self.heads),
+            "n_features": np.array(self.n_features),
+            "bases": self.bases,
+            "head_ids": self.head_ids,
+            "features": self.features,
+            "thresholds": self.thresholds,
+            "left_values": self.left_values,
+            "right_values": self.right_values
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "StumpEnsemble":
+        """
+        Rebuilds an ensemble from the arrays of `to_arrays`. The arrays of a single
+        `BoostedStumps` model are read as a one-head ensemble.
+
+        Parameters
+        ----------
+        arrays : dict
+            The arrays describing the ensemble.
+
+        Returns
+        -------
+        StumpEnsemble
+            The ensemble.
+        """
+
+        if "heads" not in arrays:
+            return cls.from_models({"mean": BoostedStumps.from_arrays(arrays)})
+
+        return cls(
+            heads=[str(head) for head in arrays["heads"]],
+            n_features=int(arrays["n_features"]),
+            bases=np.asarray(arrays["bases"], dtype=float),
+            head_ids=np.asarray(arrays["head_ids"], dtype=np.int32),
+            features=np.asarray(arrays["features"], dtype=np.int32),
+            thresholds=np.asarray(arrays["thresholds"], dtype=float),
+            left_values=np.asarray(arrays["left_values"], dtype=float),
+            right_values=np.asarray(arrays["right_values"], dtype=float)
+        )
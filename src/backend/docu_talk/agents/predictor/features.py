@@ -0,0 +1,328 @@
+import hashlib
+import json
+import os
+from bisect import bisect_left
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+import numpy as np
+from src.backend.docu_talk.exceptions import SchemaMismatchError
+from src.backend.utils.misc import atomic_write
+
+SCHEMA_VERSION = 1
+
+# Feature layout of each schema version. Version 0 is the layout of the legacy
+# pickles, trained on `Predictor.preprocess` (model code, raw epoch timestamp).
+FEATURE_NAMES = {
+    0: ["nb_documents", "total_pages", "model", "timestamp"],
+    1: [
+        "nb_documents",
+        "total_pages",
+        "pages_per_document",
+        "document_bucket",
+        "page_bucket",
+        "model",
+        "hour",
+        "weekday"
+    ]
+}
+
+# Upper bounds of the buckets, a value above the last bound falls in an extra bucket
+DOCUMENT_BUCKETS = [1, 2, 5, 10, 20]
+PAGE_BUCKETS = [10, 25, 50, 100, 250, 500, 1000]
+
+SERVICE_MODELS_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "..", "..", "database", "jobs", "data", "service_models.json"
+)
+
+
+def parse_timestamp(value: datetime | str | None) -> datetime:
+    """
+    Parses the timestamp of a record.
+
+    Parameters
+    ----------
+    value : datetime or str or None
+        The timestamp, as stored in the database or exported (ISO format). None
+        stands for now.
+
+    Returns
+    -------
+    datetime
+        The timestamp.
+    """
+
+    if value is None:
+        return datetime.now()
+    elif isinstance(value, str):
+        return datetime.fromisoformat(value)
+
+    return value
+
+@dataclass
+class FeatureSchema:
+    """
+    The persisted encoding of the predictor features. It is fitted once at training
+    time and saved next to the model, so that a record is encoded the same way
+    when training and when serving.
+    """
+
+    model_vocabulary: list[str]
+    document_buckets: list[int] = field(default_factory=lambda: DOCUMENT_BUCKETS[:])
+    page_buckets: list[int] = field(default_factory=lambda: PAGE_BUCKETS[:])
+    version: int = SCHEMA_VERSION
+
+    @property
+    def feature_names(self) -> list[str]:
+        """
+        The names of the encoded features, in order.
+        """
+
+        return FEATURE_NAMES[self.version]
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        A hash of the schema, stamped on the artefacts trained with it.
+        """
+
+        content = json.dumps(
+            {"feature_names": self.feature_names, **asdict(self)},
+            sort_keys=True
+        )
+
+        return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+    @classmethod
+    def fit(cls, data: list[dict]) -> "FeatureSchema":
+        """
+        Builds the schema of a training set.
+
+        Parameters
+        ----------
+        data : list of dict
+            The training records.
+
+        Returns
+        -------
+        FeatureSchema
+            The schema, whose model vocabulary is the sorted model names of the
+            records.
+        """
+
+        return cls(model_vocabulary=sorted({d["model"] for d in data}))
+
+    @classmethod
+    def legacy(cls) -> "FeatureSchema":
+        """
+        Rebuilds the schema of the legacy pickles, which have no schema file.
+        Their model codes were the pandas category codes of the training table, i.e.
+        the index in the sorted model names, approximated here by the service
+        models.
+
+        Returns
+        -------
+        FeatureSchema
+            The version 0 schema.
+        """
+
+        with open(SERVICE_MODELS_PATH) as f:
+            service_models = json.load(f)
+
+        return cls(
+            model_vocabulary=sorted(m["name"] for m in service_models),
+            document_buckets=[],
+            page_buckets=[],
+            version=0
+        )
+
+    def encode(self, data: dict) -> list[float]:
+        """
+        Encodes a record into a feature vector.
+
+        Parameters
+        ----------
+        data : dict
+            The record (nb_documents, total_pages, model, timestamp).
+
+        Returns
+        -------
+        list of float
+            The feature vector, in the order of `feature_names`. An unknown model is
+            encoded as -1.
+        """
+
+        if data["model"] in self.model_vocabulary:
+            model_code = self.model_vocabulary.index(data["model"])
+        else:
+            model_code = -1
+
+        timestamp = parse_timestamp(data.get("timestamp"))
+
+        nb_documents = data["nb_documents"]
+        total_pages = data["total_pages"]
+
+        if self.version == 0:
+            return [nb_documents, total_pages, model_code, timestamp.timestamp()]
+
+        return [
+            nb_documents,
+            total_pages,
+            total_pages / max(nb_documents, 1),
+            bisect_left(self.document_buckets, nb_documents),
+            bisect_left(self.page_buckets, total_pages),
+            model_code,
+            timestamp.hour,
+            timestamp.weekday()
+        ]
+
+    def encode_many(self, data: list[dict]) -> np.ndarray:
+        """
+        Encodes records into a feature matrix.
+
+        Parameters
+        ----------
+        data : list of dict
+            The records.
+
+        Returns
+        -------
+        np.ndarray
+            The feature matrix, of shape (n_records, n_features).
+        """
+
+        x = np.array([self.encode(d) for d in data], dtype=float)
+
+        return x.reshape(len(data), len(self.feature_names))
+
+    def validate(
+            self,
+            fingerprint: str | None,
+            n_features: int
+        ) -> None:
+        """
+        Checks that an artefact was trained with this schema.
+
+        Parameters
+        ----------
+        fingerprint : str or None
+            The schema fingerprint stamped on the artefact (None for a legacy
+            artefact).
+        n_features : int
+            The number of features the artefact expects.
+
+        Raises
+        ------
+        SchemaMismatchError
+            If the schema version is not supported, or if the artefact does not
+            match the schema.
+        """
+
+        if self.version not in FEATURE_NAMES:
+            raise SchemaMismatchError(
+                f"Unsupported feature schema version {self.version}"
+            )
+
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            raise SchemaMismatchError(
+                f"The artefact was trained with schema {fingerprint}, "
+                f"got {self.fingerprint}"
+            )
+
+        if n_features != len(self.feature_names):
+            raise SchemaMismatchError(
+                f"The artefact expects {n_features} features, "
+                f"the schema has {len(self.feature_names)}"
+            )
+
+    def to_dict(self) -> dict:
+        """
+        Converts the schema into a JSON-serializable dictionary.
+
+        Returns
+        -------
+        dict
+            The schema, with its feature names and fingerprint.
+        """
+
+        return {
+            **asdict(self),
+            "feature_names": self.feature_names,
+            "fingerprint": self.fingerprint
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FeatureSchema":
+        """
+        Rebuilds a schema from `to_dict`.
+
+        Parameters
+        ----------
+        data : dict
+            The schema as a dictionary.
+
+        Returns
+        -------
+        FeatureSchema
+            The schema.
+
+        Raises
+        ------
+        SchemaMismatchError
+            If the schema is corrupted or written by an unsupported version.
+        """
+
+        version = data.get("version")
+        if version not in FEATURE_NAMES:
+            raise SchemaMismatchError(f"Unsupported feature schema version {version}")
+
+        schema = cls(
+            model_vocabulary=data["model_vocabulary"],
+            document_buckets=data["document_buckets"],
+            page_buckets=data["page_buckets"],
+            version=version
+        )
+
+        if data.get("feature_names", schema.feature_names) != schema.feature_names:
+            raise SchemaMismatchError(
+                f"The feature names {data['feature_names']} do not match "
+                f"version {version}"
+            )
+
+        if data.get("fingerprint", schema.fingerprint) != schema.fingerprint:
+            raise SchemaMismatchError("The schema file is corrupted")
+
+        return schema
+
+    def save(self, path: str) -> None:
+        """
+        Writes the schema to a JSON file, atomically.
+
+        Parameters
+        ----------
+        path : str
+            The destination file.
+        """
+
+        with atomic_write(path) as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureSchema":
+        """
+        Reads a schema from a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            The schema file.
+
+        Returns
+        -------
+        FeatureSchema
+            The schema.
+        """
+
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
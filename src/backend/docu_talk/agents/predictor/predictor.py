@@ -1,25 +1,42 @@
+import itertools
+import json
+import logging
 import os
-from typing import Any, Literal
-
-import joblib
-import pandas as pd
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Literal
+
+import numpy as np
+from src.backend.docu_talk.agents.predictor.compact import (
+    BoostedStumps,
+    StumpEnsemble,
+)
+from src.backend.docu_talk.agents.predictor.features import (
+    FeatureSchema,
+    parse_timestamp,
+)
+from src.backend.docu_talk.agents.predictor.rollups import expand_rollup
 from src.backend.docu_talk.database.database import Database
+from src.backend.docu_talk.database.telemetry import get_telemetry_writer
+from src.backend.docu_talk.exceptions import SchemaMismatchError
+from src.backend.utils.misc import atomic_write
 from dotenv import load_dotenv
-from sklearn.ensemble import RandomForestRegressor
+
+if TYPE_CHECKING:
+    from sklearn.ensemble import RandomForestRegressor
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 metrics = [
     "create_chatbot_duration",
     "ask_chatbot_duration",
-    "ask_chatbot_token_count"
+    "ask_chatbot_token_count",
+    "ask_chatbot_ttft"
 ]
 
-models = {}
-for metric in metrics:
-    path = os.path.join(os.path.dirname(__file__), "models", f"{metric}.pickle")
-    models[metric] = joblib.load(path)
-
 class Predictor:
     """
     A class to manage metrics logging, preprocessing, training, and predictions
@@ -29,10 +46,36 @@ class Predictor:
     metric_tables = {
         "create_chatbot_duration": "CreateChatbotDurations",
         "ask_chatbot_duration": "AskChatbotDurations",
-        "ask_chatbot_token_count": "AskChatbotTokenCounts"
+        "ask_chatbot_token_count": "AskChatbotTokenCounts",
+        "ask_chatbot_ttft": "AskChatbotTTFTs"
     }
 
-    models: dict[str, RandomForestRegressor] = models
+    # The quantiles predicted by the compact models
+    quantiles = {"p50": 0.5, "p90": 0.9}
+
+    models_folder = os.getenv(
+        "PREDICTOR_MODELS_DIR",
+        os.path.join(os.path.dirname(__file__), "models")
+    )
+
+    # Models are loaded on first use, with the feature schema they were trained
+    # with. Compact models (.npz) are preferred, the pickled random forests (slow to
+    # import and to evaluate) are a fallback.
+    models: dict[str, "StumpEnsemble | RandomForestRegressor"] = {}
+    schemas: dict[str, FeatureSchema] = {}
+    versions: dict[str, dict] = {}
+    models_lock = threading.Lock()
+
+    # The compact models of several metrics compiled together, with the models they
+    # were compiled from: kept alive, so that a reloaded model cannot reuse the id
+    # of a replaced one
+    stack: tuple[dict[str, StumpEnsemble], StumpEnsemble | None] = ({}, None)
+
+    # The artefacts are checked for changes at most every `reload_interval`
+    # seconds, and reloaded when a training job replaced them
+    reload_interval = float(os.getenv("PREDICTOR_RELOAD_INTERVAL", "60"))
+    artefact_mtimes: dict[str, tuple] = {}
+    checked_at: dict[str, float] = {}
 
     def __init__(self) -> None:
         """
@@ -44,19 +87,295 @@ class Predictor:
             database_name=os.getenv("MONGO_DB_NAME")
         )
 
+        self.telemetry = get_telemetry_writer(self.db)
+
+    @classmethod
+    def read_artefact(
+            cls,
+            metric: Literal[
+                "create_chatbot_duration",
+                "ask_chatbot_duration",
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ],
+            extensions: tuple[str, ...] = ("npz", "pickle")
+        ) -> tuple["StumpEnsemble | RandomForestRegressor", FeatureSchema, dict]:
+        """
+        Reads the artefact of a metric and checks it against its feature schema.
+        The compact model is tried first, then the pickled random forest. An
+        artefact that does not match the schema is refused.
+
+        Parameters
+        ----------
+        metric : Literal
+            The metric of the model.
+        extensions : tuple of str, optional
+            The artefact formats to try, in order (default is ("npz", "pickle")).
+
+        Returns
+        -------
+        tuple
+            The model, its feature schema and its version stamp.
+
+        Raises
+        ------
+        SchemaMismatchError
+            If no artefact of the metric matches its schema.
+        """
+
+        schema_path = os.path.join(cls.models_folder, f"{metric}.schema.json")
+        errors = []
+
+        for extension in extensions:
+
+            path = os.path.join(cls.models_folder, f"{metric}.{extension}")
+            if not os.path.exists(path):
+                continue
+
+            try:
+                if extension == "npz":
+                    with np.load(path) as arrays:
+                        model = StumpEnsemble.from_arrays(arrays)
+                        version = {
+                            key: arrays[key].item() if key in arrays else None
+                            for key in ("schema_fingerprint", "trained_at")
+                        }
+                    n_features = model.n_features
+                else:
+                    import joblib
+
+                    artefact = joblib.load(path)
+                    if isinstance(artefact, dict):
+                        model = artefact.pop("model")
+                        version = artefact
+                    else:
+                        model = artefact
+                        version = {"schema_fingerprint": None, "trained_at": None}
+                    n_features = model.n_features_in_
+
+                if version["schema_fingerprint"] is None:
+                    if extension == "npz":
+                        raise SchemaMismatchError("The artefact has no schema")
+                    logger.warning(f"`{path}` has no schema, using the legacy one")
+                    schema = FeatureSchema.legacy()
+                else:
+                    schema = FeatureSchema.load(schema_path)
+
+                schema.validate(version["schema_fingerprint"], n_features)
+
+            except (SchemaMismatchError, FileNotFoundError, KeyError) as e:
+                logger.warning(f"Refusing to load `{path}`: {e}")
+                errors.append(f"{extension}: {e}")
+                continue
+
+            return model, schema, version
+
+        raise SchemaMismatchError(
+            f"No valid artefact for `{metric}` ({'; '.join(errors) or 'none found'})"
+        )
+
+    @classmethod
+    def get_model(
+            cls,
+            metric: Literal[
+                "create_chatbot_duration",
+                "ask_chatbot_duration",
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ]
+        ) -> "StumpEnsemble | RandomForestRegressor":
+        """
+        Returns the model of a metric, loading it (and its feature schema) on first
+        use.
+
+        Parameters
+        ----------
+        metric : Literal
+            The metric of the model.
+
+        Returns
+        -------
+        StumpEnsemble or RandomForestRegressor
+            The trained model.
+        """
+
+        if metric not in cls.models:
+            with cls.models_lock:
+                if metric not in cls.models:
+                    mtimes = cls.get_artefact_mtimes(metric)
+                    model, schema, version = cls.read_artefact(metric)
+                    cls.schemas[metric] = schema
+                    cls.versions[metric] = version
+                    cls.models[metric] = model
+                    cls.artefact_mtimes[metric] = mtimes
+                    cls.checked_at[metric] = time.monotonic()
+        elif time.monotonic() - cls.checked_at.get(metric, 0) > cls.reload_interval:
+            cls.reload_model(metric)
+
+        return cls.models[metric]
+
+    def save_artefact(
+            self,
+            metric: Literal[
+                "create_chatbot_duration",
+                "ask_chatbot_duration",
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ],
+            model: "StumpEnsemble | RandomForestRegressor",
+            schema: FeatureSchema
+        ) -> None:
+        """
+        Saves a trained model with its feature schema, stamped with the schema
+        fingerprint and the training date, and serves it. Each file is replaced
+        atomically, so that serving processes never read a partial artefact.
+
+        Parameters
+        ----------
+        metric : Literal
+            The metric of the model.
+        model : StumpEnsemble or RandomForestRegressor
+            The trained model.
+        schema : FeatureSchema
+            The schema the model was trained with.
+        """
+
+        version = {
+            "schema_fingerprint": schema.fingerprint,
+            "trained_at": datetime.now().isoformat(timespec="seconds")
+        }
+
+        os.makedirs(self.models_folder, exist_ok=True)
+
+        schema.save(os.path.join(self.models_folder, f"{metric}.schema.json"))
+
+        if isinstance(model, StumpEnsemble):
+            path = os.path.join(self.models_folder, f"{metric}.npz")
+            with atomic_write(path, mode="wb") as f:
+                np.savez(
+                    f,
+                    **model.to_arrays(),
+                    **{key: np.array(value) for key, value in version.items()}
+                )
+        else:
+            import joblib
+
+            path = os.path.join(self.models_folder, f"{metric}.pickle")
+            with atomic_write(path, mode="wb") as f:
+                joblib.dump({"model": model, **version}, f)
+
+        with self.models_lock:
+            self.schemas[metric] = schema
+            self.versions[metric] = version
+            self.models[metric] = model
+            self.artefact_mtimes[metric] = self.get_artefact_mtimes(metric)
+            self.checked_at[metric] = time.monotonic()
+
+    @classmethod
+    def get_artefact_mtimes(
+            cls,
+            metric: Literal[
+                "create_chatbot_duration",
+                "ask_chatbot_duration",
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ]
+        ) -> tuple:
+        """
+        Returns the modification times of the artefact files of a metric.
+
+        Parameters
+        ----------
+        metric : Literal
+            The metric of the model.
+
+        Returns
+        -------
+        tuple
+            The modification time of each file (None if missing).
+        """
+
+        mtimes = []
+        for extension in ("npz", "pickle", "schema.json"):
+            path = os.path.join(cls.models_folder, f"{metric}.{extension}")
+            mtimes.append(os.path.getmtime(path) if os.path.exists(path) else None)
+
+        return tuple(mtimes)
+
+    @classmethod
+    def reload_model(
+            cls,
+            metric: Literal[
+                "create_chatbot_duration",
+                "ask_chatbot_duration",
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ]
+        ) -> bool:
+        """
+        Reloads the model of a metric if its artefact files changed. While a new
+        artefact is only partly written (its schema does not match yet), the current
+        model keeps being served and the reload is retried at the next check.
+
+        Parameters
+        ----------
+        metric : Literal
+            The metric of the model.
+
+        Returns
+        -------
+        bool
+            True if a new model was loaded.
+        """
+
+        with cls.models_lock:
+            if time.monotonic() - cls.checked_at.get(metric, 0) <= cls.reload_interval:
+                return False
+            cls.checked_at[metric] = time.monotonic()
+
+        mtimes = cls.get_artefact_mtimes(metric)
+        if mtimes == cls.artefact_mtimes.get(metric):
+            return False
+
+        try:
+            model, schema, version = cls.read_artefact(metric)
+        except SchemaMismatchError as e:
+            logger.warning(f"Keeping the current `{metric}` model: {e}")
+            return False
+
+        with cls.models_lock:
+            cls.schemas[metric] = schema
+            cls.versions[metric] = version
+            cls.models[metric] = model
+            cls.artefact_mtimes[metric] = mtimes
+
+        logger.info(f"Reloaded the `{metric}` model trained at {version['trained_at']}")
+
+        return True
+
+    @classmethod
+    def load_models(cls) -> None:
+        """
+        Loads the models of all the metrics.
+        """
+
+        for metric in metrics:
+            cls.get_model(metric)
+
     def log_metric(
             self,
             metric: Literal[
                 "create_chatbot_duration",
                 "ask_chatbot_duration",
-                "ask_chatbot_token_count"
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
             ],
             value: Any,
             features: dict,
             metadata: dict | None = None
         ) -> None:
         """
-        Logs a metric to the database.
+        Logs a metric to the database, through the buffered telemetry writer.
 
         Parameters
         ----------
@@ -80,7 +399,7 @@ class Predictor:
 
         data.update(features)
 
-        self.db.insert_data(
+        self.telemetry.write(
             table=self.metric_tables[metric],
             data=data
         )
@@ -128,10 +447,12 @@ class Predictor:
             nb_documents: int,
             total_pages: int,
             model: str,
-            chatbot_id: str
+            chatbot_id: str,
+            ttft: float | None = None
         ) -> None:
         """
-        Logs the 'ask_chatbot_duration' and 'ask_chatbot_token_count' metrics.
+        Logs the 'ask_chatbot_duration', 'ask_chatbot_token_count' and
+        'ask_chatbot_ttft' metrics.
 
         Parameters
         ----------
@@ -147,6 +468,9 @@ class Predictor:
             The model used.
         chatbot_id : str
             The unique identifier of the chatbot.
+        ttft : float or None, optional
+            The time to the first streamed token, not logged if None (default is
+            None).
         """
 
         self.log_metric(
@@ -171,42 +495,248 @@ class Predictor:
             metadata={"chatbot_id": chatbot_id}
         )
 
-    def preprocess(
+        if ttft is not None:
+            self.log_metric(
+                metric="ask_chatbot_ttft",
+                value=ttft,
+                features={
+                    "nb_documents": nb_documents,
+                    "total_pages": total_pages,
+                    "model": model
+                },
+                metadata={"chatbot_id": chatbot_id}
+            )
+
+    def export_data(
             self,
-            data: list
-        ) -> pd.DataFrame:
+            metric: Literal[
+                "create_chatbot_duration",
+                "ask_chatbot_duration",
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ],
+            path: str
+        ) -> int:
+        """
+        Exports the records of a metric table to a JSON Lines file.
+
+        Parameters
+        ----------
+        metric : Literal
+            The metric to export.
+        path : str
+            The destination file.
+
+        Returns
+        -------
+        int
+            The number of exported records.
+        """
+
+        data = self.db.get_data(table=self.metric_tables[metric])
+
+        with open(path, "w") as f:
+            for record in data:
+                record.pop("_id", None)
+                f.write(json.dumps(record, default=str) + "\n")
+
+        return len(data)
+
+    def get_training_set(
+            self,
+            metric: Literal[
+                "create_chatbot_duration",
+                "ask_chatbot_duration",
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ],
+            data: list | None = None,
+            window_weeks: float | None = None,
+            half_life_days: float | None = None,
+            batch_size: int = 1000,
+            raw_days: float | None = None
+        ) -> tuple[FeatureSchema, np.ndarray, np.ndarray, np.ndarray]:
         """
-        Preprocesses data for model training or prediction.
+        Builds the training set of a metric. The metric table is streamed in
+        batches that are encoded as they arrive, so that only the feature matrix is
+        held in memory. With `raw_days`, the days older than the raw retention are
+        read from the daily rollups (`MetricRollups`) instead.
 
         Parameters
         ----------
-        data : list
-            A list of data records to preprocess.
+        metric : Literal
+            The metric to train a model.
+        data : list or None, optional
+            The training records (default is the metric table).
+        window_weeks : float or None, optional
+            Only the records of the last weeks are used (default is all of them).
+        half_life_days : float or None, optional
+            The age at which a record weighs half as much as a new one (default is
+            no decay).
+        batch_size : int, optional
+            The number of records fetched per batch (default is 1000).
+        raw_days : float or None, optional
+            Raw records are only read for the last days, older days are read from
+            the rollups (default is raw records only).
 
         Returns
         -------
-        pd.DataFrame
-            A preprocessed pandas DataFrame.
+        tuple
+            The feature schema, the feature matrix, the target values and the sample
+            weights.
+
+        Raises
+        ------
+        ValueError
+            If there is no record to train on.
         """
 
-        df = pd.DataFrame(data)
+        now = datetime.now()
+        filter = {}
+        if window_weeks is not None:
+            filter["timestamp"] = {"$gte": now - timedelta(weeks=window_weeks)}
 
-        for col in ["metadata", "value", "_id", "id"]:
-            if col in df.columns:
-                df = df.drop(columns=[col])
+        if data is not None:
+            data = [
+                d for d in data
+                if window_weeks is None
+                or parse_timestamp(d["timestamp"]) >= filter["timestamp"]["$gte"]
+            ]
+            schema = FeatureSchema.fit(data)
+            batches = [data]
+        else:
+            table = self.metric_tables[metric]
+
+            rollups = []
+            if raw_days is not None:
+
+                cutoff = (now - timedelta(days=raw_days)).replace(
+                    hour=0, minute=0, second=0, microsecond=0
+                )
+
+                rollup_filter = {"metric": metric, "day": {"$lt": cutoff}}
+                if "timestamp" in filter:
+                    start = filter["timestamp"]["$gte"]
+                    rollup_filter["day"]["$gte"] = start.replace(
+                        hour=0, minute=0, second=0, microsecond=0
+                    )
+                    filter["timestamp"]["$gte"] = max(start, cutoff)
+                else:
+                    filter["timestamp"] = {"$gte": cutoff}
+
+                for batch in self.db.iter_data(
+                        table="MetricRollups",
+                        filter=rollup_filter,
+                        batch_size=batch_size
+                    ):
+                    for rollup in batch:
+                        rollups += expand_rollup(rollup)
+
+            model_names = set(self.db.get_distinct(table, "model", filter))
+            model_names |= {r["model"] for r in rollups}
+            schema = FeatureSchema(model_vocabulary=sorted(model_names))
+
+            batches = itertools.chain(
+                [rollups] if len(rollups) > 0 else [],
+                self.db.iter_data(
+                    table=table,
+                    filter=filter,
+                    projection=[
+                        "nb_documents", "total_pages", "model", "timestamp", "value"
+                    ],
+                    batch_size=batch_size
+                )
+            )
+
+        x, y, ages, weights = [], [], [], []
+        for batch in batches:
+            x.append(schema.encode_many(batch))
+            y.append(np.array([d["value"] for d in batch], dtype=float))
+            ages.append(np.array([
+                (now - parse_timestamp(d["timestamp"])).total_seconds() / 86400
+                for d in batch
+            ]))
+            # Records expanded from a rollup weigh their share of its count
+            weights.append(np.array([d.get("weight", 1) for d in batch], dtype=float))
+
+        if sum(len(batch_y) for batch_y in y) == 0:
+            raise ValueError(f"No `{metric}` record to train on")
+
+        x, y, ages = np.concatenate(x), np.concatenate(y), np.concatenate(ages)
+        weights = np.concatenate(weights)
+
+        if half_life_days is not None:
+            weights *= 0.5 ** (np.maximum(ages, 0) / half_life_days)
+
+        return schema, x, y, weights
+
+    def train_compact(
+            self,
+            metric: Literal[
+                "create_chatbot_duration",
+                "ask_chatbot_duration",
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ],
+            data: list | None = None,
+            window_weeks: float | None = None,
+            half_life_days: float | None = None,
+            raw_days: float | None = None
+        ) -> StumpEnsemble:
+        """
+        Trains a compact model (boosted stumps, one head per quantile) for the
+        specified metric and saves it next to the pickled model, where it takes
+        precedence.
 
-        df["model"] = df["model"].astype("category").cat.codes
-        df["timestamp"] = pd.to_datetime(df["timestamp"]).astype(int) / 10**9
+        Parameters
+        ----------
+        metric : Literal
+            The metric to train a model.
+        data : list or None, optional
+            The training records (default is the metric table).
+        window_weeks : float or None, optional
+            Only the records of the last weeks are used (default is all of them).
+        half_life_days : float or None, optional
+            The age at which a record weighs half as much as a new one (default is
+            no decay).
+        raw_days : float or None, optional
+            Raw records are only read for the last days, older days are read from
+            the rollups (default is raw records only).
+
+        Returns
+        -------
+        StumpEnsemble
+            The trained model.
+        """
 
-        return df
+        schema, x, y, weights = self.get_training_set(
+            metric=metric,
+            data=data,
+            window_weeks=window_weeks,
+            half_life_days=half_life_days,
+            raw_days=raw_days
+        )
+
+        model = StumpEnsemble.from_models({
+            head: BoostedStumps(alpha=alpha).fit(x, y, sample_weight=weights)
+            for head, alpha in self.quantiles.items()
+        })
+
+        self.save_artefact(metric=metric, model=model, schema=schema)
+
+        return model
 
     def train(
             self,
             metric: Literal[
                 "create_chatbot_duration",
                 "ask_chatbot_duration",
-                "ask_chatbot_token_count"
-            ]
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
+            ],
+            window_weeks: float | None = None,
+            half_life_days: float | None = None,
+            raw_days: float | None = None
         ) -> None:
         """
         Trains a machine learning model for the specified metric.
@@ -215,30 +745,37 @@ class Predictor:
         ----------
         metric : Literal
             The metric to train a model.
+        window_weeks : float or None, optional
+            Only the records of the last weeks are used (default is all of them).
+        half_life_days : float or None, optional
+            The age at which a record weighs half as much as a new one (default is
+            no decay).
+        raw_days : float or None, optional
+            Raw records are only read for the last days, older days are read from
+            the rollups (default is raw records only).
         """
 
-        data = self.db.get_data(table=self.metric_tables[metric])
+        from sklearn.ensemble import RandomForestRegressor
 
-        x = self.preprocess(data)
-        y = [d["value"] for d in data]
+        schema, x, y, weights = self.get_training_set(
+            metric=metric,
+            window_weeks=window_weeks,
+            half_life_days=half_life_days,
+            raw_days=raw_days
+        )
 
         model = RandomForestRegressor(n_estimators=100, random_state=42)
-        model.fit(x, y)
-
-        model_path = os.path.join(
-            os.path.dirname(__file__),
-            "models",
-            f"{metric}.pickle"
-        )
+        model.fit(x, y, sample_weight=weights)
 
-        joblib.dump(model, model_path)
+        self.save_artefact(metric=metric, model=model, schema=schema)
 
     def predict(
             self,
             metric: Literal[
                 "create_chatbot_duration",
                 "ask_chatbot_duration",
-                "ask_chatbot_token_count"
+                "ask_chatbot_token_count",
+                "ask_chatbot_ttft"
             ],
             data: dict
         ) -> int | float:
@@ -249,28 +786,144 @@ class Predictor:
         ----------
         metric : Literal
             The metric to predict ('create_chatbot_duration', 'ask_chatbot_duration',
-            'ask_chatbot_token_count').
+            'ask_chatbot_token_count', 'ask_chatbot_ttft').
         data : dict
             The input data for prediction.
 
         Returns
         -------
         int or float
-            The predicted value.
+            The predicted value (the median for a compact model, the mean for a
+            random forest).
+        """
+
+        self.get_model(metric)
+
+        # The model and its schema are swapped together by `save_artefact`
+        with self.models_lock:
+            model, schema = self.models[metric], self.schemas[metric]
+
+        x = schema.encode_many([data])
+
+        if isinstance(model, StumpEnsemble):
+            return float(model.predict(x)[0, 0])
+
+        if schema.version == 0:
+            # The legacy forests were fitted on a DataFrame
+            import pandas as pd
+
+            x = pd.DataFrame(x, columns=schema.feature_names)
+
+        prediction = model.predict(x)[0]
+
+        return float(prediction)
+
+    def get_stack(
+            self,
+            ensembles: dict[str, StumpEnsemble]
+        ) -> StumpEnsemble:
+        """
+        Returns the compact models of several metrics compiled together, compiling
+        them again only when one of them changed.
+
+        Parameters
+        ----------
+        ensembles : dict
+            The compact models keyed by metric.
+
+        Returns
+        -------
+        StumpEnsemble
+            The compiled models, whose heads are named "{metric}:{quantile}".
+        """
+
+        compiled, stack = Predictor.stack
+
+        outdated = stack is None or list(compiled) != list(ensembles) or any(
+            compiled[metric] is not ensemble for metric, ensemble in ensembles.items()
+        )
+        if outdated:
+            stack = StumpEnsemble.concat(ensembles)
+            Predictor.stack = (dict(ensembles), stack)
+
+        return stack
+
+    def predict_quantiles(
+            self,
+            data: dict,
+            metrics: list[str] | None = None
+        ) -> dict[str, dict[str, float]]:
         """
+        Predicts the quantiles (p50, p90) of several metrics. The compact models
+        of all the metrics are evaluated in one vectorised call. A random forest
+        (legacy fallback) gives the quantiles of the predictions of its trees.
+
+        Parameters
+        ----------
+        data : dict
+            The input data for prediction.
+        metrics : list of str or None, optional
+            The metrics to predict (default is all of them).
+
+        Returns
+        -------
+        dict
+            The quantiles keyed by metric. A metric without a trained model (e.g.
+            a metric that was just added) is left out.
+        """
+
+        if metrics is None:
+            metrics = list(self.metric_tables)
+
+        for metric in metrics:
+            try:
+                self.get_model(metric)
+            except SchemaMismatchError:
+                continue
+
+        with self.models_lock:
+            artefacts = {
+                metric: (self.models[metric], self.schemas[metric])
+                for metric in metrics if metric in self.models
+            }
+
+        predictions = {}
+
+        ensembles = {
+            metric: model for metric, (model, _) in artefacts.items()
+            if isinstance(model, StumpEnsemble)
+        }
+        if len(ensembles) > 0:
+
+            stack = self.get_stack(ensembles)
+            x = np.concatenate(
+                [artefacts[metric][1].encode(data) for metric in ensembles]
+            )
+
+            for head, value in zip(stack.heads, stack.predict(x)[0], strict=True):
+                metric, quantile = head.split(":")
+                predictions.setdefault(metric, {})[quantile] = float(value)
 
-        model = self.models[metric]
+        for metric, (model, schema) in artefacts.items():
 
-        x = self.preprocess([data])
+            if metric in ensembles:
+                continue
 
-        predictions = model.predict(X=x)
+            x = schema.encode_many([data])
+            trees = np.array([tree.predict(x)[0] for tree in model.estimators_])
 
-        prediction = predictions[0]
+            predictions[metric] = {
+                quantile: float(np.quantile(trees, alpha))
+                for quantile, alpha in self.quantiles.items()
+            }
 
-        return prediction
+        return predictions
 
 if __name__ == "__main__":
 
     predictor = Predictor()
     for metric in metrics:
-        predictor.train(metric=metric)
+        try:
+            predictor.train_compact(metric=metric)
+        except ValueError as e:
+            print(e)
@@ -0,0 +1,122 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import numpy as np
+from src.backend.docu_talk.agents.predictor.features import (
+    DOCUMENT_BUCKETS,
+    PAGE_BUCKETS,
+    parse_timestamp,
+)
+
+# The quantiles of the values kept by a rollup. A rollup is expanded back into
+# one training record per quantile, each weighing an equal share of the count.
+ROLLUP_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+def get_rollup_key(data: dict) -> tuple[str, int, int]:
+    """
+    Returns the group of a raw metric record.
+
+    Parameters
+    ----------
+    data : dict
+        The record (nb_documents, total_pages, model).
+
+    Returns
+    -------
+    tuple
+        The model, document bucket and page bucket.
+    """
+
+    return (
+        data["model"],
+        bisect_left(DOCUMENT_BUCKETS, data["nb_documents"]),
+        bisect_left(PAGE_BUCKETS, data["total_pages"])
+    )
+
+def rollup_day(
+        metric: str,
+        day: datetime,
+        data: list[dict]
+    ) -> list[dict]:
+    """
+    Downsamples the raw records of one day into one aggregate per model, document
+    bucket and page bucket.
+
+    Parameters
+    ----------
+    metric : str
+        The metric of the records.
+    day : datetime
+        The day of the records (midnight).
+    data : list of dict
+        The raw records of the day.
+
+    Returns
+    -------
+    list of dict
+        The rollups, as `MetricRollups` records.
+    """
+
+    groups: dict[tuple, list[dict]] = {}
+    for d in data:
+        groups.setdefault(get_rollup_key(d), []).append(d)
+
+    rollups = []
+    for (model, document_bucket, page_bucket), records in sorted(groups.items()):
+
+        values = np.array([r["value"] for r in records], dtype=float)
+
+        rollups.append(
+            {
+                "metric": metric,
+                "day": day,
+                "model": model,
+                "document_bucket": document_bucket,
+                "page_bucket": page_bucket,
+                "count": len(records),
+                "value_mean": float(values.mean()),
+                "value_min": float(values.min()),
+                "value_max": float(values.max()),
+                "value_quantiles": [
+                    float(q) for q in np.quantile(values, ROLLUP_QUANTILES)
+                ],
+                "nb_documents_mean": float(
+                    np.mean([r["nb_documents"] for r in records])
+                ),
+                "total_pages_mean": float(np.mean([r["total_pages"] for r in records]))
+            }
+        )
+
+    return rollups
+
+def expand_rollup(rollup: dict) -> list[dict]:
+    """
+    Expands a rollup into weighted training records, one per kept quantile.
+
+    Parameters
+    ----------
+    rollup : dict
+        The `MetricRollups` record.
+
+    Returns
+    -------
+    list of dict
+        The training records, with a `weight` field. They are timestamped at noon
+        of the rollup day.
+    """
+
+    weight = rollup["count"] / len(rollup["value_quantiles"])
+    timestamp = parse_timestamp(rollup["day"]) + timedelta(hours=12)
+
+    return [
+        {
+            "nb_documents": round(rollup["nb_documents_mean"]),
+            "total_pages": round(rollup["total_pages_mean"]),
+            "model": rollup["model"],
+            "timestamp": timestamp,
+            "value": value,
+            "weight": weight
+        }
+        for value in rollup["value_quantiles"]
+    ]
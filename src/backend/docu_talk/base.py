@@ -11,3 +11,4 @@ class ChatBot:
     suggested_prompts: list
     access: str
     service: ChatBotService
+    version: int = 0
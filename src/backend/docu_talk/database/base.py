@@ -26,6 +26,9 @@ class Usage(BaseModel):
     unit: str
     qty: int
     price: float
+    input_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
 
 class ServiceModels(BaseModel):
     __tablename__ = "ServiceModels"
@@ -35,6 +38,8 @@ class ServiceModels(BaseModel):
     name: str
     unit: str
     price_per_unit: float
+    aliases: list[str] = []
+    prices: dict[str, float] = {}
 
 class Chatbot(BaseModel):
     __tablename__ = "Chatbots"
@@ -80,6 +85,35 @@ class AskChatbotTokenCount(BaseModel):
     model: str
     metadata: dict
 
+class AskChatbotTTFT(BaseModel):
+    __tablename__ = "AskChatbotTTFTs"
+
+    id: str
+    timestamp: datetime
+    value: float
+    nb_documents: int
+    total_pages: int
+    model: str
+    metadata: dict
+
+class MetricRollup(BaseModel):
+    __tablename__ = "MetricRollups"
+
+    id: str
+    timestamp: datetime
+    metric: str
+    day: datetime
+    model: str
+    document_bucket: int
+    page_bucket: int
+    count: int
+    value_mean: float
+    value_min: float
+    value_max: float
+    value_quantiles: list[float]
+    nb_documents_mean: float
+    total_pages_mean: float
+
 class Document(BaseModel):
     __tablename__ = "Documents"
 
@@ -100,6 +134,16 @@ class SuggestedPrompt(BaseModel):
     chatbot_id: str
     prompt: str
 
+class ConversationMessage(BaseModel):
+    __tablename__ = "Conversations"
+
+    id: str
+    timestamp: datetime
+    user_id: str
+    chatbot_id: str
+    role: Literal["user", "assistant", "reset"]
+    content: str
+
 class Access(BaseModel):
     __tablename__ = "Access"
 
@@ -108,3 +152,44 @@ class Access(BaseModel):
     chatbot_id: str
     user_id: str
     role: str
+
+class Job(BaseModel):
+    __tablename__ = "Jobs"
+
+    id: str
+    timestamp: datetime
+    kind: str
+    created_by: str
+    status: Literal["pending", "running", "done", "failed"]
+    params: dict
+    state: dict = {}
+    stage: Optional[str] = None
+    stage_started_at: Optional[datetime] = None
+    stages_done: list[str] = []
+    work_duration: float = 0.0
+    attempts: int = 0
+    available_at: datetime
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class OutboxEmail(BaseModel):
+    __tablename__ = "Outbox"
+
+    id: str
+    timestamp: datetime
+    template: str
+    sender: str
+    recipient: str
+    bcc_recipient: Optional[str] = None
+    data: dict
+    status: Literal["pending", "sending", "sent", "failed"]
+    attempts: int = 0
+    available_at: datetime
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    sent_at: Optional[datetime] = None
+    message_id: Optional[str] = None
+    error: Optional[str] = None
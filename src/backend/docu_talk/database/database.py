@@ -1,3 +1,4 @@
+from collections.abc import Iterator
 from datetime import datetime
 from typing import Union
 
@@ -5,14 +6,20 @@ from src.backend.docu_talk.database.base import (
     Access,
     AskChatbotDuration,
     AskChatbotTokenCount,
+    AskChatbotTTFT,
     Chatbot,
+    ConversationMessage,
     CreateChatbotDuration,
     Document,
+    Job,
+    MetricRollup,
+    OutboxEmail,
     ServiceModels,
     SuggestedPrompt,
     Usage,
     User,
 )
+from src.backend.docu_talk.database.profiler import get_profiler
 from pymongo import MongoClient
 
 
@@ -29,9 +36,14 @@ class Database:
         Document,
         Access,
         SuggestedPrompt,
+        ConversationMessage,
+        Job,
+        OutboxEmail,
         CreateChatbotDuration,
         AskChatbotDuration,
-        AskChatbotTokenCount
+        AskChatbotTokenCount,
+        AskChatbotTTFT,
+        MetricRollup
     ]
 
     def __init__(
@@ -53,9 +65,19 @@ class Database:
         self.uri = uri
         self.database_name = database_name
 
-        self.client = MongoClient(self.uri, uuidRepresentation="standard")
+        profiler = get_profiler()
+        event_listeners = [profiler] if profiler is not None else []
+
+        self.client = MongoClient(
+            self.uri,
+            uuidRepresentation="standard",
+            event_listeners=event_listeners
+        )
         self.database = self.client[self.database_name]
 
+        if profiler is not None:
+            profiler.attach(self.client)
+
     def disconnect(self) -> None:
         """
         Closes the database connection.
@@ -94,6 +116,66 @@ class Database:
         for collection in collections:
             self.database[collection].drop()
 
+    def ensure_ttl_index(
+            self,
+            table: str,
+            expire_after_seconds: int,
+            column: str = "timestamp"
+        ) -> None:
+        """
+        Makes the records of a table expire a given time after their timestamp,
+        creating the TTL index or updating its expiry.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table (collection).
+        expire_after_seconds : int
+            The lifetime of a record in seconds.
+        column : str, optional
+            The date column the lifetime is counted from (default is "timestamp").
+        """
+
+        name = f"{column}_ttl"
+        indexes = self.database[table].index_information()
+
+        if name in indexes:
+            if indexes[name].get("expireAfterSeconds") != expire_after_seconds:
+                self.database.command(
+                    "collMod",
+                    table,
+                    index={"name": name, "expireAfterSeconds": expire_after_seconds}
+                )
+        else:
+            self.database[table].create_index(
+                [(column, 1)],
+                name=name,
+                expireAfterSeconds=expire_after_seconds
+            )
+
+    def ensure_index(
+            self,
+            table: str,
+            columns: list[tuple[str, int]]
+        ) -> None:
+        """
+        Creates an index on a table if it does not exist, once per process.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table (collection).
+        columns : list of tuple
+            The indexed columns and their directions (1 or -1).
+        """
+
+        key = (self.uri, self.database_name, table, tuple(columns))
+        if key in created_indexes:
+            return
+
+        self.database[table].create_index(columns)
+        created_indexes.add(key)
+
     def insert_data(
             self,
             table: str,
@@ -129,6 +211,41 @@ class Database:
 
         return data["id"]
 
+    def insert_many(
+            self,
+            table: str,
+            data: list[dict]
+        ) -> list[str]:
+        """
+        Inserts several records into the specified table in one round trip and
+        returns their IDs. Records already stamped (e.g. when buffered) keep their
+        ID and timestamp.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table (collection) to insert data into.
+        data : list of dict
+            The records to insert.
+
+        Returns
+        -------
+        list of str
+            The IDs of the inserted records.
+        """
+
+        table_class = next(t for t in self.tables if t.__tablename__ == table)
+
+        from uuid import uuid4
+        for record in data:
+            record.setdefault("id", str(uuid4()))
+            record.setdefault("timestamp", datetime.now())
+            table_class(**record)
+
+        self.database[table].insert_many(data, ordered=False)
+
+        return [record["id"] for record in data]
+
     def get_data(
             self,
             table: str,
@@ -165,12 +282,91 @@ class Database:
             cursor = cursor.sort(sort["column"], sort["direction"])
 
         if limit is not None:
-            cursor = cursor.limit(4)
+            cursor = cursor.limit(limit)
 
         documents = list(cursor)
 
         return documents
 
+    def iter_data(
+            self,
+            table: str,
+            filter: dict | None = None,
+            projection: list | None = None,
+            sort: dict | None = None,
+            batch_size: int = 1000
+        ) -> Iterator[list]:
+        """
+        Streams the documents of a table in batches, so that a large table is never
+        held in memory at once.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table (collection) to retrieve data from.
+        filter : dict or None, optional
+            The filter criteria for retrieving data.
+        projection : list or None, optional
+            The fields to retrieve (default is all the fields).
+        sort : dict or None, optional
+            The sort criteria, including column and direction (default is None).
+        batch_size : int, optional
+            The number of documents per batch (default is 1000).
+
+        Yields
+        ------
+        list
+            A batch of documents matching the criteria.
+        """
+
+        if filter is None:
+            filter = {}
+
+        cursor = self.database[table].find(
+            filter,
+            projection=projection,
+            batch_size=batch_size
+        )
+
+        if sort is not None:
+            cursor = cursor.sort(sort["column"], sort["direction"])
+
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if len(batch) > 0:
+            yield batch
+
+    def get_distinct(
+            self,
+            table: str,
+            column: str,
+            filter: dict | None = None
+        ) -> list:
+        """
+        Retrieves the distinct values of a column.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table (collection).
+        column : str
+            The column.
+        filter : dict or None, optional
+            The filter criteria for the documents considered.
+
+        Returns
+        -------
+        list
+            The distinct values.
+        """
+
+        return self.database[table].distinct(column, filter or {})
+
     def update_data(
             self,
             table: str,
@@ -227,3 +423,6 @@ class Database:
         result = self.database[table].delete_many(filter)
 
         return result
+
+# The indexes already ensured by this process
+created_indexes: set[tuple] = set()
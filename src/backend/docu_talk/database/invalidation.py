@@ -0,0 +1,439 @@
+import inspect
+import logging
+import os
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Callable, Literal
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# The tables whose changes invalidate in-process caches
+WATCHED_TABLES = [
+    "Chatbots",
+    "Access",
+    "Documents",
+    "SuggestedPrompts",
+    "Users",
+    "ServiceModels"
+]
+
+# Change streams need a replica set (or a sharded cluster)
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+# The resume token is too old or unusable, the changes in between are lost
+RESUME_FAILED = {260, 280, 286}
+
+# The pre-images of deleted records are not supported (MongoDB < 6.0): the option
+# is an unknown field of the $changeStream stage
+PRE_IMAGES_UNSUPPORTED = {9, 40415}
+
+
+@dataclass(frozen=True)
+class InvalidationEvent:
+    """
+    A change of a watched table. `document` holds the fields of the changed record
+    when they are known (the new version, or the previous one for a deletion);
+    without it, a cache drops everything it holds from the table. A "resync" event
+    means that changes may have been missed.
+    """
+
+    table: str
+    operation: Literal["insert", "update", "replace", "delete", "resync"]
+    document: dict | None = None
+
+    def get(self, key: str):
+        """
+        Returns a field of the changed record.
+
+        Parameters
+        ----------
+        key : str
+            The field.
+
+        Returns
+        -------
+        Any
+            The value, or None if the record is unknown.
+        """
+
+        if self.document is None:
+            return None
+
+        return self.document.get(key)
+
+class InvalidationBus:
+    """
+    Publishes the changes of the watched tables, made by any instance, to the
+    in-process caches that subscribed to them.
+
+    The bus tails a change stream of the database from a background thread, and
+    resumes it from the last resume token after a disconnection. When the token is
+    lost, a "resync" event is published for every table. Deletions come with the
+    deleted record when the server keeps pre-images (MongoDB 6.0 or later), and
+    without it otherwise. Without change streams (a standalone mongod), it polls
+    the hashes of the tables instead, and publishes a "resync" event for each table
+    that changed.
+    """
+
+    def __init__(
+            self,
+            db,
+            tables: list[str] | None = None,
+            poll_interval: float = 5.0,
+            max_backoff: float = 30.0
+        ) -> None:
+        """
+        Initializes the bus. It is started by `start`.
+
+        Parameters
+        ----------
+        db : Database
+            The database to watch.
+        tables : list of str or None, optional
+            The watched tables (default is None, `WATCHED_TABLES`).
+        poll_interval : float, optional
+            The interval between two polls in seconds, without change streams
+            (default is 5).
+        max_backoff : float, optional
+            The maximum wait before reconnecting in seconds (default is 30).
+        """
+
+        self.db = db
+        self.tables = tables or list(WATCHED_TABLES)
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+
+        self.subscriptions: list[tuple[set[str], Callable]] = []
+        self.lock = threading.Lock()
+
+        self.resume_token: dict | None = None
+        self.pre_images = True
+        self.mode: Literal["change_stream", "polling"] | None = None
+
+        # The number of failures since the last successful connection
+        self.nb_failures = 0
+
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def subscribe(
+            self,
+            tables: list[str],
+            callback: Callable[[InvalidationEvent], None]
+        ) -> None:
+        """
+        Registers a callback for the changes of some tables. Bound methods are held
+        by weak references, so that subscribing does not keep their object alive.
+        Subscribing the same callback again has no effect.
+
+        Parameters
+        ----------
+        tables : list of str
+            The tables.
+        callback : Callable
+            Called with each event, from the thread of the bus. It must be quick.
+        """
+
+        if inspect.ismethod(callback):
+            reference = weakref.WeakMethod(callback)
+        else:
+            reference = lambda: callback  # noqa: E731
+
+        with self.lock:
+            if any(r() == callback for _, r in self.subscriptions):
+                return
+            self.subscriptions.append((set(tables), reference))
+
+    def publish(self, event: InvalidationEvent) -> None:
+        """
+        Hands an event to the callbacks subscribed to its table. Callbacks whose
+        object was collected are dropped.
+
+        Parameters
+        ----------
+        event : InvalidationEvent
+            The event.
+        """
+
+        with self.lock:
+            self.subscriptions = [
+                (tables, reference) for tables, reference in self.subscriptions
+                if reference() is not None
+            ]
+            callbacks = [
+                reference() for tables, reference in self.subscriptions
+                if event.table in tables
+            ]
+
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                logger.warning(f"Invalidation callback failed on {event}: {e}")
+
+    def resync(self) -> None:
+        """
+        Publishes a "resync" event for every watched table.
+        """
+
+        for table in self.tables:
+            self.publish(InvalidationEvent(table=table, operation="resync"))
+
+    def supports_change_streams(self) -> bool:
+        """
+        Checks whether the server is a replica set member or a mongos.
+
+        Returns
+        -------
+        bool
+            True if change streams are supported.
+        """
+
+        hello = self.db.client.admin.command("hello")
+
+        return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+    @staticmethod
+    def to_event(change: dict) -> InvalidationEvent | None:
+        """
+        Converts a change event of MongoDB.
+
+        Parameters
+        ----------
+        change : dict
+            The change event.
+
+        Returns
+        -------
+        InvalidationEvent or None
+            The event, a "resync" one when a table is dropped or renamed, or None
+            for the other operations.
+        """
+
+        operation = change["operationType"]
+
+        if operation in ("drop", "rename"):
+            return InvalidationEvent(table=change["ns"]["coll"], operation="resync")
+        if operation not in ("insert", "update", "replace", "delete"):
+            return None
+
+        if operation == "delete":
+            document = change.get("fullDocumentBeforeChange")
+        else:
+            document = change.get("fullDocument")
+
+        return InvalidationEvent(
+            table=change["ns"]["coll"],
+            operation=operation,
+            document=document
+        )
+
+    def watch(self) -> None:
+        """
+        Tails the change stream of the watched tables until the bus is stopped.
+        """
+
+        pipeline = [{"$match": {"ns.coll": {"$in": self.tables}}}]
+
+        options = {}
+        if self.pre_images:
+            options["full_document_before_change"] = "whenAvailable"
+
+        with self.db.database.watch(
+            pipeline=pipeline,
+            full_document="updateLookup",
+            resume_after=self.resume_token,
+            max_await_time_ms=1000,
+            **options
+        ) as stream:
+
+            self.nb_failures = 0
+
+            while not self.stopped.is_set():
+
+                change = stream.try_next()
+                self.resume_token = stream.resume_token
+
+                if change is None:
+                    continue
+
+                event = self.to_event(change)
+                if event is not None:
+                    self.publish(event)
+
+    def get_hashes(self) -> dict[str, str]:
+        """
+        Hashes the watched tables.
+
+        Returns
+        -------
+        dict
+            The MD5 hash of each table.
+        """
+
+        result = self.db.database.command("dbHash", collections=self.tables)
+
+        return result["collections"]
+
+    def poll(self) -> None:
+        """
+        Compares the hashes of the watched tables every `poll_interval` seconds,
+        until the bus is stopped.
+        """
+
+        hashes = self.get_hashes()
+        self.nb_failures = 0
+
+        while not self.stopped.wait(self.poll_interval):
+
+            new_hashes = self.get_hashes()
+
+            for table in self.tables:
+                if new_hashes.get(table) != hashes.get(table):
+                    self.publish(InvalidationEvent(table=table, operation="resync"))
+
+            hashes = new_hashes
+
+    def recover(self, error: OperationFailure) -> bool:
+        """
+        Adapts the bus to an error of the server that retrying as is would repeat.
+
+        Parameters
+        ----------
+        error : OperationFailure
+            The error.
+
+        Returns
+        -------
+        bool
+            True if the bus can reconnect at once, False otherwise.
+        """
+
+        if error.code == CHANGE_STREAMS_UNSUPPORTED:
+            self.mode = "polling"
+            return True
+
+        if (
+            self.pre_images
+            and error.code in PRE_IMAGES_UNSUPPORTED
+            and "fullDocumentBeforeChange" in str(error)
+        ):
+            logger.info("Pre-images are not supported, watching without them")
+            self.pre_images = False
+            return True
+
+        if error.code in RESUME_FAILED and self.resume_token is not None:
+            logger.warning(f"Change stream cannot resume, resyncing: {error}")
+            self.resume_token = None
+            self.resync()
+            return True
+
+        return False
+
+    def run(self) -> None:
+        """
+        Watches or polls the tables, reconnecting with an exponential backoff, until
+        the bus is stopped.
+        """
+
+        while not self.stopped.is_set():
+
+            try:
+
+                if self.mode is None:
+                    if self.supports_change_streams():
+                        self.mode = "change_stream"
+                    else:
+                        self.mode = "polling"
+                    logger.info(f"Invalidation bus started ({self.mode})")
+
+                if self.mode == "change_stream":
+                    self.watch()
+                else:
+                    self.poll()
+
+                return
+
+            except OperationFailure as e:
+
+                if self.recover(e):
+                    continue
+
+                logger.warning(f"Invalidation bus failed: {e}")
+
+            except PyMongoError as e:
+                logger.warning(f"Invalidation bus disconnected: {e}")
+
+            # Changes may be missed while polling is down
+            if self.mode == "polling":
+                self.resync()
+
+            self.stopped.wait(min(2 ** self.nb_failures, self.max_backoff))
+            self.nb_failures += 1
+
+    def start(self) -> None:
+        """
+        Starts the background thread of the bus.
+        """
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        """
+        Stops the background thread of the bus.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            The maximum time to wait in seconds (default is 5).
+        """
+
+        self.stopped.set()
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+def get_invalidation_bus(db) -> InvalidationBus | None:
+    """
+    Returns the process-wide invalidation bus, created and started on first call
+    with the given database, unless `INVALIDATION_BUS` is "false".
+    `INVALIDATION_POLL_INTERVAL` sets the polling interval without change streams.
+
+    Parameters
+    ----------
+    db : Database
+        The database used when the bus is created.
+
+    Returns
+    -------
+    InvalidationBus or None
+        The bus, or None if it is disabled.
+    """
+
+    global bus
+
+    if os.getenv("INVALIDATION_BUS", "true").lower() == "false":
+        return None
+
+    if bus is None:
+        with bus_lock:
+            if bus is None:
+
+                bus = InvalidationBus(
+                    db=db,
+                    poll_interval=float(os.getenv("INVALIDATION_POLL_INTERVAL", "5"))
+                )
+
+                bus.start()
+
+    return bus
+
+bus: InvalidationBus | None = None
+bus_lock = threading.Lock()
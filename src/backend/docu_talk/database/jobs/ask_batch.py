@@ -0,0 +1,92 @@
+"""
+Answers a questionnaire with a chatbot: each question is asked independently on
+the documents of the chatbot, and the answers are appended to an export as they
+are received. The usages are charged to the given user.
+
+    python src/backend/docu_talk/database/jobs/ask_batch.py questions.txt \\
+        answers.csv --chatbot-id ... --user-id user@example.com
+
+The questions are read one per line, or from the "question" column of a CSV or
+JSON Lines file. The export is a CSV or JSON Lines file (by its extension). Run
+the same command again after a failure: the questions already in the export are
+not asked again.
+"""
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.append(".")
+from src.backend.docu_talk.docu_talk import DocuTalk  # noqa: E402
+from src.backend.utils.file_io import read_records  # noqa: E402
+
+
+def read_questions(path: str) -> list[str]:
+    """
+    Reads the questions of a questionnaire.
+
+    Parameters
+    ----------
+    path : str
+        A text file (one question per line), or a CSV or JSON Lines file with a
+        "question" column.
+
+    Returns
+    -------
+    list of str
+        The questions.
+    """
+
+    if path.endswith((".csv", ".jsonl")):
+        return [record["question"] for record in read_records(path)]
+
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("questions", help="The questionnaire")
+    parser.add_argument("export", help="The CSV or JSON Lines export")
+    parser.add_argument("--chatbot-id", required=True, help="The chatbot to ask")
+    parser.add_argument("--user-id", required=True, help="The user charged")
+    parser.add_argument(
+        "--model",
+        default=os.getenv("DEFAULT_MODEL", "gemini-1.5-flash-002"),
+        help="The model (default is DEFAULT_MODEL or gemini-1.5-flash-002)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="The maximum number of questions in flight (default is 4)"
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    docu_talk = DocuTalk()
+
+    results = docu_talk.ask_batch(
+        user_id=args.user_id,
+        chatbot_id=args.chatbot_id,
+        questions=read_questions(args.questions),
+        model=args.model,
+        concurrency=args.concurrency,
+        export_path=args.export
+    )
+
+    docu_talk.telemetry.flush()
+
+    nb_failed = sum("error" in result for result in results)
+    print(
+        f"{len(results) - nb_failed}/{len(results)} questions answered in "
+        f"`{args.export}`" + (f", run again to retry {nb_failed}" if nb_failed else "")
+    )
+
+    sys.exit(1 if nb_failed else 0)
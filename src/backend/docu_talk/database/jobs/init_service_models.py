@@ -31,4 +31,9 @@ if __name__ == "__main__":
 
         ServiceModels(**model)
 
-        database["ServiceModels"].insert_one(model)
+        # Prices are updated in place when the job runs again
+        database["ServiceModels"].replace_one(
+            filter={"name": model["name"]},
+            replacement=model,
+            upsert=True
+        )
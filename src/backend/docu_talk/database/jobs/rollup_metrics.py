@@ -0,0 +1,160 @@
+"""
+Applies the retention of the metric tables and keeps daily rollups of them.
+
+* Raw metric records expire `METRICS_RETENTION_DAYS` days (default is 90) after
+  their timestamp, through TTL indexes.
+* Each complete day that is not rolled up yet is downsampled into `MetricRollups`
+  (one aggregate per model, document bucket, page bucket and day), which are
+  kept and read by the training pipeline for the days older than the raw
+  retention.
+
+Run it daily, at least once every `METRICS_RETENTION_DAYS - 1` days so that no
+day expires before it is rolled up:
+
+    python src/backend/docu_talk/database/jobs/rollup_metrics.py
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+sys.path.append(".")
+from src.backend.docu_talk.agents.predictor.predictor import Predictor  # noqa: E402
+from src.backend.docu_talk.agents.predictor.rollups import rollup_day  # noqa: E402
+from src.backend.docu_talk.database.database import Database  # noqa: E402
+
+
+def get_start_day(
+        db: Database,
+        metric: str,
+        table: str
+    ) -> datetime | None:
+    """
+    Returns the first day of a metric that is not rolled up yet.
+
+    Parameters
+    ----------
+    db : Database
+        The database.
+    metric : str
+        The metric.
+    table : str
+        The raw table of the metric.
+
+    Returns
+    -------
+    datetime or None
+        The day (midnight), or None if the table is empty.
+    """
+
+    last_rollup = db.get_data(
+        table="MetricRollups",
+        filter={"metric": metric},
+        sort={"column": "day", "direction": -1},
+        limit=1
+    )
+    if len(last_rollup) > 0:
+        return last_rollup[0]["day"] + timedelta(days=1)
+
+    first_record = db.get_data(
+        table=table,
+        sort={"column": "timestamp", "direction": 1},
+        limit=1
+    )
+    if len(first_record) > 0:
+        return first_record[0]["timestamp"].replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+
+    return None
+
+def rollup_metric(
+        db: Database,
+        metric: str,
+        table: str,
+        until: datetime
+    ) -> int:
+    """
+    Rolls up the complete days of a metric that are not rolled up yet. The raw
+    records are streamed in timestamp order, one day at a time.
+
+    Parameters
+    ----------
+    db : Database
+        The database.
+    metric : str
+        The metric.
+    table : str
+        The raw table of the metric.
+    until : datetime
+        The end of the last complete day (exclusive).
+
+    Returns
+    -------
+    int
+        The number of days rolled up.
+    """
+
+    start = get_start_day(db, metric, table)
+    if start is None or start >= until:
+        return 0
+
+    def save(day: datetime, records: list[dict]) -> None:
+        # Idempotent: a day rolled up again replaces its previous rollups
+        db.delete_data(table="MetricRollups", filter={"metric": metric, "day": day})
+        db.insert_many(table="MetricRollups", data=rollup_day(metric, day, records))
+
+    nb_days = 0
+    day, records = None, []
+    for batch in db.iter_data(
+            table=table,
+            filter={"timestamp": {"$gte": start, "$lt": until}},
+            projection=["nb_documents", "total_pages", "model", "timestamp", "value"],
+            sort={"column": "timestamp", "direction": 1}
+        ):
+        for record in batch:
+
+            record_day = record["timestamp"].replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+            if record_day != day:
+                if len(records) > 0:
+                    save(day, records)
+                    nb_days += 1
+                day, records = record_day, []
+
+            records.append(record)
+
+    if len(records) > 0:
+        save(day, records)
+        nb_days += 1
+
+    return nb_days
+
+if __name__ == "__main__":
+
+    load_dotenv()
+
+    db = Database(
+        uri=os.getenv("MONGO_DB_URI"),
+        database_name=os.getenv("MONGO_DB_NAME")
+    )
+
+    retention_days = float(os.getenv("METRICS_RETENTION_DAYS", "90"))
+    until = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    for metric, table in Predictor.metric_tables.items():
+
+        nb_days = rollup_metric(db=db, metric=metric, table=table, until=until)
+
+        db.ensure_ttl_index(
+            table=table,
+            expire_after_seconds=int(retention_days * 86400)
+        )
+
+        print(
+            f"`{table}`: {nb_days} days rolled up, raw records expire after "
+            f"{retention_days:g} days"
+        )
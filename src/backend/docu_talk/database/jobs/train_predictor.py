@@ -0,0 +1,130 @@
+"""
+Retrains the predictor models on the latest metrics.
+
+The metric tables are streamed in batches and the models are refitted on a
+sliding window, where older records weigh less. When `METRICS_RETENTION_DAYS` is
+set, the days older than the raw retention are read from the daily rollups (see
+`rollup_metrics.py`). The artefacts are replaced atomically, and the serving
+processes pick them up without a restart (see `Predictor.reload_model`), provided
+they share `PREDICTOR_MODELS_DIR`.
+
+Run it once (e.g. from a Cloud Run job triggered by Cloud Scheduler):
+
+    python src/backend/docu_talk/database/jobs/train_predictor.py
+
+or as a long-running scheduler:
+
+    python src/backend/docu_talk/database/jobs/train_predictor.py --every 360
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(".")
+from src.backend.docu_talk.agents.predictor.predictor import (  # noqa: E402
+    Predictor,
+    metrics,
+)
+
+
+def train_all(
+        predictor: Predictor,
+        backend: str,
+        window_weeks: float | None,
+        half_life_days: float | None,
+        raw_days: float | None = None
+    ) -> None:
+    """
+    Retrains the model of each metric. A metric that fails is skipped, its current
+    artefact is kept.
+
+    Parameters
+    ----------
+    predictor : Predictor
+        The predictor.
+    backend : str
+        "compact" (boosted stumps) or "forest" (random forest).
+    window_weeks : float or None
+        Only the records of the last weeks are used.
+    half_life_days : float or None
+        The age at which a record weighs half as much as a new one.
+    raw_days : float or None, optional
+        Raw records are only read for the last days, older days are read from the
+        rollups (default is raw records only).
+    """
+
+    train = predictor.train_compact if backend == "compact" else predictor.train
+
+    for metric in metrics:
+
+        start_time = time.perf_counter()
+        try:
+            train(
+                metric=metric,
+                window_weeks=window_weeks,
+                half_life_days=half_life_days,
+                raw_days=raw_days
+            )
+        except Exception as e:
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} `{metric}` failed: {e}")
+            continue
+
+        print(
+            f"{datetime.now():%Y-%m-%d %H:%M:%S} `{metric}` trained in "
+            f"{time.perf_counter() - start_time:.1f}s "
+            f"(schema {predictor.schemas[metric].fingerprint})"
+        )
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backend",
+        choices=["compact", "forest"],
+        default="compact",
+        help="The model to train (default is compact)"
+    )
+    parser.add_argument(
+        "--window-weeks",
+        type=float,
+        default=12,
+        help="Only train on the last weeks of records (default is 12)"
+    )
+    parser.add_argument(
+        "--half-life-days",
+        type=float,
+        default=14,
+        help="Age at which a record weighs half as much as a new one (default is 14)"
+    )
+    parser.add_argument(
+        "--every",
+        type=float,
+        default=None,
+        help="Retrain every N minutes instead of once"
+    )
+    args = parser.parse_args()
+
+    # The oldest day of raw records may be partly expired, it is read from the
+    # rollups
+    retention_days = os.getenv("METRICS_RETENTION_DAYS")
+    raw_days = float(retention_days) - 1 if retention_days is not None else None
+
+    predictor = Predictor()
+
+    while True:
+
+        train_all(
+            predictor=predictor,
+            backend=args.backend,
+            window_weeks=args.window_weeks,
+            half_life_days=args.half_life_days,
+            raw_days=raw_days
+        )
+
+        if args.every is None:
+            break
+
+        time.sleep(args.every * 60)
@@ -0,0 +1,435 @@
+import atexit
+import json
+import logging
+import math
+import os
+import queue
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+import bson
+from pymongo import monitoring
+from src.backend.utils.misc import get_query_shape
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ProfiledCommand:
+    """
+    The information kept about a command between its start and its completion.
+    """
+
+    key: tuple[str, str, str]
+    filter: dict | None
+    database_name: str
+    cursor_id: int | None = None
+
+@dataclass
+class QueryStats:
+    """
+    Aggregated statistics of one (collection, command, filter shape) group.
+    """
+
+    collection: str
+    command: str
+    shape: str
+    count: int = 0
+    failures: int = 0
+    total_duration: float = 0.0
+    documents: int = 0
+    reply_bytes: int = 0
+    collscan: bool | None = None
+    durations: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+    @property
+    def p95_duration(self) -> float:
+        """
+        The 95th percentile of the latest durations, in seconds.
+        """
+
+        if len(self.durations) == 0:
+            return 0.0
+
+        durations = sorted(self.durations)
+        index = min(len(durations) - 1, math.ceil(0.95 * len(durations)) - 1)
+
+        return durations[index]
+
+    def to_dict(self) -> dict:
+        """
+        Converts the statistics into a JSON-serializable dictionary.
+
+        Returns
+        -------
+        dict
+            The statistics as a dictionary.
+        """
+
+        return {
+            "collection": self.collection,
+            "command": self.command,
+            "shape": self.shape,
+            "count": self.count,
+            "failures": self.failures,
+            "total_duration": self.total_duration,
+            "p95_duration": self.p95_duration,
+            "documents": self.documents,
+            "reply_bytes": self.reply_bytes,
+            "collscan": self.collscan
+        }
+
+class CommandProfiler(monitoring.CommandListener):
+    """
+    A pymongo command listener aggregating latency, returned documents and reply
+    size per collection and filter shape.
+
+    In dev mode, the first query of each new shape is explained in a background
+    thread, and shapes answered by a collection scan are flagged.
+    """
+
+    ignored_commands = (
+        "explain", "hello", "isMaster", "ismaster", "ping", "endSessions",
+        "killCursors", "saslStart", "saslContinue", "buildInfo"
+    )
+
+    def __init__(
+            self,
+            dev_mode: bool = False
+        ) -> None:
+        """
+        Initializes the profiler.
+
+        Parameters
+        ----------
+        dev_mode : bool, optional
+            Whether to explain new query shapes to detect collection scans (default
+            is False).
+        """
+
+        self.dev_mode = dev_mode
+        self.client = None
+
+        self.stats: dict[tuple[str, str, str], QueryStats] = {}
+        self.commands: dict[tuple, ProfiledCommand] = {}
+        self.cursors: dict[int, tuple[str, str, str]] = {}
+        self.lock = threading.Lock()
+
+        self.explain_queue: queue.Queue = queue.Queue()
+        if self.dev_mode:
+            threading.Thread(target=self.explain_worker, daemon=True).start()
+
+    def attach(self, client) -> None:
+        """
+        Sets the client used to run `explain` in dev mode.
+
+        Parameters
+        ----------
+        client : pymongo.MongoClient
+            A client connected to the profiled deployment.
+        """
+
+        self.client = client
+
+    @staticmethod
+    def get_filter(
+            command_name: str,
+            command: dict
+        ) -> dict | None:
+        """
+        Extracts the filter of a command.
+
+        Parameters
+        ----------
+        command_name : str
+            The command name.
+        command : dict
+            The command document.
+
+        Returns
+        -------
+        dict or None
+            The filter, or None if the command has no filter.
+        """
+
+        if command_name in ("find", "count", "distinct"):
+            return command.get("filter", command.get("query")) or {}
+        elif command_name == "aggregate":
+            pipeline = command.get("pipeline", [])
+            if len(pipeline) > 0 and "$match" in pipeline[0]:
+                return pipeline[0]["$match"]
+            return {}
+        elif command_name == "update":
+            return command["updates"][0].get("q", {})
+        elif command_name == "delete":
+            return command["deletes"][0].get("q", {})
+
+        return None
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        """
+        Records the collection and filter shape of a started command.
+        """
+
+        if event.command_name in self.ignored_commands:
+            return
+
+        command = event.command
+
+        if event.command_name == "getMore":
+            with self.lock:
+                key = self.cursors.get(command["getMore"])
+            if key is None:
+                return
+            filter, cursor_id = None, command["getMore"]
+        else:
+            collection = command.get(event.command_name)
+            if not isinstance(collection, str):
+                return
+            filter = self.get_filter(event.command_name, command)
+            shape = json.dumps(get_query_shape(filter)) if filter is not None else ""
+            key = (collection, event.command_name, shape)
+            cursor_id = None
+
+        with self.lock:
+            self.commands[(event.connection_id, event.request_id)] = ProfiledCommand(
+                key=key,
+                filter=filter,
+                database_name=event.database_name,
+                cursor_id=cursor_id
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        """
+        Aggregates the latency, returned documents and reply size of a command.
+        """
+
+        with self.lock:
+            profiled = self.commands.pop((event.connection_id, event.request_id), None)
+        if profiled is None:
+            return
+
+        reply = event.reply
+        cursor = reply.get("cursor")
+        if cursor is not None:
+            documents = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        else:
+            documents = reply.get("n", 0)
+
+        reply_bytes = len(bson.encode(reply))
+
+        with self.lock:
+
+            if cursor is not None and cursor.get("id"):
+                self.cursors[cursor["id"]] = profiled.key
+            elif profiled.cursor_id is not None:
+                self.cursors.pop(profiled.cursor_id, None)
+
+            stats = self.stats.get(profiled.key)
+            is_new_shape = stats is None
+            if is_new_shape:
+                stats = QueryStats(*profiled.key)
+                self.stats[profiled.key] = stats
+
+            stats.count += 1
+            stats.total_duration += event.duration_micros / 10**6
+            stats.durations.append(event.duration_micros / 10**6)
+            stats.documents += documents
+            stats.reply_bytes += reply_bytes
+
+        if self.dev_mode and is_new_shape and profiled.filter is not None:
+            self.explain_queue.put(profiled)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        """
+        Counts a failed command.
+        """
+
+        with self.lock:
+            profiled = self.commands.pop((event.connection_id, event.request_id), None)
+            if profiled is None:
+                return
+
+            stats = self.stats.setdefault(profiled.key, QueryStats(*profiled.key))
+            stats.failures += 1
+
+    @staticmethod
+    def has_collscan(plan: dict) -> bool:
+        """
+        Checks whether a query plan contains a collection scan.
+
+        Parameters
+        ----------
+        plan : dict
+            A (sub-)plan returned by `explain`.
+
+        Returns
+        -------
+        bool
+            True if a COLLSCAN stage is found.
+        """
+
+        if plan.get("stage") == "COLLSCAN":
+            return True
+
+        children = plan.get("inputStages", [])
+        for key in ("inputStage", "queryPlan"):
+            if key in plan:
+                children = children + [plan[key]]
+
+        return any(CommandProfiler.has_collscan(child) for child in children)
+
+    def explain(self, profiled: ProfiledCommand) -> None:
+        """
+        Explains a query and flags its shape if it is answered by a collection scan.
+
+        Parameters
+        ----------
+        profiled : ProfiledCommand
+            The first command seen with this shape.
+        """
+
+        collection, _, _ = profiled.key
+
+        result = self.client[profiled.database_name].command(
+            "explain",
+            {"find": collection, "filter": profiled.filter},
+            verbosity="queryPlanner"
+        )
+
+        collscan = self.has_collscan(result["queryPlanner"]["winningPlan"])
+
+        with self.lock:
+            self.stats[profiled.key].collscan = collscan
+
+        if collscan:
+            logger.warning(
+                f"Unindexed query on `{collection}`: {profiled.key[2]}"
+            )
+
+    def explain_worker(self) -> None:
+        """
+        Explains the queued queries, one at a time.
+        """
+
+        while True:
+            profiled = self.explain_queue.get()
+            if self.client is None:
+                continue
+            try:
+                self.explain(profiled)
+            except Exception as e:
+                logger.warning(f"Failed to explain {profiled.key}: {e}")
+
+    def get_report(
+            self,
+            sort_by: str = "total_duration",
+            limit: int | None = None
+        ) -> list[dict]:
+        """
+        Ranks the query shapes.
+
+        Parameters
+        ----------
+        sort_by : str, optional
+            The statistic to rank by (default is "total_duration").
+        limit : int or None, optional
+            The maximum number of shapes to return (default is None).
+
+        Returns
+        -------
+        list of dict
+            The statistics of each shape, in decreasing order.
+        """
+
+        with self.lock:
+            report = [stats.to_dict() for stats in self.stats.values()]
+
+        report = sorted(report, key=lambda s: s[sort_by], reverse=True)
+
+        return report[:limit]
+
+    def format_report(
+            self,
+            sort_by: str = "total_duration",
+            limit: int | None = 20
+        ) -> str:
+        """
+        Formats the ranked report as a text table.
+
+        Parameters
+        ----------
+        sort_by : str, optional
+            The statistic to rank by (default is "total_duration").
+        limit : int or None, optional
+            The maximum number of shapes to include (default is 20).
+
+        Returns
+        -------
+        str
+            The report.
+        """
+
+        lines = [
+            f"{'collection':<24}{'command':<10}{'count':>8}{'total (s)':>11}"
+            f"{'p95 (ms)':>10}{'docs':>9}{'bytes':>12}  {'scan':<6}shape"
+        ]
+
+        for s in self.get_report(sort_by=sort_by, limit=limit):
+            scan = {True: "COLL", False: "index", None: "?"}[s["collscan"]]
+            lines.append(
+                f"{s['collection']:<24}{s['command']:<10}{s['count']:>8}"
+                f"{s['total_duration']:>11.3f}{s['p95_duration'] * 1000:>10.1f}"
+                f"{s['documents']:>9}{s['reply_bytes']:>12}  {scan:<6}{s['shape']}"
+            )
+
+        return "\n".join(lines)
+
+    def dump_report(self, path: str) -> None:
+        """
+        Writes the ranked report to a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            The destination file.
+        """
+
+        with open(path, "w") as f:
+            json.dump(self.get_report(), f, indent=4)
+
+    def reset(self) -> None:
+        """
+        Clears all the aggregated statistics.
+        """
+
+        with self.lock:
+            self.stats = {}
+
+def get_profiler() -> CommandProfiler | None:
+    """
+    Returns the process-wide profiler, created on first call if the `MONGO_PROFILER`
+    environment variable is set. `MONGO_PROFILER_EXPLAIN` enables the dev mode, and
+    `MONGO_PROFILER_REPORT` is a path where the report is dumped at exit.
+
+    Returns
+    -------
+    CommandProfiler or None
+        The profiler, or None if profiling is disabled.
+    """
+
+    global profiler
+
+    if profiler is None and os.getenv("MONGO_PROFILER") is not None:
+
+        profiler = CommandProfiler(
+            dev_mode=os.getenv("MONGO_PROFILER_EXPLAIN") is not None
+        )
+
+        report_path = os.getenv("MONGO_PROFILER_REPORT")
+        if report_path is not None:
+            atexit.register(profiler.dump_report, report_path)
+
+    return profiler
+
+profiler: CommandProfiler | None = None
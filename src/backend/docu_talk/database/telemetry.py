@@ -0,0 +1,323 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+# Raised when a record with the same `_id` was already inserted
+DUPLICATE_KEY_ERROR = 11000
+
+
+class TelemetryWriter:
+    """
+    A buffered writer for records that nobody waits on (metrics, usages). Records
+    are stamped and validated on `write`, queued, and inserted by a background
+    thread with one `insert_many` per table, when a batch is full or every
+    `flush_interval` seconds.
+
+    The queue is bounded: when it is full, `write` blocks up to `put_timeout`
+    seconds (backpressure), then inserts the record itself rather than dropping
+    it.
+    """
+
+    def __init__(
+            self,
+            db,
+            batch_size: int = 100,
+            flush_interval: float = 1.0,
+            max_size: int = 10000,
+            put_timeout: float = 1.0,
+            max_attempts: int = 5
+        ) -> None:
+        """
+        Initializes the writer and starts its flusher thread.
+
+        Parameters
+        ----------
+        db : Database
+            The database the records are inserted into.
+        batch_size : int, optional
+            The number of records that triggers a flush (default is 100).
+        flush_interval : float, optional
+            The maximum time in seconds a record stays in the queue (default is 1).
+        max_size : int, optional
+            The capacity of the queue (default is 10000).
+        put_timeout : float, optional
+            How long `write` waits for room in a full queue, in seconds (default is
+            1).
+        max_attempts : int, optional
+            The number of attempts to insert a batch (default is 5).
+        """
+
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+
+        self.queue: queue.Queue = queue.Queue(maxsize=max_size)
+
+        # Records taken from the queue and not inserted yet
+        self.in_flight: list[tuple[str, dict]] = []
+        self.lock = threading.Lock()
+
+        self.flush_requested = threading.Event()
+        self.stopped = threading.Event()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(
+            self,
+            table: str,
+            data: dict
+        ) -> str:
+        """
+        Buffers a record to insert into a table.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table (collection).
+        data : dict
+            The record. It is stamped with an ID and the current time.
+
+        Returns
+        -------
+        str
+            The ID of the record.
+        """
+
+        table_class = next(t for t in self.db.tables if t.__tablename__ == table)
+
+        if "id" not in data:
+            data["id"] = str(uuid4())
+        data["timestamp"] = datetime.now()
+
+        table_class(**data)
+
+        if self.stopped.is_set():
+            self.db.insert_data(table=table, data=data)
+            return data["id"]
+
+        try:
+            self.queue.put((table, data), timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning(
+                f"Telemetry queue full, inserting into `{table}` synchronously"
+            )
+            self.db.insert_many(table=table, data=[data])
+
+        return data["id"]
+
+    def get_pending(self, table: str) -> list[dict]:
+        """
+        Returns the records of a table that are not inserted yet, so that readers
+        can take them into account.
+
+        Parameters
+        ----------
+        table : str
+            The name of the table (collection).
+
+        Returns
+        -------
+        list of dict
+            The pending records.
+        """
+
+        with self.queue.mutex:
+            queued = list(self.queue.queue)
+
+        with self.lock:
+            in_flight = list(self.in_flight)
+
+        return [data for t, data in in_flight + queued if t == table]
+
+    def get_batch(self) -> list[tuple[str, dict]]:
+        """
+        Takes records from the queue until a batch is full or the flush interval
+        is over.
+
+        Returns
+        -------
+        list of tuple
+            The (table, record) pairs of the batch.
+        """
+
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+
+            if self.flush_requested.is_set() or self.stopped.is_set():
+                timeout = 0
+            else:
+                timeout = max(deadline - time.monotonic(), 0)
+
+            try:
+                if timeout > 0:
+                    item = self.queue.get(timeout=timeout)
+                else:
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            with self.lock:
+                self.in_flight.append(item)
+            batch.append(item)
+
+        return batch
+
+    def insert_batch(self, batch: list[tuple[str, dict]]) -> None:
+        """
+        Inserts a batch with one `insert_many` per table, retrying with an
+        exponential backoff. `insert_many` sets the `_id` of the records, so a
+        retry only resends the records that were not inserted, and the duplicate
+        keys of records inserted by a failed attempt are ignored.
+
+        Parameters
+        ----------
+        batch : list of tuple
+            The (table, record) pairs of the batch.
+        """
+
+        tables: dict[str, list[dict]] = {}
+        for table, data in batch:
+            tables.setdefault(table, []).append(data)
+
+        for table, records in tables.items():
+            for attempt in range(self.max_attempts):
+                try:
+                    self.db.insert_many(table=table, data=records)
+                    break
+                except Exception as e:
+                    if isinstance(e, BulkWriteError):
+                        failed = {
+                            error["index"] for error in e.details["writeErrors"]
+                            if error["code"] != DUPLICATE_KEY_ERROR
+                        }
+                        records = [
+                            record for i, record in enumerate(records)
+                            if i in failed
+                        ]
+                        if len(records) == 0:
+                            break
+                    if attempt == self.max_attempts - 1:
+                        logger.error(
+                            f"Failed to insert {len(records)} records into "
+                            f"`{table}`, they are lost: {e}"
+                        )
+                    else:
+                        time.sleep(min(2 ** attempt * 0.5, 10))
+
+    def run(self) -> None:
+        """
+        Flushes the queue until the writer is stopped and the queue is empty.
+        """
+
+        while True:
+
+            batch = self.get_batch()
+
+            if len(batch) > 0:
+                self.insert_batch(batch)
+                with self.lock:
+                    self.in_flight = self.in_flight[len(batch):]
+                for _ in batch:
+                    self.queue.task_done()
+
+            if self.queue.empty():
+                self.flush_requested.clear()
+                if self.stopped.is_set():
+                    return
+
+    def flush(self, timeout: float | None = 10.0) -> bool:
+        """
+        Inserts the buffered records now and waits for them.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            The maximum time to wait in seconds (default is 10).
+
+        Returns
+        -------
+        bool
+            True if every buffered record was inserted.
+        """
+
+        self.flush_requested.set()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+
+        return True
+
+    def close(self, timeout: float | None = 10.0) -> None:
+        """
+        Flushes the buffered records and stops the flusher thread. Records written
+        afterwards are inserted synchronously.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            The maximum time to wait in seconds (default is 10).
+        """
+
+        self.stopped.set()
+        self.thread.join(timeout)
+
+        if self.thread.is_alive():
+            logger.error(
+                f"{self.queue.unfinished_tasks} telemetry records were not inserted"
+            )
+
+def get_telemetry_writer(db) -> TelemetryWriter:
+    """
+    Returns the process-wide telemetry writer, created on first call with the given
+    database and flushed at exit. `TELEMETRY_BATCH_SIZE`, `TELEMETRY_FLUSH_INTERVAL`
+    and `TELEMETRY_MAX_QUEUE` override its defaults.
+
+    Parameters
+    ----------
+    db : Database
+        The database used when the writer is created.
+
+    Returns
+    -------
+    TelemetryWriter
+        The writer.
+    """
+
+    global writer
+
+    if writer is None:
+        with writer_lock:
+            if writer is None:
+
+                writer = TelemetryWriter(
+                    db=db,
+                    batch_size=int(os.getenv("TELEMETRY_BATCH_SIZE", "100")),
+                    flush_interval=float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1")),
+                    max_size=int(os.getenv("TELEMETRY_MAX_QUEUE", "10000"))
+                )
+
+                atexit.register(writer.close)
+
+    return writer
+
+writer: TelemetryWriter | None = None
+writer_lock = threading.Lock()
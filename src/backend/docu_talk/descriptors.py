@@ -0,0 +1,229 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from src.backend.docu_talk.database.invalidation import InvalidationEvent
+
+
+@dataclass(frozen=True)
+class ChatbotDescriptor:
+    """
+    What a session needs to open a chatbot, loaded from the Chatbots, Documents and
+    SuggestedPrompts tables.
+    """
+
+    chatbot_id: str
+    version: int
+    title: str
+    description: str
+    icon: bytes
+    icon_hash: str
+    access: str
+    documents: tuple[dict, ...]
+    suggested_prompts: tuple[dict, ...]
+
+class DescriptorCache:
+    """
+    A process-wide LRU cache of chatbot descriptors, shared by the sessions.
+
+    Each chatbot has a version, raised by `invalidate` whenever the chatbot, its
+    documents or its prompts change. A descriptor is only served while its version
+    is the current one, so an invalidation takes effect on the next `get`, even if
+    a load was in progress.
+
+    Versions come from a counter of the cache. Only the `max_size` most recently
+    invalidated chatbots keep their own; the other ones share a floor version,
+    raised to the version of any chatbot that is dropped, so that a version never
+    goes back.
+    """
+
+    def __init__(self, max_size: int = 256) -> None:
+        """
+        Initializes an empty cache.
+
+        Parameters
+        ----------
+        max_size : int, optional
+            The maximum number of descriptors, and of versions, kept (default is
+            256).
+        """
+
+        self.max_size = max_size
+
+        self.descriptors: OrderedDict[str, ChatbotDescriptor] = OrderedDict()
+        self.versions: OrderedDict[str, int] = OrderedDict()
+        self.floor = 0
+        self.counter = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_version(self, chatbot_id: str) -> int:
+        """
+        Returns the current version of a chatbot.
+
+        Parameters
+        ----------
+        chatbot_id : str
+            The chatbot's unique identifier.
+
+        Returns
+        -------
+        int
+            The version.
+        """
+
+        with self.lock:
+            return self.versions.get(chatbot_id, self.floor)
+
+    def get(
+            self,
+            chatbot_id: str,
+            load: Callable[[str, int], ChatbotDescriptor]
+        ) -> ChatbotDescriptor:
+        """
+        Returns the descriptor of a chatbot, loading it on a miss or when it is
+        outdated.
+
+        Parameters
+        ----------
+        chatbot_id : str
+            The chatbot's unique identifier.
+        load : Callable
+            Loads the descriptor from the database, given the chatbot ID and the
+            version it is loaded at.
+
+        Returns
+        -------
+        ChatbotDescriptor
+            The descriptor.
+        """
+
+        with self.lock:
+            version = self.versions.get(chatbot_id, self.floor)
+            descriptor = self.descriptors.get(chatbot_id)
+            if descriptor is not None and descriptor.version == version:
+                self.descriptors.move_to_end(chatbot_id)
+                self.hits += 1
+                return descriptor
+            self.misses += 1
+
+        # Loaded outside of the lock, concurrent misses may load it twice
+        descriptor = load(chatbot_id, version)
+
+        with self.lock:
+            if self.versions.get(chatbot_id, self.floor) == version:
+                self.descriptors[chatbot_id] = descriptor
+                self.descriptors.move_to_end(chatbot_id)
+                while len(self.descriptors) > self.max_size:
+                    self.descriptors.popitem(last=False)
+
+        return descriptor
+
+    def invalidate(self, chatbot_id: str) -> int:
+        """
+        Raises the version of a chatbot and drops its descriptor.
+
+        Parameters
+        ----------
+        chatbot_id : str
+            The chatbot's unique identifier.
+
+        Returns
+        -------
+        int
+            The new version.
+        """
+
+        with self.lock:
+
+            self.counter += 1
+            self.versions[chatbot_id] = self.counter
+            self.versions.move_to_end(chatbot_id)
+            self.descriptors.pop(chatbot_id, None)
+
+            while len(self.versions) > self.max_size:
+                _, version = self.versions.popitem(last=False)
+                self.floor = max(self.floor, version)
+
+            return self.counter
+
+    def invalidate_all(self) -> None:
+        """
+        Raises the version of every chatbot and drops all the descriptors.
+        """
+
+        with self.lock:
+            self.counter += 1
+            self.floor = self.counter
+            self.versions.clear()
+            self.descriptors.clear()
+
+    def on_invalidation(self, event: "InvalidationEvent") -> None:
+        """
+        Invalidates the chatbot changed by any instance (see `InvalidationBus`), or
+        every chatbot when it is unknown.
+
+        Parameters
+        ----------
+        event : InvalidationEvent
+            A change of the Chatbots, Documents or SuggestedPrompts table.
+        """
+
+        key = "id" if event.table == "Chatbots" else "chatbot_id"
+        chatbot_id = event.get(key)
+
+        if chatbot_id is None:
+            self.invalidate_all()
+        else:
+            self.invalidate(chatbot_id)
+
+def get_icon_hash(icon: bytes | None) -> str:
+    """
+    Hashes an icon, e.g. to tell whether it changed without comparing its bytes.
+
+    Parameters
+    ----------
+    icon : bytes or None
+        The icon.
+
+    Returns
+    -------
+    str
+        The hex digest, empty without an icon.
+    """
+
+    if icon is None:
+        return ""
+
+    return hashlib.sha1(icon, usedforsecurity=False).hexdigest()
+
+def get_descriptor_cache() -> DescriptorCache:
+    """
+    Returns the process-wide descriptor cache, created on first call. Its size is
+    set by `DESCRIPTOR_CACHE_SIZE` (default is 256).
+
+    Returns
+    -------
+    DescriptorCache
+        The cache.
+    """
+
+    global cache
+
+    if cache is None:
+        with cache_lock:
+            if cache is None:
+                cache = DescriptorCache(
+                    max_size=int(os.getenv("DESCRIPTOR_CACHE_SIZE", "256"))
+                )
+
+    return cache
+
+cache: DescriptorCache | None = None
+cache_lock = threading.Lock()
@@ -1,12 +1,30 @@
+import hmac
 import os
 from datetime import datetime, timedelta
+from functools import partial
 from typing import Any
 from uuid import uuid4
 
 from src.backend.docu_talk.agents import ChatBotService, GoogleCloudStorageManager, Predictor
 from src.backend.docu_talk.base import ChatBot
 from src.backend.docu_talk.database.database import Database
-from src.backend.utils.auth import generate_password, hash_password, verify_password
+from src.backend.docu_talk.database.invalidation import get_invalidation_bus
+from src.backend.docu_talk.database.telemetry import get_telemetry_writer
+from src.backend.docu_talk.descriptors import (
+    ChatbotDescriptor,
+    get_descriptor_cache,
+    get_icon_hash,
+)
+from src.backend.docu_talk.exceptions import (
+    BadOutputFormatError,
+    JobInputsLostError,
+    ServerBusyError,
+    UnknownModelError,
+)
+from src.backend.docu_talk.jobs import Stage, get_job_queue
+from src.backend.docu_talk.passwords import get_login_throttle, get_password_hasher
+from src.backend.docu_talk.pricing import get_pricing_catalogue
+from src.backend.utils.auth import generate_password
 
 
 class DocuTalk:
@@ -31,9 +49,45 @@ class DocuTalk:
             database_name=os.getenv("MONGO_DB_NAME")
         )
 
+        self.telemetry = get_telemetry_writer(self.db)
+
+        self.descriptors = get_descriptor_cache()
+
+        self.pricing = get_pricing_catalogue(self.db)
+
+        self.passwords = get_password_hasher()
+        self.login_throttle = get_login_throttle()
+
+        # Keeps the caches coherent with the writes of the other instances
+        self.invalidation_bus = get_invalidation_bus(self.db)
+        if self.invalidation_bus is not None:
+            self.invalidation_bus.subscribe(
+                tables=["Chatbots", "Documents", "SuggestedPrompts"],
+                callback=self.descriptors.on_invalidation
+            )
+            self.invalidation_bus.subscribe(
+                tables=["ServiceModels"],
+                callback=self.pricing.refresh
+            )
+
         self.predictor = Predictor()
 
-        self.models = self.db.get_data(table="ServiceModels")
+        # Chatbots are created in the background, in stages that survive reruns
+        self.jobs = get_job_queue(self.db)
+        self.jobs.register(
+            kind="create_chatbot",
+            stages=[
+                Stage("upload_documents", self.upload_chatbot_documents),
+                Stage("title_description", self.generate_chatbot_title_description),
+                Stage("icon", self.generate_chatbot_icon),
+                Stage("suggested_prompts", self.generate_chatbot_suggested_prompts),
+                Stage("insert", self.insert_chatbot)
+            ],
+            on_failure=self.clean_up_chatbot_creation
+        )
+
+        # The number of messages restored when a conversation is resumed
+        self.conversation_window = int(os.getenv("CONVERSATION_WINDOW", "40"))
 
     def get_users(self) -> list[str]:
         """
@@ -88,9 +142,10 @@ class DocuTalk:
             email: str,
             period_dollar_amount: float,
             is_guest: bool = False
-        ) -> str:
+        ) -> None:
         """
-        Creates a new user and returns their generated password.
+        Creates a new user with a random password, which is only known once
+        `reset_password` sets a new one (e.g. when the welcome email is sent).
 
         Parameters
         ----------
@@ -104,15 +159,9 @@ class DocuTalk:
             The subscription or period dollar amount for the user.
         is_guest : bool, optional
             Whether the user is a guest (default is False).
-
-        Returns
-        -------
-        str
-            The generated password for the user.
         """
 
-        password = generate_password()
-        password_hash = hash_password(password)
+        password_hash = self.passwords.hash(generate_password())
 
         friendly_name = first_name
         if len(last_name) > 0:
@@ -132,15 +181,66 @@ class DocuTalk:
             }
         )
 
+    def reset_password(
+            self,
+            email: str,
+            key: str | None = None
+        ) -> str:
+        """
+        Generates a new password for a user and stores its hash.
+
+        With a key (e.g. the ID of the email sending the password), the password is
+        derived from it and `TOKEN_SECRET_KEY`, so that resetting it again with the
+        same key (e.g. when the email is sent twice) gives the same password.
+
+        Parameters
+        ----------
+        email : str
+            The user's email address.
+        key : str or None, optional
+            The key of the password (default is None, a new password each time).
+
+        Returns
+        -------
+        str
+            The generated password.
+
+        Raises
+        ------
+        ValueError
+            If the user does not exist.
+        """
+
+        seed = None
+        if key is not None:
+            seed = hmac.digest(
+                os.environ["TOKEN_SECRET_KEY"].encode(),
+                f"password:{email}:{key}".encode(),
+                "sha256"
+            )
+
+        password = generate_password(seed=seed)
+
+        result = self.db.database["Users"].update_one(
+            {"email": email},
+            {"$set": {"password_hash": self.passwords.hash(password)}}
+        )
+
+        if result.matched_count == 0:
+            raise ValueError(f"The user {email} does not exist")
+
         return password
 
     def check_login(
             self,
             email: str,
-            password: str
+            password: str,
+            ip_address: str | None = None
         ) -> bool:
         """
-        Verifies a user's login credentials.
+        Verifies a user's login credentials. The attempts are throttled per email
+        and IP address, and a password hashed with another work factor than
+        `BCRYPT_ROUNDS` is hashed again.
 
         Parameters
         ----------
@@ -148,13 +248,24 @@ class DocuTalk:
             The user's email address.
         password : str
             The user's password.
+        ip_address : str or None, optional
+            The IP address of the client, if known (default is None).
 
         Returns
         -------
         bool
             True if credentials are valid, False otherwise.
+
+        Raises
+        ------
+        TooManyAttemptsError
+            If the email or IP address made too many attempts.
+        ServerBusyError
+            If too many passwords are being verified.
         """
 
+        self.login_throttle.check(email=email, ip_address=ip_address)
+
         data = self.db.get_data(
             table="Users",
             filter={"email": email}
@@ -162,10 +273,23 @@ class DocuTalk:
 
         if len(data) == 0:
             return False
-        elif not verify_password(password, data[0]["password_hash"]):
+
+        password_hash = data[0]["password_hash"]
+        if not self.passwords.verify(password, password_hash):
             return False
-        else:
-            return True
+
+        if self.passwords.needs_rehash(password_hash):
+            try:
+                self.db.update_data(
+                    table="Users",
+                    filter={"email": email},
+                    updates={"password_hash": self.passwords.hash(password)}
+                )
+            except ServerBusyError:
+                # Hashed again at a next login
+                pass
+
+        return True
 
     def get_user_chatbots(
             self,
@@ -307,6 +431,8 @@ class DocuTalk:
             }
         )
 
+        self.descriptors.invalidate(chatbot_id)
+
     def remove_document(
             self,
             chatbot_id: str,
@@ -339,6 +465,8 @@ class DocuTalk:
             filter={"chatbot_id": chatbot_id, "filename": filename}
         )
 
+        self.descriptors.invalidate(chatbot_id)
+
     def get_filenames(
             self,
             chatbot_id: str
@@ -475,18 +603,319 @@ class DocuTalk:
                 }
             )
 
+        self.descriptors.invalidate(chatbot_id)
+
         self.share_chatbot(
             chatbot_id=chatbot_id,
             user_id=created_by,
             role="Admin"
         )
 
+    def submit_chatbot_creation(
+            self,
+            created_by: str,
+            documents: list[dict],
+            model: str,
+            estimated_duration: dict[str, float] | None = None
+        ) -> str:
+        """
+        Queues the creation of a chatbot from documents (see `JobQueue`). The
+        documents are uploaded, the title, description, icon and suggested prompts
+        are generated and the chatbot is inserted by the workers, in stages whose
+        results are saved in the job.
+
+        Parameters
+        ----------
+        created_by : str
+            The ID of the user creating the chatbot.
+        documents : list of dict
+            The documents: filename, bytes and number of pages.
+        model : str
+            The model used for the generations.
+        estimated_duration : dict or None, optional
+            The estimated duration quantiles, shown while waiting (default is None).
+
+        Returns
+        -------
+        str
+            The job's unique identifier.
+        """
+
+        for document in documents:
+            document["id"] = str(uuid4())
+
+        job_id = self.jobs.submit(
+            kind="create_chatbot",
+            created_by=created_by,
+            params={
+                "chatbot_id": str(uuid4()),
+                "model": model,
+                "documents": [
+                    {
+                        "id": document["id"],
+                        "filename": document["filename"],
+                        "nb_pages": document["nb_pages"]
+                    }
+                    for document in documents
+                ],
+                "estimated_duration": estimated_duration
+            },
+            inputs={document["id"]: document["bytes"] for document in documents}
+        )
+
+        return job_id
+
+    def get_creation_service(self, job: dict) -> ChatBotService:
+        """
+        Returns a chatbot service on the uploaded documents of a creation job.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+
+        Returns
+        -------
+        ChatBotService
+            The chatbot service.
+        """
+
+        return ChatBotService(
+            documents=[dict(document) for document in job["state"]["documents"]],
+            storage_manager=self.storage_manager
+        )
+
+    def upload_chatbot_documents(
+            self,
+            job: dict,
+            inputs: dict[str, bytes] | None
+        ) -> dict:
+        """
+        Creation stage: uploads the documents. Each document has a fixed path, so
+        that uploading it again overwrites it.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        inputs : dict or None
+            The bytes of each document, None if they were lost.
+
+        Returns
+        -------
+        dict
+            The uploaded documents.
+
+        Raises
+        ------
+        JobInputsLostError
+            If the documents were lost (the instance that received them stopped).
+        """
+
+        if inputs is None:
+            raise JobInputsLostError("The documents were lost, send them again")
+
+        chatbot_id = job["params"]["chatbot_id"]
+
+        documents = []
+        for document in job["params"]["documents"]:
+
+            uri, public_path = self.storage_manager.save_from_file(
+                file=inputs[document["id"]],
+                gcs_path=f"docu-talk/chatbots/{chatbot_id}/{document['id']}.pdf"
+            )
+
+            documents.append({**document, "uri": uri, "public_path": public_path})
+
+        return {"documents": documents}
+
+    def generate_chatbot_title_description(
+            self,
+            job: dict,
+            inputs: Any
+        ) -> dict:
+        """
+        Creation stage: generates the title and the description, or placeholders if
+        the output cannot be parsed.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        inputs : Any
+            Unused.
+
+        Returns
+        -------
+        dict
+            The title, the description and whether they are placeholders.
+        """
+
+        service = self.get_creation_service(job)
+
+        try:
+            title, description = service.generate_title_description(
+                model=job["params"]["model"]
+            )
+            failed = False
+        except BadOutputFormatError:
+            title, description, failed = "<TITLE>", "<DESCRIPTION>", True
+
+        self.store_usages(job["created_by"], service.last_usages)
+
+        return {
+            "title": title,
+            "description": description,
+            "title_description_failed": failed
+        }
+
+    def generate_chatbot_icon(
+            self,
+            job: dict,
+            inputs: Any
+        ) -> dict:
+        """
+        Creation stage: chooses the icon from the description.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        inputs : Any
+            Unused.
+
+        Returns
+        -------
+        dict
+            The icon.
+        """
+
+        service = self.get_creation_service(job)
+
+        icon = service.generate_icon(
+            description=job["state"]["description"],
+            model=job["params"]["model"]
+        )
+
+        # No usage when the icon is chosen locally (ICON_SELECTION_MODE=local)
+        if service.last_usages is not None:
+            self.store_usages(job["created_by"], service.last_usages)
+
+        return {"icon": icon}
+
+    def generate_chatbot_suggested_prompts(
+            self,
+            job: dict,
+            inputs: Any
+        ) -> dict:
+        """
+        Creation stage: generates the suggested prompts, none if the output cannot
+        be parsed.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        inputs : Any
+            Unused.
+
+        Returns
+        -------
+        dict
+            The suggested prompts.
+        """
+
+        service = self.get_creation_service(job)
+
+        try:
+            suggested_prompts = service.get_suggested_prompts(
+                model=job["params"]["model"]
+            )
+        except BadOutputFormatError:
+            suggested_prompts = []
+
+        self.store_usages(job["created_by"], service.last_usages)
+
+        return {"suggested_prompts": suggested_prompts}
+
+    def insert_chatbot(
+            self,
+            job: dict,
+            inputs: Any
+        ) -> dict:
+        """
+        Creation stage: inserts the chatbot, replacing the records of a previous
+        attempt, and logs the duration of the creation.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        inputs : Any
+            Unused.
+
+        Returns
+        -------
+        dict
+            Nothing is added to the state.
+        """
+
+        chatbot_id = job["params"]["chatbot_id"]
+        state = job["state"]
+
+        for table, column in [
+            ("Chatbots", "id"),
+            ("Access", "chatbot_id"),
+            ("SuggestedPrompts", "chatbot_id"),
+            ("Documents", "chatbot_id")
+        ]:
+            self.db.delete_data(table=table, filter={column: chatbot_id})
+
+        self.create_chatbot(
+            chatbot_id=chatbot_id,
+            created_by=job["created_by"],
+            title=state["title"],
+            description=state["description"],
+            icon=state["icon"],
+            access="private",
+            documents=state["documents"],
+            suggested_prompts=state["suggested_prompts"]
+        )
+
+        # The work of the completed stages and of this one, without the waits
+        duration = job.get("work_duration", 0.0) + (
+            datetime.now() - job["stage_started_at"]
+        ).total_seconds()
+
+        self.predictor.log_create_chatbot_metric(
+            duration=duration,
+            nb_documents=len(state["documents"]),
+            total_pages=sum(d["nb_pages"] for d in state["documents"]),
+            model=job["params"]["model"],
+            chatbot_id=chatbot_id
+        )
+
+        return {}
+
+    def clean_up_chatbot_creation(self, job: dict) -> None:
+        """
+        Deletes what a failed creation job created: uploaded documents and records.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        """
+
+        self.delete_chatbot(chatbot_id=job["params"]["chatbot_id"])
+
     def update_chatbot(
             self,
             chatbot_id: str,
             title: str | None = None,
             description: str | None = None,
-            icon: bytes | None = None
+            icon: bytes | None = None,
+            access: str | None = None
         ) -> None:
         """
         Updates a chatbot's details.
@@ -501,6 +930,8 @@ class DocuTalk:
             The new description for the chatbot.
         icon : bytes, optional
             The new icon for the chatbot.
+        access : str, optional
+            The new access level of the chatbot.
         """
 
         updates = {}
@@ -510,6 +941,8 @@ class DocuTalk:
             updates["description"] = description
         if icon is not None:
             updates["icon"] = icon
+        if access is not None:
+            updates["access"] = access
 
         self.db.update_data(
             table="Chatbots",
@@ -517,6 +950,35 @@ class DocuTalk:
             updates=updates
         )
 
+        self.descriptors.invalidate(chatbot_id)
+
+    def update_suggested_prompt(
+            self,
+            chatbot_id: str,
+            prompt_id: str,
+            prompt: str
+        ) -> None:
+        """
+        Updates a suggested prompt of a chatbot.
+
+        Parameters
+        ----------
+        chatbot_id : str
+            The chatbot's unique identifier.
+        prompt_id : str
+            The prompt's unique identifier.
+        prompt : str
+            The new prompt.
+        """
+
+        self.db.update_data(
+            table="SuggestedPrompts",
+            filter={"chatbot_id": chatbot_id, "id": prompt_id},
+            updates={"prompt": prompt}
+        )
+
+        self.descriptors.invalidate(chatbot_id)
+
     def delete_chatbot(
             self,
             chatbot_id: str
@@ -554,6 +1016,8 @@ class DocuTalk:
             filter={"chatbot_id": chatbot_id}
         )
 
+        self.descriptors.invalidate(chatbot_id)
+
     def share_chatbot(
             self,
             chatbot_id: str,
@@ -606,22 +1070,25 @@ class DocuTalk:
             }
         )
 
-    def start_chat(
+    def load_chatbot_descriptor(
             self,
-            chatbot_id: str
-        ) -> ChatBot:
+            chatbot_id: str,
+            version: int
+        ) -> ChatbotDescriptor:
         """
-        Starts a chat session with a chatbot.
+        Loads the descriptor of a chatbot from the database.
 
         Parameters
         ----------
         chatbot_id : str
             The chatbot's unique identifier.
+        version : int
+            The version of the chatbot the descriptor is loaded at.
 
         Returns
         -------
-        ChatBot
-            An instance of ChatBot configured for the chat session.
+        ChatbotDescriptor
+            The descriptor.
         """
 
         data = self.db.get_data(
@@ -641,22 +1108,241 @@ class DocuTalk:
             filter={"chatbot_id": chatbot_id}
         )
 
-        service = ChatBotService(
-            documents=documents,
-            storage_manager=self.storage_manager
-        )
-
-        chatbot = ChatBot(
+        descriptor = ChatbotDescriptor(
+            chatbot_id=chatbot_id,
+            version=version,
             title=desc["title"],
             description=desc["description"],
             icon=desc["icon"],
+            icon_hash=get_icon_hash(desc["icon"]),
             access=desc["access"],
-            suggested_prompts=suggested_prompts,
-            service=service
+            documents=tuple(documents),
+            suggested_prompts=tuple(suggested_prompts)
+        )
+
+        return descriptor
+
+    def get_chatbot_descriptor(
+            self,
+            chatbot_id: str
+        ) -> ChatbotDescriptor:
+        """
+        Retrieves the descriptor of a chatbot from the process-wide cache, loading
+        it on a miss or when the chatbot changed.
+
+        Parameters
+        ----------
+        chatbot_id : str
+            The chatbot's unique identifier.
+
+        Returns
+        -------
+        ChatbotDescriptor
+            The descriptor.
+        """
+
+        return self.descriptors.get(chatbot_id, self.load_chatbot_descriptor)
+
+    def append_message(
+            self,
+            user_id: str,
+            chatbot_id: str,
+            role: str,
+            content: str
+        ) -> None:
+        """
+        Appends a message to the conversation of a user with a chatbot. The message
+        is inserted in the background by the telemetry writer.
+
+        Parameters
+        ----------
+        user_id : str
+            The user's unique identifier.
+        chatbot_id : str
+            The chatbot's unique identifier.
+        role : str
+            The author of the message ("user" or "assistant"), or "reset" to mark
+            the start of a new conversation.
+        content : str
+            The message.
+        """
+
+        self.telemetry.write(
+            table="Conversations",
+            data={
+                "user_id": user_id,
+                "chatbot_id": chatbot_id,
+                "role": role,
+                "content": content
+            }
+        )
+
+    def get_conversation(
+            self,
+            user_id: str,
+            chatbot_id: str
+        ) -> list[dict[str, str]]:
+        """
+        Retrieves the latest messages (up to `conversation_window`) of the
+        conversation of a user with a chatbot, since its last reset.
+
+        Parameters
+        ----------
+        user_id : str
+            The user's unique identifier.
+        chatbot_id : str
+            The chatbot's unique identifier.
+
+        Returns
+        -------
+        list of dict
+            The messages (role and content), oldest first.
+        """
+
+        self.db.ensure_index(
+            table="Conversations",
+            columns=[("user_id", 1), ("chatbot_id", 1), ("timestamp", -1)]
+        )
+
+        # Messages still buffered by the telemetry writer are read first, a message
+        # inserted in between is then found in both
+        pending = [
+            message for message in self.telemetry.get_pending("Conversations")
+            if message["user_id"] == user_id and message["chatbot_id"] == chatbot_id
+        ]
+
+        data = self.db.get_data(
+            table="Conversations",
+            filter={"user_id": user_id, "chatbot_id": chatbot_id},
+            sort={"column": "timestamp", "direction": -1},
+            limit=self.conversation_window
+        )
+
+        records = {message["id"]: message for message in data + pending}
+        records = sorted(records.values(), key=lambda m: m["timestamp"], reverse=True)
+
+        messages = []
+        for message in records[:self.conversation_window]:
+            if message["role"] == "reset":
+                break
+            messages.append({"role": message["role"], "content": message["content"]})
+
+        return messages[::-1]
+
+    def start_chat(
+            self,
+            chatbot_id: str,
+            user_id: str | None = None
+        ) -> ChatBot:
+        """
+        Starts a chat session with a chatbot. With a user, the conversation is
+        stored and the previous one is restored on first access, so that it
+        survives reloads and can be served by any instance.
+
+        Parameters
+        ----------
+        chatbot_id : str
+            The chatbot's unique identifier.
+        user_id : str or None, optional
+            The user's unique identifier (default is None, the conversation is not
+            stored).
+
+        Returns
+        -------
+        ChatBot
+            An instance of ChatBot configured for the chat session.
+        """
+
+        descriptor = self.get_chatbot_descriptor(chatbot_id)
+
+        load_messages, on_message = None, None
+        if user_id is not None:
+            load_messages = partial(
+                self.get_conversation,
+                user_id=user_id,
+                chatbot_id=chatbot_id
+            )
+            on_message = partial(
+                self.append_message,
+                user_id,
+                chatbot_id
+            )
+
+        # The descriptor is shared by the sessions, each gets its own copies
+        service = ChatBotService(
+            documents=[dict(document) for document in descriptor.documents],
+            storage_manager=self.storage_manager,
+            load_messages=load_messages,
+            on_message=on_message
+        )
+
+        chatbot = ChatBot(
+            title=descriptor.title,
+            description=descriptor.description,
+            icon=descriptor.icon,
+            access=descriptor.access,
+            suggested_prompts=[dict(p) for p in descriptor.suggested_prompts],
+            service=service,
+            version=descriptor.version
         )
 
         return chatbot
 
+    def ask_batch(
+            self,
+            user_id: str,
+            chatbot_id: str,
+            questions: list[str],
+            model: str,
+            document_ids: list | None = None,
+            concurrency: int = 4,
+            export_path: str | None = None
+        ) -> list[dict]:
+        """
+        Answers a batch of independent questions on the documents of a chatbot,
+        and stores the usage of each answer (see `ChatBotService.ask_batch`).
+
+        Parameters
+        ----------
+        user_id : str
+            The user the usages are charged to.
+        chatbot_id : str
+            The chatbot's unique identifier.
+        questions : list of str
+            The questions.
+        model : str
+            The model to use.
+        document_ids : list or None, optional
+            A list of document IDs to include in the context (default is None).
+        concurrency : int, optional
+            The maximum number of questions in flight (default is 4).
+        export_path : str or None, optional
+            A JSON Lines or CSV file the answers are appended to, and the batch
+            resumed from (default is None).
+
+        Returns
+        -------
+        list of dict
+            The result of each question, in order.
+        """
+
+        def store_usage(result: dict) -> None:
+            if "usages" in result:
+                self.store_usages(user_id, result["usages"])
+
+        chatbot = self.start_chat(chatbot_id)
+
+        results = chatbot.service.ask_batch(
+            questions=questions,
+            model=model,
+            document_ids=document_ids,
+            concurrency=concurrency,
+            export_path=export_path,
+            on_answer=store_usage
+        )
+
+        return results
+
     def get_consumed_price(
             self,
             user_id: str
@@ -681,6 +1367,14 @@ class DocuTalk:
         )
         end_of_week = start_of_week + timedelta(days=7)
 
+        # Usages still buffered by the telemetry writer are read first, a usage
+        # inserted in between is then found in both
+        pending = [
+            usage for usage in self.telemetry.get_pending("Usages")
+            if usage["user_id"] == user_id
+            and start_of_week <= usage["timestamp"] < end_of_week
+        ]
+
         usages_data = self.db.get_data(
             table="Usages",
             filter={
@@ -692,18 +1386,119 @@ class DocuTalk:
             }
         )
 
-        consumed_price = sum([usage["price"] for usage in usages_data])
+        usages = {usage["id"]: usage for usage in usages_data + pending}
+
+        consumed_price = sum([usage["price"] for usage in usages.values()])
 
         return consumed_price
 
+    def get_price_per_unit(
+            self,
+            model_name: str
+        ) -> float:
+        """
+        Retrieves the price per unit of a model.
+
+        Parameters
+        ----------
+        model_name : str
+            The name of the model, one of its aliases or a versioned name (e.g. the
+            model version returned by Gemini).
+
+        Returns
+        -------
+        float
+            The price per unit.
+
+        Raises
+        ------
+        UnknownModelError
+            If the model is not in the ServiceModels table.
+        """
+
+        price_per_unit = self.pricing.get_price(model_name)
+
+        return price_per_unit
+
+    def estimate_question(
+            self,
+            nb_documents: int,
+            total_pages: int,
+            model_name: str
+        ) -> dict[str, dict[str, float]]:
+        """
+        Predicts the duration, time to first token, token count and price of a
+        question before it is sent, in one call to the predictor.
+
+        Parameters
+        ----------
+        nb_documents : int
+            The number of documents in the context.
+        total_pages : int
+            The total number of pages of the documents.
+        model_name : str
+            The name of the model.
+
+        Returns
+        -------
+        dict
+            The p50 and p90 estimates keyed by "duration", "ttft", "token_count"
+            and "price". An estimate without a trained model (or a price) is left
+            out.
+        """
+
+        predictions = self.predictor.predict_quantiles(
+            data={
+                "nb_documents": nb_documents,
+                "total_pages": total_pages,
+                "model": model_name,
+                "timestamp": datetime.now()
+            },
+            metrics=[
+                "ask_chatbot_duration",
+                "ask_chatbot_ttft",
+                "ask_chatbot_token_count"
+            ]
+        )
+
+        estimates = {
+            name: predictions[metric]
+            for name, metric in [
+                ("duration", "ask_chatbot_duration"),
+                ("ttft", "ask_chatbot_ttft"),
+                ("token_count", "ask_chatbot_token_count")
+            ]
+            if metric in predictions
+        }
+
+        # The tokens of a question are mostly the documents, priced as input
+        try:
+            price_per_unit = self.get_price_per_unit(model_name)
+        except UnknownModelError:
+            price_per_unit = None
+
+        if "token_count" in estimates and price_per_unit is not None:
+            estimates["price"] = {
+                quantile: max(token_count, 0) * price_per_unit
+                for quantile, token_count in estimates["token_count"].items()
+            }
+
+        return estimates
+
     def store_usage(
             self,
             user_id: str,
             model_name: str,
-            qty: int
+            qty: int,
+            input_tokens: int | None = None,
+            cached_tokens: int | None = None,
+            output_tokens: int | None = None
         ) -> float:
         """
-        Stores usage data for a user and calculates the associated cost.
+        Stores usage data for a user and calculates the associated cost. With the
+        token counts of each component, each is priced separately (see
+        `PricingCatalogue.get_cost`), otherwise `qty` is priced at the price per
+        unit.
 
         Parameters
         ----------
@@ -712,28 +1507,82 @@ class DocuTalk:
         model_name : str
             The name of the model used.
         qty : int
-            The quantity of units consumed.
+            The total number of tokens.
+        input_tokens : int or None, optional
+            The number of prompt tokens, cached ones included (default is None).
+        cached_tokens : int or None, optional
+            The number of prompt tokens read from the context cache (default is
+            None).
+        output_tokens : int or None, optional
+            The number of generated tokens (default is None).
 
         Returns
         -------
         float
             The cost of the usage.
+
+        Raises
+        ------
+        UnknownModelError
+            If the model is not in the ServiceModels table.
         """
 
-        price_per_unit = next(
-            m["price_per_unit"] for m in self.models if m["name"] == model_name
-        )
-        price = qty * price_per_unit
+        if input_tokens is not None and output_tokens is not None:
+            cached_tokens = cached_tokens or 0
+            price = self.pricing.get_cost(
+                model_name,
+                {
+                    "input": input_tokens - cached_tokens,
+                    "cached": cached_tokens,
+                    "output": output_tokens
+                }
+            )
+        else:
+            price = qty * self.get_price_per_unit(model_name)
 
-        self.db.insert_data(
+        self.telemetry.write(
             table="Usages",
             data={
                 "user_id": user_id,
                 "model": model_name,
-                "unit": "characters",
+                "unit": "tokens",
                 "qty": qty,
-                "price": price
+                "price": price,
+                "input_tokens": input_tokens,
+                "cached_tokens": cached_tokens,
+                "output_tokens": output_tokens
             }
         )
 
         return price
+
+    def store_usages(
+            self,
+            user_id: str,
+            usages: dict
+        ) -> float:
+        """
+        Stores the usages of a Gemini call (see `store_usage`).
+
+        Parameters
+        ----------
+        user_id : str
+            The user's unique identifier.
+        usages : dict
+            The usages: model, total token count ("qty") and the token count of
+            each component.
+
+        Returns
+        -------
+        float
+            The cost of the usage.
+        """
+
+        return self.store_usage(
+            user_id=user_id,
+            model_name=usages["model"],
+            qty=usages["qty"],
+            input_tokens=usages.get("input_tokens"),
+            cached_tokens=usages.get("cached_tokens"),
+            output_tokens=usages.get("output_tokens")
+        )
@@ -21,3 +21,40 @@ class BadOutputFormatError(Exception):
     def __init__(self, message="An error has occurred"):
         self.message = message
         super().__init__(self.message)
+
+class SchemaMismatchError(Exception):
+
+    def __init__(self, message="An error has occurred"):
+        self.message = message
+        super().__init__(self.message)
+
+class UnknownModelError(Exception):
+
+    def __init__(self, message="An error has occurred"):
+        self.message = message
+        super().__init__(self.message)
+
+class JobInputsLostError(Exception):
+
+    def __init__(self, message="An error has occurred"):
+        self.message = message
+        super().__init__(self.message)
+
+class LeaseLostError(Exception):
+
+    def __init__(self, message="An error has occurred"):
+        self.message = message
+        super().__init__(self.message)
+
+class TooManyAttemptsError(Exception):
+
+    def __init__(self, message="An error has occurred", retry_after=0.0):
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(self.message)
+
+class ServerBusyError(Exception):
+
+    def __init__(self, message="An error has occurred"):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,564 @@
+import logging
+import os
+import socket
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable
+from uuid import uuid4
+
+from pymongo import ReturnDocument
+from src.backend.docu_talk.exceptions import JobInputsLostError, LeaseLostError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    A step of a job. `run` is called with the job record and the inputs of the job
+    (None when they were lost), and returns the values added to the state of the
+    job. A stage must be idempotent: it runs again if its worker dies before the
+    stage is recorded as done.
+    """
+
+    name: str
+    run: Callable[[dict, Any], dict | None]
+
+class JobQueue:
+    """
+    A durable queue of background jobs, stored in the Jobs table and run by a small
+    fixed pool of worker threads per instance, which caps the heavy work running
+    at once.
+
+    A job is a sequence of stages (see `register`). After each stage, the state of
+    the job and its progress are saved, so that a job can be followed by polling
+    `get_job` and resumed from its last stage by any instance. Workers hold a lease
+    on their jobs, renewed by a heartbeat: the job of a dead worker is taken over
+    when its lease expires. The inputs given to `submit` (e.g. uploaded files) are
+    only kept in memory, and a submitted job is reserved to its instance until its
+    lease expires.
+
+    A failed stage is retried with an exponential backoff, up to `max_attempts`
+    attempts, then the job fails and its `on_failure` callback cleans up.
+    """
+
+    def __init__(
+            self,
+            db,
+            nb_workers: int = 2,
+            lease_duration: float = 60.0,
+            poll_interval: float = 2.0,
+            max_attempts: int = 3,
+            retry_delay: float = 5.0
+        ) -> None:
+        """
+        Initializes the queue. The workers are started by `start`.
+
+        Parameters
+        ----------
+        db : Database
+            The database holding the Jobs table.
+        nb_workers : int, optional
+            The number of worker threads (default is 2).
+        lease_duration : float, optional
+            The lifetime of a lease in seconds (default is 60).
+        poll_interval : float, optional
+            The interval between two polls of an idle worker in seconds (default
+            is 2).
+        max_attempts : int, optional
+            The maximum number of attempts of a job (default is 3).
+        retry_delay : float, optional
+            The delay before the first retry in seconds, doubled at each attempt
+            (default is 5).
+        """
+
+        self.db = db
+        self.nb_workers = nb_workers
+        self.lease_duration = lease_duration
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        # Identifies the leases of this instance
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+        self.pipelines: dict[str, tuple[list[Stage], Callable | None]] = {}
+        self.inputs: dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+        self.wake_up = threading.Event()
+        self.stopped = threading.Event()
+        self.threads: list[threading.Thread] = []
+
+        self.db.ensure_index(table="Jobs", columns=[("id", 1)])
+        self.db.ensure_index(
+            table="Jobs",
+            columns=[("status", 1), ("available_at", 1)]
+        )
+        self.db.ensure_index(
+            table="Jobs",
+            columns=[("created_by", 1), ("kind", 1), ("timestamp", -1)]
+        )
+
+    @property
+    def table(self):
+        return self.db.database["Jobs"]
+
+    def register(
+            self,
+            kind: str,
+            stages: list[Stage],
+            on_failure: Callable[[dict], None] | None = None
+        ) -> None:
+        """
+        Sets the stages of a kind of job. Registering a kind again replaces them.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of job.
+        stages : list of Stage
+            The stages, in order.
+        on_failure : Callable or None, optional
+            Called with the job record when the job fails, e.g. to delete what its
+            stages created (default is None).
+        """
+
+        with self.lock:
+            self.pipelines[kind] = (stages, on_failure)
+
+    def submit(
+            self,
+            kind: str,
+            created_by: str,
+            params: dict,
+            inputs: Any = None
+        ) -> str:
+        """
+        Adds a job to the queue.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of job (see `register`).
+        created_by : str
+            The user who submitted the job.
+        params : dict
+            The parameters of the job, stored with it.
+        inputs : Any, optional
+            Inputs kept in memory until the job ends, e.g. too large to be stored
+            (default is None).
+
+        Returns
+        -------
+        str
+            The job's unique identifier.
+        """
+
+        job_id = str(uuid4())
+        now = datetime.now()
+
+        with self.lock:
+            self.inputs[job_id] = inputs
+
+        self.db.insert_data(
+            table="Jobs",
+            data={
+                "id": job_id,
+                "kind": kind,
+                "created_by": created_by,
+                "status": "pending",
+                "params": params,
+                "state": {},
+                "stages_done": [],
+                "work_duration": 0.0,
+                "attempts": 0,
+                "available_at": now,
+                # Reserved to this instance, which holds the inputs
+                "lease_owner": self.owner,
+                "lease_expires_at": now + timedelta(seconds=self.lease_duration)
+            }
+        )
+
+        self.start()
+        self.wake_up.set()
+
+        return job_id
+
+    def get_job(self, job_id: str) -> dict | None:
+        """
+        Retrieves a job.
+
+        Parameters
+        ----------
+        job_id : str
+            The job's unique identifier.
+
+        Returns
+        -------
+        dict or None
+            The job record, or None if it does not exist.
+        """
+
+        return self.table.find_one({"id": job_id})
+
+    def get_jobs(
+            self,
+            created_by: str,
+            kind: str | None = None,
+            statuses: list[str] | None = None
+        ) -> list[dict]:
+        """
+        Retrieves the jobs of a user, latest first.
+
+        Parameters
+        ----------
+        created_by : str
+            The user who submitted the jobs.
+        kind : str or None, optional
+            The kind of the jobs (default is None, all kinds).
+        statuses : list of str or None, optional
+            The statuses of the jobs (default is None, all statuses).
+
+        Returns
+        -------
+        list of dict
+            The job records.
+        """
+
+        filter = {"created_by": created_by}
+        if kind is not None:
+            filter["kind"] = kind
+        if statuses is not None:
+            filter["status"] = {"$in": statuses}
+
+        return self.db.get_data(
+            table="Jobs",
+            filter=filter,
+            sort={"column": "timestamp", "direction": -1}
+        )
+
+    def claim(self) -> dict | None:
+        """
+        Takes the oldest job that is available to this instance: a pending job that
+        is not reserved to another live instance, or a running job whose lease
+        expired.
+
+        Returns
+        -------
+        dict or None
+            The job record, or None if there is none.
+        """
+
+        now = datetime.now()
+
+        with self.lock:
+            kinds = list(self.pipelines)
+
+        return self.table.find_one_and_update(
+            filter={
+                "kind": {"$in": kinds},
+                "$or": [
+                    {
+                        "status": "pending",
+                        "available_at": {"$lte": now},
+                        "$or": [
+                            {"lease_owner": None},
+                            {"lease_owner": self.owner},
+                            {"lease_expires_at": {"$lt": now}}
+                        ]
+                    },
+                    {"status": "running", "lease_expires_at": {"$lt": now}}
+                ]
+            },
+            update={
+                "$set": {
+                    "status": "running",
+                    "lease_owner": self.owner,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_duration)
+                },
+                "$min": {"started_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def renew_leases(self) -> None:
+        """
+        Extends the leases of the jobs of this instance, running or reserved.
+        """
+
+        self.table.update_many(
+            {"lease_owner": self.owner, "status": {"$in": ["pending", "running"]}},
+            {
+                "$set": {
+                    "lease_expires_at": (
+                        datetime.now() + timedelta(seconds=self.lease_duration)
+                    )
+                }
+            }
+        )
+
+    def save(
+            self,
+            job: dict,
+            updates: dict
+        ) -> None:
+        """
+        Updates a job held by this instance.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        updates : dict
+            The updated fields.
+
+        Raises
+        ------
+        LeaseLostError
+            If the job was taken over by another instance.
+        """
+
+        result = self.table.update_one(
+            {"id": job["id"], "lease_owner": self.owner},
+            {"$set": updates}
+        )
+
+        if result.matched_count == 0:
+            raise LeaseLostError(f"The lease of the job {job['id']} was lost")
+
+        job.update(updates)
+
+    def release(self, job_id: str) -> None:
+        """
+        Drops the inputs of a job that ended.
+
+        Parameters
+        ----------
+        job_id : str
+            The job's unique identifier.
+        """
+
+        with self.lock:
+            self.inputs.pop(job_id, None)
+
+    def run_job(self, job: dict) -> None:
+        """
+        Runs the stages of a job that are not done yet. The time spent in the
+        completed stages is summed in `work_duration`, without the waits in the
+        queue and the work lost by failed attempts.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        """
+
+        with self.lock:
+            stages, _ = self.pipelines[job["kind"]]
+            inputs = self.inputs.get(job["id"])
+
+        for stage in stages:
+
+            if stage.name in job["stages_done"]:
+                continue
+
+            self.save(job, {"stage": stage.name, "stage_started_at": datetime.now()})
+
+            state = {**job["state"], **(stage.run(job, inputs) or {})}
+
+            duration = (datetime.now() - job["stage_started_at"]).total_seconds()
+            self.save(
+                job,
+                {
+                    "state": state,
+                    "stages_done": job["stages_done"] + [stage.name],
+                    "work_duration": job.get("work_duration", 0.0) + duration
+                }
+            )
+
+        self.save(
+            job,
+            {
+                "status": "done",
+                "stage": None,
+                "finished_at": datetime.now(),
+                "lease_owner": None,
+                "error": None
+            }
+        )
+
+        self.release(job["id"])
+
+    def fail_job(
+            self,
+            job: dict,
+            error: Exception
+        ) -> None:
+        """
+        Schedules the retry of a failed job, or fails it after `max_attempts`
+        attempts or when its inputs are lost.
+
+        Parameters
+        ----------
+        job : dict
+            The job record.
+        error : Exception
+            The error.
+        """
+
+        retry = (
+            job["attempts"] < self.max_attempts
+            and not isinstance(error, JobInputsLostError)
+        )
+
+        if retry:
+            delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+            logger.warning(
+                f"Job {job['id']} failed at `{job.get('stage')}`, retry in "
+                f"{delay:g}s: {error}"
+            )
+            self.save(
+                job,
+                {
+                    "status": "pending",
+                    "available_at": datetime.now() + timedelta(seconds=delay),
+                    "error": str(error)
+                }
+            )
+            return
+
+        logger.error(f"Job {job['id']} failed at `{job.get('stage')}`: {error}")
+
+        with self.lock:
+            _, on_failure = self.pipelines[job["kind"]]
+
+        if on_failure is not None:
+            try:
+                on_failure(job)
+            except Exception as e:
+                logger.warning(f"Failed to clean up the job {job['id']}: {e}")
+
+        self.save(
+            job,
+            {
+                "status": "failed",
+                "finished_at": datetime.now(),
+                "lease_owner": None,
+                "error": str(error)
+            }
+        )
+
+        self.release(job["id"])
+
+    def work(self) -> None:
+        """
+        Runs the available jobs, one at a time, until the queue is stopped.
+        """
+
+        while not self.stopped.is_set():
+
+            try:
+                job = self.claim()
+            except Exception as e:
+                logger.warning(f"Failed to claim a job: {e}")
+                job = None
+
+            if job is None:
+                self.wake_up.wait(self.poll_interval)
+                self.wake_up.clear()
+                continue
+
+            try:
+                if job["attempts"] > self.max_attempts:
+                    raise RuntimeError("Too many attempts")
+                self.run_job(job)
+            except LeaseLostError as e:
+                logger.warning(str(e))
+            except Exception as e:
+                try:
+                    self.fail_job(job, e)
+                except Exception as e:
+                    logger.warning(f"Failed to record the failure of a job: {e}")
+
+    def heartbeat(self) -> None:
+        """
+        Renews the leases of this instance until the queue is stopped.
+        """
+
+        while not self.stopped.wait(self.lease_duration / 3):
+            try:
+                self.renew_leases()
+            except Exception as e:
+                logger.warning(f"Failed to renew the leases: {e}")
+
+    def start(self) -> None:
+        """
+        Starts the workers and the heartbeat, once.
+        """
+
+        with self.lock:
+
+            if len(self.threads) > 0:
+                return
+
+            targets = [self.heartbeat] + [self.work] * self.nb_workers
+            for target in targets:
+                thread = threading.Thread(target=target, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        """
+        Stops the workers after their current job.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            The maximum time to wait for each thread in seconds (default is 5).
+        """
+
+        self.stopped.set()
+        self.wake_up.set()
+
+        for thread in self.threads:
+            thread.join(timeout)
+
+def get_job_queue(db) -> JobQueue:
+    """
+    Returns the process-wide job queue, created and started on first call with the
+    given database. `JOB_WORKERS` sets its number of workers (default is 2) and
+    `JOB_LEASE_DURATION` the lifetime of its leases in seconds (default is 60).
+
+    Parameters
+    ----------
+    db : Database
+        The database used when the queue is created.
+
+    Returns
+    -------
+    JobQueue
+        The queue.
+    """
+
+    global queue
+
+    if queue is None:
+        with queue_lock:
+            if queue is None:
+
+                queue = JobQueue(
+                    db=db,
+                    nb_workers=int(os.getenv("JOB_WORKERS", "2")),
+                    lease_duration=float(os.getenv("JOB_LEASE_DURATION", "60"))
+                )
+
+                queue.start()
+
+    return queue
+
+queue: JobQueue | None = None
+queue_lock = threading.Lock()
@@ -0,0 +1,317 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Callable
+
+from src.backend.docu_talk.agents.chatbot.scheduler import TokenBucket
+from src.backend.docu_talk.exceptions import ServerBusyError, TooManyAttemptsError
+from src.backend.utils.auth import get_password_rounds, hash_password, verify_password
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords with bcrypt in a small pool of worker processes,
+    so that its CPU cost (a few hundred milliseconds per call at the default work
+    factor) is not paid by the threads serving the sessions.
+
+    At most `nb_workers` passwords are processed at once and `queue_size` more wait
+    for a worker; further calls fail at once with `ServerBusyError` instead of
+    piling up. New hashes use `rounds`, and hashes with another work factor are
+    reported by `needs_rehash`.
+    """
+
+    def __init__(
+            self,
+            nb_workers: int = 1,
+            queue_size: int = 16,
+            rounds: int = 12
+        ) -> None:
+        """
+        Initializes the hasher. The worker processes are started on first use.
+
+        Parameters
+        ----------
+        nb_workers : int, optional
+            The number of worker processes (default is 1).
+        queue_size : int, optional
+            The maximum number of calls waiting for a worker (default is 16).
+        rounds : int, optional
+            The bcrypt work factor of new hashes (default is 12).
+        """
+
+        self.nb_workers = nb_workers
+        self.rounds = rounds
+
+        self.slots = threading.BoundedSemaphore(nb_workers + queue_size)
+        self.executor: ProcessPoolExecutor | None = None
+        self.lock = threading.Lock()
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """
+        Returns the pool of worker processes, started on first call.
+        """
+
+        with self.lock:
+            if self.executor is None:
+                # Not forked from a process running many threads
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.nb_workers,
+                    mp_context=get_context("spawn")
+                )
+            return self.executor
+
+    def run(
+            self,
+            func: Callable,
+            *args
+        ) -> Any:
+        """
+        Runs a function in a worker process and waits for its result.
+
+        Parameters
+        ----------
+        func : Callable
+            The function, defined at module level.
+        *args
+            The arguments of the function.
+
+        Returns
+        -------
+        Any
+            The result of the function.
+
+        Raises
+        ------
+        ServerBusyError
+            If the queue is full.
+        """
+
+        if not self.slots.acquire(blocking=False):
+            raise ServerBusyError("Too many logins in progress, please retry later")
+
+        try:
+            executor = self.get_executor()
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OS): the pool is started again
+                with self.lock:
+                    if self.executor is executor:
+                        self.executor = None
+                return self.get_executor().submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password: str) -> bytes:
+        """
+        Hashes a password with the configured work factor.
+
+        Parameters
+        ----------
+        password : str
+            The plaintext password.
+
+        Returns
+        -------
+        bytes
+            The hashed password.
+        """
+
+        return self.run(hash_password, password, self.rounds)
+
+    def verify(
+            self,
+            password: str,
+            hashed: str | bytes
+        ) -> bool:
+        """
+        Verifies a password against a hash.
+
+        Parameters
+        ----------
+        password : str
+            The plaintext password.
+        hashed : str or bytes
+            The hashed password.
+
+        Returns
+        -------
+        bool
+            True if the password matches the hash, False otherwise.
+        """
+
+        return self.run(verify_password, password, hashed)
+
+    def needs_rehash(self, hashed: str | bytes) -> bool:
+        """
+        Checks whether a hash was made with another work factor.
+
+        Parameters
+        ----------
+        hashed : str or bytes
+            The hashed password.
+
+        Returns
+        -------
+        bool
+            True if the password should be hashed again.
+        """
+
+        return get_password_rounds(hashed) != self.rounds
+
+class LoginThrottle:
+    """
+    Limits the login attempts per email address and per IP address with token
+    buckets, so that a burst of attempts (e.g. credential stuffing) is rejected
+    before reaching bcrypt. Sign-ups count against the bucket of their IP address.
+    The buckets of the `max_keys` most recent addresses are kept in memory, per
+    process.
+    """
+
+    def __init__(
+            self,
+            email_rate: float = 5.0,
+            ip_rate: float = 30.0,
+            max_keys: int = 10000
+        ) -> None:
+        """
+        Initializes the throttle.
+
+        Parameters
+        ----------
+        email_rate : float, optional
+            The attempts per minute for an email address, also its burst (default
+            is 5).
+        ip_rate : float, optional
+            The attempts per minute from an IP address, also its burst (default is
+            30).
+        max_keys : int, optional
+            The maximum number of addresses tracked (default is 10000).
+        """
+
+        self.rates = {"email": email_rate, "ip": ip_rate}
+        self.max_keys = max_keys
+
+        self.buckets: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_bucket(
+            self,
+            kind: str,
+            key: str
+        ) -> TokenBucket:
+        """
+        Returns the bucket of an address, created full on first attempt.
+        """
+
+        with self.lock:
+
+            bucket = self.buckets.get((kind, key))
+
+            if bucket is None:
+                bucket = TokenBucket(
+                    rate_per_minute=self.rates[kind],
+                    capacity=self.rates[kind]
+                )
+                self.buckets[(kind, key)] = bucket
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end((kind, key))
+
+        return bucket
+
+    def check(
+            self,
+            email: str | None = None,
+            ip_address: str | None = None
+        ) -> None:
+        """
+        Counts a login or sign-up attempt.
+
+        Parameters
+        ----------
+        email : str or None, optional
+            The email address of the attempt, if any (default is None).
+        ip_address : str or None, optional
+            The IP address of the client, if known (default is None).
+
+        Raises
+        ------
+        TooManyAttemptsError
+            If the address has no attempts left, with the time to wait.
+        """
+
+        keys = []
+        if ip_address is not None:
+            keys.append(("ip", ip_address))
+        if email is not None:
+            keys.append(("email", email.strip().lower()))
+
+        for kind, key in keys:
+            retry_after = self.get_bucket(kind, key).try_acquire()
+            if retry_after > 0:
+                raise TooManyAttemptsError(
+                    f"Too many attempts, please retry in {retry_after:.0f} "
+                    "seconds",
+                    retry_after=retry_after
+                )
+
+def get_password_hasher() -> PasswordHasher:
+    """
+    Returns the process-wide password hasher, created on first call.
+    `PASSWORD_WORKERS` sets its number of processes (default is 1),
+    `PASSWORD_QUEUE_SIZE` its queue (default is 16) and `BCRYPT_ROUNDS` the work
+    factor (default is 12).
+
+    Returns
+    -------
+    PasswordHasher
+        The hasher.
+    """
+
+    global password_hasher
+
+    if password_hasher is None:
+        with password_hasher_lock:
+            if password_hasher is None:
+                password_hasher = PasswordHasher(
+                    nb_workers=int(os.getenv("PASSWORD_WORKERS", "1")),
+                    queue_size=int(os.getenv("PASSWORD_QUEUE_SIZE", "16")),
+                    rounds=int(os.getenv("BCRYPT_ROUNDS", "12"))
+                )
+
+    return password_hasher
+
+def get_login_throttle() -> LoginThrottle:
+    """
+    Returns the process-wide login throttle, created on first call.
+    `LOGIN_ATTEMPTS_PER_EMAIL` and `LOGIN_ATTEMPTS_PER_IP` set the attempts per
+    minute (default is 5 and 30).
+
+    Returns
+    -------
+    LoginThrottle
+        The throttle.
+    """
+
+    global login_throttle
+
+    if login_throttle is None:
+        with login_throttle_lock:
+            if login_throttle is None:
+                login_throttle = LoginThrottle(
+                    email_rate=float(os.getenv("LOGIN_ATTEMPTS_PER_EMAIL", "5")),
+                    ip_rate=float(os.getenv("LOGIN_ATTEMPTS_PER_IP", "30"))
+                )
+
+    return login_throttle
+
+password_hasher: PasswordHasher | None = None
+password_hasher_lock = threading.Lock()
+
+login_throttle: LoginThrottle | None = None
+login_throttle_lock = threading.Lock()
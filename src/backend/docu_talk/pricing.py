@@ -0,0 +1,266 @@
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+from src.backend.docu_talk.exceptions import UnknownModelError
+
+if TYPE_CHECKING:
+    from src.backend.docu_talk.database.invalidation import InvalidationEvent
+
+logger = logging.getLogger(__name__)
+
+# The characters that may follow a model name in a versioned name
+# (e.g. "gemini-1.5-flash-002" for "gemini-1.5-flash", "gemini-1.5-pro@001")
+VERSION_SEPARATORS = ("-", "@", ".")
+
+
+class PricingCatalogue:
+    """
+    The prices of the models (ServiceModels table), indexed in memory.
+
+    A model is found by its name, by one of its aliases, or by the longest name or
+    alias that prefixes it (the model versions returned by Gemini, e.g.
+    "gemini-1.5-flash-002" for "gemini-1.5-flash"). The resolved names are
+    memoized, so pricing is a couple of dict lookups.
+
+    A model is priced per unit, optionally per component (e.g. "input", "output",
+    "cached" tokens), `price_per_unit` being the price of the other components.
+    The catalogue is reloaded every `refresh_interval` seconds, or by `refresh`.
+    """
+
+    def __init__(
+            self,
+            load: Callable[[], list[dict]],
+            refresh_interval: float = 300.0
+        ) -> None:
+        """
+        Loads the catalogue.
+
+        Parameters
+        ----------
+        load : Callable
+            Returns the ServiceModels records.
+        refresh_interval : float, optional
+            The maximum age of the catalogue in seconds (default is 300).
+        """
+
+        self.load = load
+        self.refresh_interval = refresh_interval
+
+        self.lock = threading.Lock()
+
+        self.models: dict[str, dict] = {}
+        self.names: dict[str, str] = {}
+        self.resolved: dict[str, str] = {}
+        self.loaded_at = 0.0
+
+        self.refresh()
+
+    def refresh(self, event: "InvalidationEvent | None" = None) -> None:
+        """
+        Reloads the catalogue. On failure, the previous one is kept.
+
+        Parameters
+        ----------
+        event : InvalidationEvent or None, optional
+            The change of the ServiceModels table that triggered the refresh
+            (default is None).
+        """
+
+        try:
+            records = self.load()
+        except Exception as e:
+            logger.warning(f"Failed to reload the service models: {e}")
+            self.loaded_at = time.monotonic()
+            return
+
+        models, names = {}, {}
+        for record in records:
+            models[record["name"]] = record
+            for alias in record.get("aliases", []):
+                names[alias] = record["name"]
+
+        # Names win over aliases
+        names.update({name: name for name in models})
+
+        with self.lock:
+            self.models, self.names, self.resolved = models, names, {}
+            self.loaded_at = time.monotonic()
+
+    def resolve(self, model_name: str) -> str:
+        """
+        Finds the model of a name, alias or versioned name.
+
+        Parameters
+        ----------
+        model_name : str
+            The name, e.g. the model version returned by Gemini. A resource path
+            ("publishers/google/models/...") is reduced to its last part.
+
+        Returns
+        -------
+        str
+            The name of the model in the catalogue.
+
+        Raises
+        ------
+        UnknownModelError
+            If no model matches.
+        """
+
+        if time.monotonic() - self.loaded_at > self.refresh_interval:
+            self.refresh()
+
+        with self.lock:
+            names, resolved = self.names, self.resolved
+
+        if model_name in resolved:
+            return resolved[model_name]
+
+        name = model_name.rsplit("/", 1)[-1]
+
+        if name in names:
+            canonical = names[name]
+        else:
+            prefixes = [
+                prefix for prefix in names
+                if name.startswith(prefix)
+                and name[len(prefix):len(prefix) + 1] in VERSION_SEPARATORS
+            ]
+            if len(prefixes) == 0:
+                raise UnknownModelError(f"No price for the model `{model_name}`")
+            canonical = names[max(prefixes, key=len)]
+
+        with self.lock:
+            if self.resolved is resolved:
+                resolved[model_name] = canonical
+
+        return canonical
+
+    def get_model(self, model_name: str) -> dict:
+        """
+        Returns the ServiceModels record of a model.
+
+        Parameters
+        ----------
+        model_name : str
+            The name, alias or versioned name of the model.
+
+        Returns
+        -------
+        dict
+            The record.
+
+        Raises
+        ------
+        UnknownModelError
+            If no model matches.
+        """
+
+        canonical = self.resolve(model_name)
+
+        with self.lock:
+            return self.models[canonical]
+
+    def get_price(
+            self,
+            model_name: str,
+            component: str | None = None
+        ) -> float:
+        """
+        Returns the price per unit of a model.
+
+        Parameters
+        ----------
+        model_name : str
+            The name, alias or versioned name of the model.
+        component : str or None, optional
+            The priced component, e.g. "input", "output" or "cached" (default is
+            None, `price_per_unit`).
+
+        Returns
+        -------
+        float
+            The price per unit.
+
+        Raises
+        ------
+        UnknownModelError
+            If no model matches.
+        """
+
+        model = self.get_model(model_name)
+
+        return model.get("prices", {}).get(component, model["price_per_unit"])
+
+    def get_cost(
+            self,
+            model_name: str,
+            quantities: dict[str | None, float]
+        ) -> float:
+        """
+        Prices quantities of a model.
+
+        Parameters
+        ----------
+        model_name : str
+            The name, alias or versioned name of the model.
+        quantities : dict
+            The quantities keyed by component (None for `price_per_unit`).
+
+        Returns
+        -------
+        float
+            The cost.
+
+        Raises
+        ------
+        UnknownModelError
+            If no model matches.
+        """
+
+        model = self.get_model(model_name)
+        prices = model.get("prices", {})
+
+        cost = sum(
+            qty * prices.get(component, model["price_per_unit"])
+            for component, qty in quantities.items()
+        )
+
+        return cost
+
+def get_pricing_catalogue(db) -> PricingCatalogue:
+    """
+    Returns the process-wide pricing catalogue, loaded on first call from the
+    given database. `PRICING_REFRESH_INTERVAL` sets its maximum age in seconds
+    (default is 300).
+
+    Parameters
+    ----------
+    db : Database
+        The database used when the catalogue is created.
+
+    Returns
+    -------
+    PricingCatalogue
+        The catalogue.
+    """
+
+    global catalogue
+
+    if catalogue is None:
+        with catalogue_lock:
+            if catalogue is None:
+                catalogue = PricingCatalogue(
+                    load=lambda: db.get_data(table="ServiceModels"),
+                    refresh_interval=float(
+                        os.getenv("PRICING_REFRESH_INTERVAL", "300")
+                    )
+                )
+
+    return catalogue
+
+catalogue: PricingCatalogue | None = None
+catalogue_lock = threading.Lock()
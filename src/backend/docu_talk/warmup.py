@@ -0,0 +1,111 @@
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+lock = threading.Lock()
+thread_lock = threading.Lock()
+durations: dict[str, float] = {}
+thread: threading.Thread | None = None
+
+
+def load_predictor_models() -> None:
+    """
+    Unpickles the predictor models (imports scikit-learn).
+    """
+
+    from src.backend.docu_talk.agents.predictor.predictor import Predictor
+
+    Predictor.load_models()
+
+def load_chatbot_assets() -> None:
+    """
+    Reads the prompt templates and the icon names, and builds the icon index.
+    """
+
+    from src.backend.docu_talk.agents.chatbot.chatbot import get_icons, get_prompts
+    from src.backend.docu_talk.agents.chatbot.icon_index import get_icon_index
+
+    get_icons()
+    get_prompts()
+    get_icon_index()
+
+def load_vertexai() -> None:
+    """
+    Imports the Vertex AI SDK.
+    """
+
+    from src.backend.docu_talk.agents.chatbot.generator import get_safety_settings
+
+    get_safety_settings()
+
+def load_pdf_reader() -> None:
+    """
+    Imports PyMuPDF.
+    """
+
+    importlib.import_module("fitz")
+
+STEPS = {
+    "predictor_models": load_predictor_models,
+    "chatbot_assets": load_chatbot_assets,
+    "vertexai": load_vertexai,
+    "pdf_reader": load_pdf_reader
+}
+
+def warm_up() -> dict[str, float]:
+    """
+    Imports the heavy modules and loads the artefacts that are otherwise loaded on
+    first use. Steps already done are skipped, so calling it again is cheap.
+
+    Returns
+    -------
+    dict
+        The duration of each step in seconds.
+    """
+
+    with lock:
+        for name, step in STEPS.items():
+
+            if name in durations:
+                continue
+
+            start_time = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.warning(f"Warm-up step `{name}` failed: {e}")
+                continue
+
+            durations[name] = time.perf_counter() - start_time
+
+    return dict(durations)
+
+def is_warm() -> bool:
+    """
+    Checks whether all the warm-up steps are done.
+
+    Returns
+    -------
+    bool
+        True if the process is warm.
+    """
+
+    return len(durations) == len(STEPS)
+
+def start_warm_up() -> None:
+    """
+    Runs the warm-up in a background thread, once per process.
+    """
+
+    global thread
+
+    if thread is not None:
+        return
+
+    with thread_lock:
+        if thread is None:
+            thread = threading.Thread(target=warm_up, daemon=True)
+            thread.start()
@@ -1,4 +1,8 @@
+import json
+
 import boto3
+from botocore.exceptions import ClientError
+from src.backend.mailing.rendering import build_message
 from src.backend.utils.misc import get_param_or_env
 
 
@@ -46,7 +50,8 @@ class AWSMailSES:
             body_text: str,
             charset: str = "UTF-8",
             bcc_recipient: str | None = None,
-        ) -> None:
+            inline_images: dict[str, bytes] | None = None
+        ) -> str:
         """
         Sends an email using AWS SES.
 
@@ -66,8 +71,38 @@ class AWSMailSES:
             The character set for the email content (default is "UTF-8").
         bcc_recipient : str or None, optional
             The email address for BCC (default is None).
+        inline_images : dict or None, optional
+            The PNG images referenced by the HTML body, by content ID, sent as a
+            raw MIME message (default is None).
+
+        Returns
+        -------
+        str
+            The ID of the message.
         """
 
+        if inline_images:
+
+            message = build_message(
+                sender=sender,
+                recipient=recipient,
+                subject=subject,
+                body_html=body_html,
+                body_text=body_text,
+                charset=charset,
+                inline_images=inline_images
+            )
+
+            response = self.client.send_raw_email(
+                Source=sender,
+                Destinations=[recipient] + (
+                    [bcc_recipient] if bcc_recipient is not None else []
+                ),
+                RawMessage={"Data": message.as_bytes()}
+            )
+
+            return response["MessageId"]
+
         destination = {
             "ToAddresses": [
                 recipient,
@@ -79,7 +114,7 @@ class AWSMailSES:
                 bcc_recipient,
             ]
 
-        self.client.send_email(
+        response = self.client.send_email(
             Source=sender,
             Destination=destination,
             Message={
@@ -99,3 +134,107 @@ class AWSMailSES:
                 },
             }
         )
+
+        return response["MessageId"]
+
+    def get_max_send_rate(self) -> float:
+        """
+        Returns the sending quota of the account.
+
+        Returns
+        -------
+        float
+            The maximum number of emails sent per second.
+        """
+
+        return self.client.get_send_quota()["MaxSendRate"]
+
+    def create_template(
+            self,
+            name: str,
+            subject: str,
+            body_html: str,
+            body_text: str
+        ) -> None:
+        """
+        Creates an email template, written with Handlebars placeholders (e.g.
+        `{{first_name}}`). An existing template of the same name is kept.
+
+        Parameters
+        ----------
+        name : str
+            The name of the template.
+        subject : str
+            The subject line template.
+        body_html : str
+            The HTML body template.
+        body_text : str
+            The plain text body template.
+        """
+
+        try:
+            self.client.create_template(
+                Template={
+                    "TemplateName": name,
+                    "SubjectPart": subject,
+                    "HtmlPart": body_html,
+                    "TextPart": body_text
+                }
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "AlreadyExists":
+                raise
+
+    def send_bulk_templated_email(
+            self,
+            sender: str,
+            template: str,
+            destinations: list[dict]
+        ) -> list[dict]:
+        """
+        Sends a templated email to several recipients in one request (up to 50).
+
+        Parameters
+        ----------
+        sender : str
+            The email address of the sender.
+        template : str
+            The name of the template (see `create_template`).
+        destinations : list of dict
+            The recipients: `recipient`, `bcc_recipient` (or None) and the `data`
+            of the placeholders.
+
+        Returns
+        -------
+        list of dict
+            The result of each destination, in order: `status` ("Success" or an
+            error code), `message_id` and `error`.
+        """
+
+        response = self.client.send_bulk_templated_email(
+            Source=sender,
+            Template=template,
+            DefaultTemplateData="{}",
+            Destinations=[
+                {
+                    "Destination": {
+                        "ToAddresses": [destination["recipient"]],
+                        **(
+                            {"BccAddresses": [destination["bcc_recipient"]]}
+                            if destination["bcc_recipient"] is not None else {}
+                        )
+                    },
+                    "ReplacementTemplateData": json.dumps(destination["data"])
+                }
+                for destination in destinations
+            ]
+        )
+
+        return [
+            {
+                "status": status["Status"],
+                "message_id": status.get("MessageId"),
+                "error": status.get("Error")
+            }
+            for status in response["Status"]
+        ]
@@ -0,0 +1,180 @@
+import html
+import re
+import smtplib
+import threading
+
+from src.backend.mailing.rendering import build_message
+
+PLACEHOLDER = re.compile(r"\{\{(\{?)\s*(\w+)\s*\}?\}\}")
+
+
+def render_handlebars(
+        template: str,
+        data: dict
+    ) -> str:
+    """
+    Replaces the placeholders of a template, the subset of Handlebars used by the
+    SES templates: `{{name}}` is HTML-escaped, `{{{name}}}` is not.
+
+    Parameters
+    ----------
+    template : str
+        The template.
+    data : dict
+        The values of the placeholders.
+
+    Returns
+    -------
+    str
+        The rendered text.
+    """
+
+    def replace(match: re.Match) -> str:
+        value = str(data.get(match.group(2), ""))
+        return value if match.group(1) else html.escape(value)
+
+    return PLACEHOLDER.sub(replace, template)
+
+class LocalMailSES:
+    """
+    A stand-in for `AWSMailSES` that delivers to a local SMTP server, for offline
+    development and tests (`MAILING_BACKEND=local`), e.g. MailHog or:
+
+        python -m aiosmtpd -n -l localhost:1025
+
+    Templates are kept in memory and rendered locally, so that bulk sends behave
+    as with SES.
+    """
+
+    def __init__(
+            self,
+            host: str = "localhost",
+            port: int = 1025,
+            max_send_rate: float = 10.0
+        ) -> None:
+        """
+        Initializes the stand-in.
+
+        Parameters
+        ----------
+        host : str, optional
+            The host of the SMTP server (default is "localhost").
+        port : int, optional
+            The port of the SMTP server (default is 1025).
+        max_send_rate : float, optional
+            The simulated sending quota, in emails per second (default is 10).
+        """
+
+        self.host = host
+        self.port = port
+        self.max_send_rate = max_send_rate
+
+        self.templates: dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def send_email(
+            self,
+            sender: str,
+            recipient: str,
+            subject: str,
+            body_html: str,
+            body_text: str,
+            charset: str = "UTF-8",
+            bcc_recipient: str | None = None,
+            inline_images: dict[str, bytes] | None = None
+        ) -> str:
+        """
+        Sends an email to the SMTP server. See `AWSMailSES.send_email`.
+        """
+
+        message = build_message(
+            sender=sender,
+            recipient=recipient,
+            subject=subject,
+            body_html=body_html,
+            body_text=body_text,
+            charset=charset,
+            inline_images=inline_images
+        )
+
+        recipients = [recipient]
+        if bcc_recipient is not None:
+            recipients.append(bcc_recipient)
+
+        with smtplib.SMTP(self.host, self.port) as server:
+            server.send_message(message, to_addrs=recipients)
+
+        return message["Message-ID"]
+
+    def get_max_send_rate(self) -> float:
+        """
+        Returns the simulated sending quota. See `AWSMailSES.get_max_send_rate`.
+        """
+
+        return self.max_send_rate
+
+    def create_template(
+            self,
+            name: str,
+            subject: str,
+            body_html: str,
+            body_text: str
+        ) -> None:
+        """
+        Stores an email template. See `AWSMailSES.create_template`.
+        """
+
+        with self.lock:
+            self.templates.setdefault(
+                name,
+                {"subject": subject, "html": body_html, "text": body_text}
+            )
+
+    def send_bulk_templated_email(
+            self,
+            sender: str,
+            template: str,
+            destinations: list[dict]
+        ) -> list[dict]:
+        """
+        Renders and sends a templated email to each recipient. See
+        `AWSMailSES.send_bulk_templated_email`.
+        """
+
+        with self.lock:
+            parts = self.templates.get(template)
+
+        if parts is None:
+            return [
+                {
+                    "status": "TemplateDoesNotExist",
+                    "message_id": None,
+                    "error": f"Template {template} does not exist"
+                }
+                for _ in destinations
+            ]
+
+        results = []
+        for destination in destinations:
+            try:
+                message_id = self.send_email(
+                    sender=sender,
+                    recipient=destination["recipient"],
+                    bcc_recipient=destination["bcc_recipient"],
+                    subject=render_handlebars(parts["subject"], destination["data"]),
+                    body_html=render_handlebars(parts["html"], destination["data"]),
+                    body_text=render_handlebars(parts["text"], destination["data"])
+                )
+                results.append(
+                    {"status": "Success", "message_id": message_id, "error": None}
+                )
+            except smtplib.SMTPRecipientsRefused as e:
+                results.append(
+                    {"status": "MessageRejected", "message_id": None, "error": str(e)}
+                )
+            except (smtplib.SMTPException, OSError) as e:
+                results.append(
+                    {"status": "Failed", "message_id": None, "error": str(e)}
+                )
+
+        return results
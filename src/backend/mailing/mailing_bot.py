@@ -1,51 +1,154 @@
 import os
-from string import Template
+from functools import cache
+from typing import Callable
 
-from html2text import html2text
-from src.backend.mailing.aws_ses import AWSMailSES
+from src.backend.mailing.outbox import get_outbox
+from src.backend.mailing.rendering import EmailTemplate
 from src.backend.utils.file_io import recursive_read
 
+SENDER = "support@ai-apps.cloud"
+
+SUBJECTS = {
+    "welcome": "Welcome to Docu Talk!",
+    "welcome_no_ids": "Welcome to Docu Talk!",
+    "chatbot_shared": "$sharing_name shared a Chat Bot with you!"
+}
+
+
+@cache
+def get_email_service():
+    """
+    Creates the email service, on first use. `MAILING_BACKEND=local` sends to a
+    local SMTP server (`SMTP_HOST` and `SMTP_PORT`) instead of AWS SES.
+
+    Returns
+    -------
+    AWSMailSES or LocalMailSES
+        The email service.
+    """
+
+    if os.getenv("MAILING_BACKEND", "ses") == "local":
+        from src.backend.mailing.local_ses import LocalMailSES
+        return LocalMailSES(
+            host=os.getenv("SMTP_HOST", "localhost"),
+            port=int(os.getenv("SMTP_PORT", "1025"))
+        )
+
+    from src.backend.mailing.aws_ses import AWSMailSES
+    return AWSMailSES(
+        server_public_key=os.getenv("AWS_SES_SERVER_PUBLIC_KEY"),
+        server_secret_key=os.getenv("AWS_SES_SERVER_SECRET_KEY"),
+        region=os.getenv("AWS_SES_REGION")
+    )
+
+@cache
+def get_templates(
+        logo_path: str,
+        logo_url: str | None = None
+    ) -> dict[str, EmailTemplate]:
+    """
+    Reads and compiles the email templates, on first use.
+
+    Parameters
+    ----------
+    logo_path : str
+        The path of the PNG logo, attached to each email when it is not hosted.
+    logo_url : str or None, optional
+        The URL of the hosted logo (default is None).
+
+    Returns
+    -------
+    dict
+        The compiled templates keyed by file name.
+    """
+
+    if logo_url is not None:
+        constants, inline_images = {"logo_src": logo_url}, {}
+    else:
+        with open(logo_path, "rb") as f:
+            inline_images = {"logo": f.read()}
+        constants = {"logo_src": "cid:logo"}
+
+    emails = recursive_read(
+        folder=os.path.join(os.path.dirname(__file__), "templates"),
+        extensions=(".html")
+    )
+
+    return {
+        name: EmailTemplate(
+            name=name,
+            subject=SUBJECTS[name],
+            body_html=html,
+            constants=constants,
+            inline_images=inline_images
+        )
+        for name, html in emails.items()
+    }
 
 class MailingBot:
     """
     A class to handle sending templated emails using AWS SES.
+
+    The emails are not sent in the request: they are queued in the outbox (see
+    `Outbox`) and sent in the background, from templates compiled once per process
+    (see `EmailTemplate`). The password of a welcome email is not queued: it is
+    generated and set when the email is sent.
     """
 
     def __init__(
             self,
-            encoded_logo: bytes
+            logo_path: str,
+            db,
+            reset_password: Callable[[str, str], str] | None = None
         ) -> None:
         """
         Initializes the MailingBot with email templates and AWS SES configuration.
 
         Parameters
         ----------
-        encoded_logo : bytes
-            The base64-encoded logo to embed in email templates.
+        logo_path : str
+            The path of the PNG logo of the emails. `MAILING_LOGO_URL`, when set,
+            is linked instead of attaching the logo to each email.
+        db : Database
+            The database holding the outbox.
+        reset_password : Callable or None, optional
+            The function setting a new password for a user ID and returning it, the
+            same for the same key, e.g. `DocuTalk.reset_password`, required by the
+            welcome emails with the login details (default is None).
         """
 
-        self.email_service = AWSMailSES(
-            server_public_key=os.getenv("AWS_SES_SERVER_PUBLIC_KEY"),
-            server_secret_key=os.getenv("AWS_SES_SERVER_SECRET_KEY"),
-            region=os.getenv("AWS_SES_REGION")
-        )
+        self.reset_password = reset_password
+
+        generators = {}
+        if reset_password is not None:
+            # Keyed by the email, so that sending it again gives the same password
+            generators["welcome"] = lambda email: {
+                "password": reset_password(email["data"]["id"], email["id"])
+            }
+
+        self.email_service = get_email_service()
 
-        self.emails = recursive_read(
-            folder=os.path.join(os.path.dirname(__file__), "templates"),
-            extensions=(".html")
+        self.templates = get_templates(
+            logo_path=logo_path,
+            logo_url=os.getenv("MAILING_LOGO_URL")
         )
 
-        self.encoded_logo = encoded_logo
+        self.outbox = get_outbox(
+            db=db,
+            email_service=self.email_service,
+            templates=self.templates,
+            generators=generators
+        )
 
     def send_welcome_email(
             self,
             recipient: str,
             first_name: str,
-            id: str | None = None,
-            password: str | None = None
+            id: str | None = None
         ) -> None:
         """
-        Sends a welcome email to a new user.
+        Queues a welcome email to a new user. With an ID, the email gives the login
+        details: a new password is set when it is sent, so that it is never stored.
 
         Parameters
         ----------
@@ -53,32 +156,30 @@ class MailingBot:
             The email address of the recipient.
         first_name : str
             The first name of the recipient.
-        id : str
-            The user ID for the recipient.
-        password : str
-            The generated password for the recipient.
+        id : str or None, optional
+            The user ID for the recipient (default is None).
+
+        Raises
+        ------
+        ValueError
+            If an ID is given without `reset_password`.
         """
 
         if id is not None:
-            html = Template(self.emails["welcome"]).substitute(
-                logo=self.encoded_logo,
-                first_name=first_name,
-                id=id,
-                password=password
-            )
+            if self.reset_password is None:
+                raise ValueError("The login details require `reset_password`")
+            template = "welcome"
+            data = {"first_name": first_name, "id": id}
         else:
-            html = Template(self.emails["welcome_no_ids"]).substitute(
-                logo=self.encoded_logo,
-                first_name=first_name
-            )
+            template = "welcome_no_ids"
+            data = {"first_name": first_name}
 
-        self.email_service.send_email(
-            sender="support@ai-apps.cloud",
+        self.outbox.enqueue(
+            template=template,
+            sender=SENDER,
             recipient=recipient,
-            bcc_recipient="support@ai-apps.cloud",
-            subject="Welcome to Docu Talk!",
-            body_html=html,
-            body_text=html2text(html)
+            bcc_recipient=SENDER,
+            data=data
         )
 
     def send_chatbot_shared_email(
@@ -88,7 +189,8 @@ class MailingBot:
             chatbot_name: str
         ) -> None:
         """
-        Sends an email notifying the recipient that a chatbot has been shared with them.
+        Queues an email notifying the recipient that a chatbot has been shared with
+        them.
 
         Parameters
         ----------
@@ -100,17 +202,10 @@ class MailingBot:
             The name of the chatbot being shared.
         """
 
-        html = Template(self.emails["chatbot_shared"]).substitute(
-            logo=self.encoded_logo,
-            sharing_name=sharing_name,
-            chatbot_name=chatbot_name
-        )
-
-        self.email_service.send_email(
-            sender="support@ai-apps.cloud",
+        self.outbox.enqueue(
+            template="chatbot_shared",
+            sender=SENDER,
             recipient=recipient,
-            bcc_recipient="support@ai-apps.cloud",
-            subject=f"{sharing_name} shared a Chat Bot with you!",
-            body_html=html,
-            body_text=html2text(html)
+            bcc_recipient=SENDER,
+            data={"sharing_name": sharing_name, "chatbot_name": chatbot_name}
         )
@@ -0,0 +1,638 @@
+import hashlib
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Callable
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+from pymongo import ReturnDocument
+from src.backend.docu_talk.agents.chatbot.scheduler import TokenBucket
+from src.backend.mailing.rendering import EmailTemplate
+
+logger = logging.getLogger(__name__)
+
+# The maximum number of destinations of a `send_bulk_templated_email` request
+MAX_BULK_DESTINATIONS = 50
+
+# Errors for which sending the email again would fail again
+PERMANENT_ERRORS = {
+    "MessageRejected",
+    "MailFromDomainNotVerified",
+    "InvalidParameterValue",
+    "InvalidRenderingParameter",
+    "SMTPRecipientsRefused",
+    "KeyError",
+    "ValueError"
+}
+
+
+def get_error_code(error: Exception) -> str:
+    """
+    Returns the error code of an AWS error, or the name of any other exception.
+    """
+
+    if isinstance(error, ClientError):
+        return error.response["Error"]["Code"]
+
+    return type(error).__name__
+
+class Outbox:
+    """
+    A durable queue of outgoing emails, stored in the Outbox table and sent by a
+    background thread, so that requests only insert a record.
+
+    The emails of a template are sent together with `send_bulk_templated_email`
+    once the template is registered on the email service; when it has inline
+    images (not supported by bulk sends) or registration fails (e.g. missing
+    permissions), they are rendered and sent one by one. Sending is
+    rate limited under the quota of the service. A failed email is retried with an
+    exponential backoff, up to `max_attempts` attempts, unless it was rejected for
+    good. Delivery is at least once: an email whose sender died while sending it is
+    sent again when its lease expires. An instance claims no more emails than it
+    can send within half a lease, and only records the outcome of the emails it
+    still holds. The data of an email is erased once it is sent or failed, and
+    secrets (e.g. a generated password) are not stored at all: they are made by
+    the generator of the template when the email is sent, the same at each
+    attempt.
+    """
+
+    def __init__(
+            self,
+            db,
+            email_service,
+            templates: dict[str, EmailTemplate],
+            generators: dict[str, Callable[[dict], dict]] | None = None,
+            send_rate: float | None = None,
+            nb_instances: int = 1,
+            bulk: bool = True,
+            batch_size: int = 100,
+            lease_duration: float = 60.0,
+            poll_interval: float = 2.0,
+            max_attempts: int = 5,
+            retry_delay: float = 10.0
+        ) -> None:
+        """
+        Initializes the outbox. The sender is started by `start`.
+
+        Parameters
+        ----------
+        db : Database
+            The database holding the Outbox table.
+        email_service : AWSMailSES or LocalMailSES
+            The email service.
+        templates : dict
+            The compiled templates by name.
+        generators : dict or None, optional
+            The functions that complete the stored data of an email when it is sent,
+            given its record, by template name (default is None). As an email may
+            be sent more than once, they should give the same values for the same
+            email (e.g. keyed by its ID).
+        send_rate : float or None, optional
+            The maximum number of emails sent per second by this instance (default
+            is None, 80% of the quota of the service shared by the instances).
+        nb_instances : int, optional
+            The maximum number of instances sending at once, which share the quota
+            (default is 1).
+        bulk : bool, optional
+            Whether the templates are registered on the service to send emails in
+            bulk (default is True).
+        batch_size : int, optional
+            The maximum number of emails claimed at once (default is 100), lowered
+            to the emails sent within half a lease at the rate limit.
+        lease_duration : float, optional
+            The time after which an email being sent is considered lost, in
+            seconds (default is 60).
+        poll_interval : float, optional
+            The interval between two polls of an idle sender in seconds (default
+            is 2).
+        max_attempts : int, optional
+            The maximum number of attempts of an email (default is 5).
+        retry_delay : float, optional
+            The delay before the first retry in seconds, doubled at each attempt
+            (default is 10).
+        """
+
+        self.db = db
+        self.email_service = email_service
+        self.templates = templates
+        self.generators = generators or {}
+        self.send_rate = send_rate
+        self.nb_instances = nb_instances
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self.lease_duration = lease_duration
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        # Set by the sender thread, to keep the network out of the requests
+        self.rate_limiter: TokenBucket | None = None
+        self.chunk_size = MAX_BULK_DESTINATIONS
+        self.claim_size = batch_size
+        self.template_names: dict[str, str] = {}
+
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+        self.lock = threading.Lock()
+        self.wake_up = threading.Event()
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+
+        self.db.ensure_index(table="Outbox", columns=[("id", 1)])
+        self.db.ensure_index(
+            table="Outbox",
+            columns=[("status", 1), ("available_at", 1)]
+        )
+
+    @property
+    def table(self):
+        return self.db.database["Outbox"]
+
+    def enqueue(
+            self,
+            template: str,
+            sender: str,
+            recipient: str,
+            data: dict,
+            bcc_recipient: str | None = None
+        ) -> str:
+        """
+        Adds an email to the outbox.
+
+        Parameters
+        ----------
+        template : str
+            The name of the template.
+        sender : str
+            The email address of the sender.
+        recipient : str
+            The email address of the recipient.
+        data : dict
+            The values of the placeholders of the template.
+        bcc_recipient : str or None, optional
+            The email address for BCC (default is None).
+
+        Returns
+        -------
+        str
+            The email's unique identifier.
+        """
+
+        email_id = self.db.insert_data(
+            table="Outbox",
+            data={
+                "template": template,
+                "sender": sender,
+                "recipient": recipient,
+                "bcc_recipient": bcc_recipient,
+                "data": data,
+                "status": "pending",
+                "attempts": 0,
+                "available_at": datetime.now()
+            }
+        )
+
+        self.start()
+        self.wake_up.set()
+
+        return email_id
+
+    def prepare(self) -> None:
+        """
+        Sets the rate limit and registers the templates on the email service.
+        """
+
+        send_rate = self.send_rate
+        if send_rate is None:
+            try:
+                quota = self.email_service.get_max_send_rate()
+            except Exception as e:
+                logger.warning(f"Failed to read the sending quota: {e}")
+                quota = 1.0
+            # The quota is shared by the account, not per instance
+            send_rate = 0.8 * quota / self.nb_instances
+
+        # A bucket of one second of quota, which bounds the size of a bulk request
+        capacity = max(send_rate, 1.0)
+        self.rate_limiter = TokenBucket(
+            rate_per_minute=send_rate * 60,
+            capacity=capacity
+        )
+        self.chunk_size = min(MAX_BULK_DESTINATIONS, int(capacity))
+
+        # The claimed emails are sent before their lease expires
+        self.claim_size = max(
+            1,
+            min(self.batch_size, int(send_rate * self.lease_duration / 2))
+        )
+
+        if not self.bulk:
+            return
+
+        for name, template in self.templates.items():
+
+            if template.inline_images:
+                continue
+
+            # Versioned by content, so that instances running different versions
+            # do not overwrite each other's templates
+            digest = hashlib.sha256(
+                "".join(template.handlebars.values()).encode()
+            ).hexdigest()
+            template_name = f"docu-talk-{name}-{digest[:12]}"
+
+            try:
+                self.email_service.create_template(
+                    name=template_name,
+                    **template.handlebars
+                )
+                self.template_names[name] = template_name
+            except Exception as e:
+                logger.warning(
+                    f"Failed to register the template `{name}`, its emails are "
+                    f"sent one by one: {e}"
+                )
+
+    def claim(self) -> list[dict]:
+        """
+        Takes the emails to send, oldest first: pending emails that are due, and
+        emails whose lease expired.
+
+        Returns
+        -------
+        list of dict
+            The email records, at most `claim_size`.
+        """
+
+        emails = []
+
+        while len(emails) < self.claim_size:
+
+            now = datetime.now()
+
+            email = self.table.find_one_and_update(
+                filter={
+                    "$or": [
+                        {"status": "pending", "available_at": {"$lte": now}},
+                        {"status": "sending", "lease_expires_at": {"$lt": now}}
+                    ]
+                },
+                update={
+                    "$set": {
+                        "status": "sending",
+                        "lease_owner": self.owner,
+                        "lease_expires_at": (
+                            now + timedelta(seconds=self.lease_duration)
+                        )
+                    },
+                    "$inc": {"attempts": 1}
+                },
+                sort=[("available_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+
+            if email is None:
+                break
+
+            emails.append(email)
+
+        return emails
+
+    def send(self, emails: list[dict]) -> None:
+        """
+        Sends emails, in bulk by template and sender when possible.
+
+        Parameters
+        ----------
+        emails : list of dict
+            The email records.
+        """
+
+        groups: dict[tuple[str, str], list[dict]] = {}
+        for email in emails:
+            groups.setdefault((email["template"], email["sender"]), []).append(email)
+
+        for (template, _), group in groups.items():
+
+            if template not in self.template_names:
+                for email in group:
+                    self.send_one(email)
+                continue
+
+            for i in range(0, len(group), self.chunk_size):
+                self.send_bulk(template, group[i:i + self.chunk_size])
+
+    def send_bulk(
+            self,
+            template: str,
+            emails: list[dict]
+        ) -> None:
+        """
+        Sends emails of the same template and sender in one request.
+
+        Parameters
+        ----------
+        template : str
+            The name of the template.
+        emails : list of dict
+            The email records.
+        """
+
+        self.rate_limiter.acquire(len(emails))
+
+        ready, destinations = [], []
+        for email in emails:
+            try:
+                data = self.get_data(email)
+            except Exception as e:
+                self.fail(email, get_error_code(e), str(e))
+                continue
+            ready.append(email)
+            destinations.append(
+                {
+                    "recipient": email["recipient"],
+                    "bcc_recipient": email["bcc_recipient"],
+                    "data": data
+                }
+            )
+
+        if len(ready) == 0:
+            return
+
+        try:
+            results = self.email_service.send_bulk_templated_email(
+                sender=ready[0]["sender"],
+                template=self.template_names[template],
+                destinations=destinations
+            )
+        except Exception as e:
+            for email in ready:
+                self.fail(email, get_error_code(e), str(e))
+            return
+
+        for email, result in zip(ready, results, strict=True):
+            if result["status"] == "Success":
+                self.mark_sent(email, result["message_id"])
+            else:
+                self.fail(email, result["status"], result["error"])
+
+    def send_one(self, email: dict) -> None:
+        """
+        Renders and sends an email.
+
+        Parameters
+        ----------
+        email : dict
+            The email record.
+        """
+
+        self.rate_limiter.acquire()
+
+        try:
+            template = self.templates[email["template"]]
+            message_id = self.email_service.send_email(
+                sender=email["sender"],
+                recipient=email["recipient"],
+                bcc_recipient=email["bcc_recipient"],
+                inline_images=template.inline_images,
+                **template.render(self.get_data(email))
+            )
+        except Exception as e:
+            self.fail(email, get_error_code(e), str(e))
+            return
+
+        self.mark_sent(email, message_id)
+
+    def get_data(self, email: dict) -> dict:
+        """
+        Returns the values of the placeholders of an email, completed by the
+        generator of its template from the email record.
+
+        Parameters
+        ----------
+        email : dict
+            The email record.
+
+        Returns
+        -------
+        dict
+            The values of the placeholders.
+        """
+
+        data = dict(email["data"])
+
+        generate = self.generators.get(email["template"])
+        if generate is not None:
+            data.update(generate(email))
+
+        return data
+
+    def mark_sent(
+            self,
+            email: dict,
+            message_id: str | None
+        ) -> None:
+        """
+        Records that an email was sent and erases its data.
+
+        Parameters
+        ----------
+        email : dict
+            The email record.
+        message_id : str or None
+            The ID of the message given by the email service.
+        """
+
+        self.save(
+            email,
+            {
+                "status": "sent",
+                "sent_at": datetime.now(),
+                "message_id": message_id,
+                "data": {},
+                "lease_owner": None,
+                "error": None
+            }
+        )
+
+    def fail(
+            self,
+            email: dict,
+            code: str,
+            message: str | None
+        ) -> None:
+        """
+        Schedules the retry of an email that was not sent, or fails it after
+        `max_attempts` attempts or when it was rejected for good.
+
+        Parameters
+        ----------
+        email : dict
+            The email record.
+        code : str
+            The error code.
+        message : str or None
+            The error message.
+        """
+
+        error = f"{code}: {message}"
+
+        if email["attempts"] < self.max_attempts and code not in PERMANENT_ERRORS:
+            delay = self.retry_delay * 2 ** (email["attempts"] - 1)
+            logger.warning(
+                f"Email {email['id']} not sent, retry in {delay:g}s: {error}"
+            )
+            updates = {
+                "status": "pending",
+                "available_at": datetime.now() + timedelta(seconds=delay),
+                "lease_owner": None,
+                "error": error
+            }
+        else:
+            logger.error(f"Email {email['id']} not sent: {error}")
+            updates = {
+                "status": "failed",
+                "data": {},
+                "lease_owner": None,
+                "error": error
+            }
+
+        self.save(email, updates)
+
+    def save(
+            self,
+            email: dict,
+            updates: dict
+        ) -> None:
+        """
+        Updates an email held by this instance. An email taken over by another
+        instance (its lease expired) is left to it.
+
+        Parameters
+        ----------
+        email : dict
+            The email record.
+        updates : dict
+            The updated fields.
+        """
+
+        result = self.table.update_one(
+            {"id": email["id"], "lease_owner": self.owner},
+            {"$set": updates}
+        )
+
+        if result.matched_count == 0:
+            logger.warning(f"The lease of the email {email['id']} was lost")
+
+    def work(self) -> None:
+        """
+        Sends the emails of the outbox until it is stopped.
+        """
+
+        self.prepare()
+
+        while not self.stopped.is_set():
+
+            try:
+                emails = self.claim()
+            except Exception as e:
+                logger.warning(f"Failed to claim emails: {e}")
+                emails = []
+
+            if len(emails) == 0:
+                self.wake_up.wait(self.poll_interval)
+                self.wake_up.clear()
+                continue
+
+            try:
+                self.send(emails)
+            except Exception as e:
+                # The emails are sent again when their lease expires
+                logger.warning(f"Failed to send emails: {e}")
+
+    def start(self) -> None:
+        """
+        Starts the sender, once.
+        """
+
+        with self.lock:
+
+            if self.thread is not None:
+                return
+
+            self.thread = threading.Thread(target=self.work, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        """
+        Stops the sender after its current batch.
+
+        Parameters
+        ----------
+        timeout : float or None, optional
+            The maximum time to wait for the sender in seconds (default is 5).
+        """
+
+        self.stopped.set()
+        self.wake_up.set()
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+def get_outbox(
+        db,
+        email_service,
+        templates: dict[str, EmailTemplate],
+        generators: dict[str, Callable[[dict], dict]] | None = None
+    ) -> Outbox:
+    """
+    Returns the process-wide outbox, created and started on first call with the
+    given arguments. `MAILING_SEND_RATE` sets its rate in emails per second and per
+    instance (default is 80% of the quota of the service divided by
+    `MAILING_INSTANCES`, the maximum number of instances, default is 1) and
+    `MAILING_BULK=false` disables the bulk sends.
+
+    Parameters
+    ----------
+    db : Database
+        The database used when the outbox is created.
+    email_service : AWSMailSES or LocalMailSES
+        The email service used when the outbox is created.
+    templates : dict
+        The templates used when the outbox is created.
+    generators : dict or None, optional
+        The generators used when the outbox is created (default is None).
+
+    Returns
+    -------
+    Outbox
+        The outbox.
+    """
+
+    global outbox
+
+    if outbox is None:
+        with outbox_lock:
+            if outbox is None:
+
+                send_rate = os.getenv("MAILING_SEND_RATE")
+
+                outbox = Outbox(
+                    db=db,
+                    email_service=email_service,
+                    templates=templates,
+                    generators=generators,
+                    send_rate=float(send_rate) if send_rate is not None else None,
+                    nb_instances=int(os.getenv("MAILING_INSTANCES", "1")),
+                    bulk=os.getenv("MAILING_BULK", "true").lower() == "true"
+                )
+
+                outbox.start()
+
+    return outbox
+
+outbox: Outbox | None = None
+outbox_lock = threading.Lock()
@@ -0,0 +1,267 @@
+import html
+import re
+from email.message import EmailMessage
+from email.utils import make_msgid
+from string import Template
+
+from html2text import HTML2Text
+
+# The slots of the text part, converted from the HTML with these markers
+TEXT_SLOT = re.compile(r"\{\{(\w+)\}\}")
+
+
+def split_template(
+        template: str,
+        constants: dict | None = None,
+        escape: bool = False
+    ) -> tuple[list[str], list[str]]:
+    """
+    Splits a `string.Template` into static chunks and variable slots. The
+    constants are written in the chunks.
+
+    Parameters
+    ----------
+    template : str
+        The template.
+    constants : dict or None, optional
+        The values of the placeholders known at compile time (default is None).
+    escape : bool, optional
+        Whether the constants are HTML-escaped (default is False).
+
+    Returns
+    -------
+    tuple of list of str
+        The chunks and the names of the slots between them (one chunk more than
+        slots).
+
+    Raises
+    ------
+    ValueError
+        If the template has an invalid placeholder.
+    """
+
+    constants = constants or {}
+
+    chunks, names = [], []
+    current, position = [], 0
+
+    for match in Template.pattern.finditer(template):
+
+        current.append(template[position:match.start()])
+        position = match.end()
+
+        name = match.group("named") or match.group("braced")
+        if match.group("escaped") is not None:
+            current.append("$")
+        elif name is None:
+            raise ValueError(f"Invalid placeholder at position {match.start()}")
+        elif name in constants:
+            value = str(constants[name])
+            current.append(html.escape(value) if escape else value)
+        else:
+            chunks.append("".join(current))
+            names.append(name)
+            current = []
+
+    current.append(template[position:])
+    chunks.append("".join(current))
+
+    return chunks, names
+
+def join_template(
+        chunks: list[str],
+        names: list[str],
+        values: dict,
+        escape: bool = False
+    ) -> str:
+    """
+    Fills the slots of a split template.
+
+    Parameters
+    ----------
+    chunks : list of str
+        The static chunks.
+    names : list of str
+        The names of the slots.
+    values : dict
+        The values of the slots.
+    escape : bool, optional
+        Whether the values are HTML-escaped (default is False).
+
+    Returns
+    -------
+    str
+        The rendered text.
+
+    Raises
+    ------
+    KeyError
+        If a value is missing.
+    """
+
+    parts = [chunks[0]]
+    for name, chunk in zip(names, chunks[1:], strict=True):
+        value = str(values[name])
+        parts.append(html.escape(value) if escape else value)
+        parts.append(chunk)
+
+    return "".join(parts)
+
+def html_to_text(body_html: str) -> str:
+    """
+    Converts an HTML body into the plain text part of an email, without images.
+    """
+
+    converter = HTML2Text()
+    converter.ignore_images = True
+
+    return converter.handle(body_html)
+
+class EmailTemplate:
+    """
+    An email template compiled once: its subject, HTML and text parts are split
+    into static chunks and variable slots, so that a send only joins the chunks
+    with the values (HTML-escaped in the HTML part). The text part is converted
+    from the HTML at compile time, and the constants (e.g. the source of the logo)
+    are written in the chunks.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            subject: str,
+            body_html: str,
+            constants: dict | None = None,
+            inline_images: dict[str, bytes] | None = None
+        ) -> None:
+        """
+        Compiles a template.
+
+        Parameters
+        ----------
+        name : str
+            The name of the template.
+        subject : str
+            The subject line, a `string.Template`.
+        body_html : str
+            The HTML body, a `string.Template`.
+        constants : dict or None, optional
+            The values of the placeholders known at compile time (default is None).
+        inline_images : dict or None, optional
+            The PNG images attached to each message, by content ID, referenced as
+            `cid:...` in the HTML body (default is None).
+        """
+
+        self.name = name
+        self.inline_images = inline_images or {}
+
+        self.subject = split_template(subject, constants)
+        self.html = split_template(body_html, constants, escape=True)
+
+        # Converted once, with markers in place of the slots
+        marked_html = join_template(
+            *self.html,
+            values={name: "{{" + name + "}}" for name in self.html[1]}
+        )
+        marked_text = html_to_text(marked_html)
+        self.text = (
+            TEXT_SLOT.split(marked_text)[::2],
+            TEXT_SLOT.findall(marked_text)
+        )
+
+        # The same parts with Handlebars placeholders, for the SES templates. The
+        # values are only escaped in the HTML part ("{{{name}}}" is not escaped)
+        self.handlebars = {
+            "subject": join_template(
+                *self.subject,
+                values={name: "{{{" + name + "}}}" for name in self.subject[1]}
+            ),
+            "body_html": marked_html,
+            "body_text": join_template(
+                *self.text,
+                values={name: "{{{" + name + "}}}" for name in self.text[1]}
+            )
+        }
+
+    def render(self, data: dict) -> dict[str, str]:
+        """
+        Renders an email.
+
+        Parameters
+        ----------
+        data : dict
+            The values of the slots.
+
+        Returns
+        -------
+        dict
+            The `subject`, `body_html` and `body_text` of the email.
+
+        Raises
+        ------
+        KeyError
+            If a value is missing.
+        """
+
+        return {
+            "subject": join_template(*self.subject, values=data),
+            "body_html": join_template(*self.html, values=data, escape=True),
+            "body_text": join_template(*self.text, values=data)
+        }
+
+def build_message(
+        sender: str,
+        recipient: str,
+        subject: str,
+        body_html: str,
+        body_text: str,
+        charset: str = "UTF-8",
+        inline_images: dict[str, bytes] | None = None
+    ) -> EmailMessage:
+    """
+    Builds a MIME message with a text and an HTML part, and the inline images of
+    the HTML part. The BCC recipients are not written in the headers.
+
+    Parameters
+    ----------
+    sender : str
+        The email address of the sender.
+    recipient : str
+        The email address of the recipient.
+    subject : str
+        The subject line of the email.
+    body_html : str
+        The HTML version of the email body.
+    body_text : str
+        The plain text version of the email body.
+    charset : str, optional
+        The character set for the email content (default is "UTF-8").
+    inline_images : dict or None, optional
+        The PNG images referenced by the HTML part, by content ID (default is
+        None).
+
+    Returns
+    -------
+    EmailMessage
+        The message.
+    """
+
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = subject
+    message["Message-ID"] = make_msgid()
+    message.set_content(body_text, charset=charset)
+    message.add_alternative(body_html, subtype="html", charset=charset)
+
+    html_part = message.get_payload()[1]
+    for content_id, image in (inline_images or {}).items():
+        html_part.add_related(
+            image,
+            maintype="image",
+            subtype="png",
+            cid=f"<{content_id}>",
+            disposition="inline"
+        )
+
+    return message
@@ -1,7 +1,10 @@
+import random
 import re
 import secrets
 import string
+from datetime import datetime, timedelta, timezone
 
+import jwt
 from bcrypt import checkpw, gensalt, hashpw
 
 
@@ -23,7 +26,10 @@ def is_valid_email(email: str):
     pattern = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
     return re.match(pattern, email) is not None
 
-def generate_password(length: int = 12):
+def generate_password(
+        length: int = 12,
+        seed: bytes | None = None
+    ):
     """
     Generates a random password with a specified length, ensuring it includes at least
     one character from each of the following categories: uppercase letters, lowercase
@@ -33,6 +39,9 @@ def generate_password(length: int = 12):
     ----------
     length : int, optional
         The length of the password to generate (default is 12).
+    seed : bytes or None, optional
+        A secret seed, which always gives the same password (default is None, a
+        new password each time).
 
     Returns
     -------
@@ -47,19 +56,28 @@ def generate_password(length: int = 12):
         string.digits
     ]
 
+    if seed is None:
+        rng = secrets.SystemRandom()
+    else:
+        # Only as unpredictable as the seed, which must be secret
+        rng = random.Random(seed)  # noqa: S311
+
     character_pool, password = "", []
     for character_types in list_character_types:
-        password.append(secrets.choice(character_types))
+        password.append(rng.choice(character_types))
         character_pool += character_types
 
     while len(password) < length:
-        password.append(secrets.choice(character_pool))
+        password.append(rng.choice(character_pool))
 
-    secrets.SystemRandom().shuffle(password)
+    rng.shuffle(password)
 
     return "".join(password)
 
-def hash_password(password: str):
+def hash_password(
+        password: str,
+        rounds: int = 12
+    ):
     """
     Hashes a password using bcrypt.
 
@@ -67,6 +85,9 @@ def hash_password(password: str):
     ----------
     password : str
         The plaintext password to hash.
+    rounds : int, optional
+        The work factor, as a base-2 logarithm of the number of iterations (default
+        is 12).
 
     Returns
     -------
@@ -74,7 +95,27 @@ def hash_password(password: str):
         The hashed password.
     """
 
-    return hashpw(password.encode("utf-8"), gensalt())
+    return hashpw(password.encode("utf-8"), gensalt(rounds=rounds))
+
+def get_password_rounds(hashed: str | bytes) -> int:
+    """
+    Reads the work factor of a bcrypt hash (e.g. 12 in "$2b$12$...").
+
+    Parameters
+    ----------
+    hashed : str or bytes
+        The hashed password.
+
+    Returns
+    -------
+    int
+        The work factor.
+    """
+
+    if isinstance(hashed, str):
+        hashed = hashed.encode("utf-8")
+
+    return int(hashed.split(b"$")[2])
 
 def verify_password(
         password: str,
@@ -96,4 +137,95 @@ def verify_password(
         True if the password matches the hash, False otherwise.
     """
 
+    if isinstance(hashed, str):
+        hashed = hashed.encode("utf-8")
+
     return checkpw(password.encode("utf-8"), hashed)
+
+def get_client_ip(
+        forwarded_for: str | None,
+        nb_proxies: int = 1
+    ) -> str | None:
+    """
+    Reads the IP address of a client from the X-Forwarded-For header. Each proxy
+    appends the address it received the request from, so the address appended by
+    the outermost trusted proxy is taken, and the addresses a client may have
+    forged before it are ignored.
+
+    Parameters
+    ----------
+    forwarded_for : str or None
+        The X-Forwarded-For header.
+    nb_proxies : int, optional
+        The number of trusted proxies in front of the application (default is 1).
+
+    Returns
+    -------
+    str or None
+        The IP address, or None if the header is missing or too short.
+    """
+
+    if not forwarded_for:
+        return None
+
+    addresses = [address.strip() for address in forwarded_for.split(",")]
+    if len(addresses) < nb_proxies or nb_proxies < 1:
+        return None
+
+    return addresses[-nb_proxies]
+
+def generate_token(
+        user_id: str,
+        secret_key: str,
+        expiration_hours: float = 1
+    ) -> str:
+    """
+    Generates a JWT token (HS256) for a given user ID.
+
+    Parameters
+    ----------
+    user_id : str
+        The user ID to include in the token payload.
+    secret_key : str
+        The secret key for encoding the token.
+    expiration_hours : float, optional
+        Token expiration time in hours (default is 1).
+
+    Returns
+    -------
+    str
+        The generated JWT token.
+    """
+
+    data = {
+        "user_id": user_id,
+        "exp": datetime.now(timezone.utc) + timedelta(hours=expiration_hours)
+    }
+
+    return jwt.encode(payload=data, key=secret_key, algorithm="HS256")
+
+def verify_token(
+        token: str,
+        secret_key: str
+    ) -> str | None:
+    """
+    Verifies a JWT token and extracts the user ID.
+
+    Parameters
+    ----------
+    token : str
+        The JWT token to verify.
+    secret_key : str
+        The secret key the token was encoded with.
+
+    Returns
+    -------
+    str or None
+        The user ID if the token is valid, otherwise None.
+    """
+
+    try:
+        decoded_token = jwt.decode(jwt=token, key=secret_key, algorithms=["HS256"])
+        return decoded_token["user_id"]
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, KeyError):
+        return None
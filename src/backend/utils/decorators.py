@@ -1,5 +1,6 @@
 import random
 import time
+from functools import wraps
 
 
 def retry_with_exponential_backoff(
@@ -38,6 +39,7 @@ def retry_with_exponential_backoff(
     """
 
     def decorator(func):
+        @wraps(func)
         def wrapper(*args, **kwargs):
             num_retries = 0
             delay = initial_delay
@@ -1,9 +1,11 @@
 import base64
+import csv
+import io
+import json
 import os
 from typing import Any, Dict
 
-import fitz
-from easyenvi import file
+from src.backend.utils.misc import atomic_write
 
 
 def recursive_read(
@@ -47,10 +49,13 @@ def recursive_read(
                 else:
                     key = item
 
-                if extension == ".html":
+                if extension in (".html", ".md", ".txt"):
+                    # Plain text files are read directly, without importing easyenvi
                     with open(item_path, "r", encoding="utf-8") as f:
                         result[key] = f.read()
                 else:
+                    from easyenvi import file
+
                     result[key] = file.load(item_path)
 
     return result
@@ -90,6 +95,134 @@ def get_nb_pages_pdf(pdf_bytes):
         The number of pages in the PDF document.
     """
 
+    import fitz
+
     pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
 
     return pdf_document.page_count
+
+def read_records(path: str) -> list[dict]:
+    """
+    Reads the records of a JSON Lines or CSV file (by its extension). Incomplete
+    records, e.g. the last one of an interrupted write, are skipped (rewrite the
+    file with `write_records` before appending to it again).
+
+    Parameters
+    ----------
+    path : str
+        The file path. A missing file has no records.
+
+    Returns
+    -------
+    list of dict
+        The records (the values of a CSV file are strings).
+    """
+
+    if not os.path.exists(path):
+        return []
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        content = f.read()
+
+    if path.endswith(".csv"):
+        return [
+            record for record in csv.DictReader(io.StringIO(content))
+            if None not in record.values()
+        ]
+
+    records = []
+    for line in content.splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+
+    return records
+
+def format_records(
+        path: str,
+        records: list[dict],
+        fieldnames: list[str],
+        header: bool = True
+    ) -> str:
+    """
+    Formats records as JSON Lines or CSV, according to the extension of a path.
+
+    Parameters
+    ----------
+    path : str
+        The file path.
+    records : list of dict
+        The records.
+    fieldnames : list of str
+        The fields written, in order.
+    header : bool, optional
+        Whether to start CSV records with a header (default is True).
+
+    Returns
+    -------
+    str
+        The formatted records.
+    """
+
+    records = [{field: record.get(field) for field in fieldnames} for record in records]
+
+    if path.endswith(".csv"):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+        if header:
+            writer.writeheader()
+        writer.writerows(records)
+        return buffer.getvalue()
+
+    return "".join(
+        json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        for record in records
+    )
+
+def write_records(
+        path: str,
+        records: list[dict],
+        fieldnames: list[str]
+    ) -> None:
+    """
+    Replaces a JSON Lines or CSV file (by its extension) with records, atomically.
+
+    Parameters
+    ----------
+    path : str
+        The file path.
+    records : list of dict
+        The records.
+    fieldnames : list of str
+        The fields written, in order.
+    """
+
+    with atomic_write(path, "wb") as f:
+        f.write(format_records(path, records, fieldnames).encode("utf-8"))
+
+def append_record(
+        path: str,
+        record: dict,
+        fieldnames: list[str]
+    ) -> None:
+    """
+    Appends a record to a JSON Lines or CSV file (by its extension), and flushes it
+    so that it survives a crash. The header of a new CSV file is written first.
+
+    Parameters
+    ----------
+    path : str
+        The file path.
+    record : dict
+        The record.
+    fieldnames : list of str
+        The fields written, in order.
+    """
+
+    header = not os.path.exists(path) or os.path.getsize(path) == 0
+
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        f.write(format_records(path, [record], fieldnames, header=header))
+        f.flush()
+        os.fsync(f.fileno())
@@ -1,4 +1,8 @@
 import os
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import IO, Any
 
 
 def get_param_or_env(
@@ -36,3 +40,67 @@ def get_param_or_env(
             f"{env_var} is not set. You should specify it as a parameter or "
             "as an environment variable."
         )
+
+def get_query_shape(query: Any) -> Any:
+    """
+    Reduces a MongoDB filter to its shape by replacing every literal value with a
+    placeholder, so that queries differing only by their values can be grouped.
+
+    Parameters
+    ----------
+    query : Any
+        The filter (or sub-expression) to reduce.
+
+    Returns
+    -------
+    Any
+        The shape of the filter, e.g. ``{"user_id": "?", "timestamp": {"$gte": "?"}}``.
+    """
+
+    if isinstance(query, dict):
+        return {k: get_query_shape(v) for k, v in sorted(query.items())}
+    elif isinstance(query, (list, tuple)):
+        if len(query) > 0 and all(isinstance(v, dict) for v in query):
+            return [get_query_shape(v) for v in query]
+        return ["?"]
+    else:
+        return "?"
+
+@contextmanager
+def atomic_write(
+        path: str,
+        mode: str = "w"
+    ) -> Iterator[IO]:
+    """
+    Opens a temporary file next to `path`, and moves it onto `path` once written.
+    Readers see either the previous file or the complete new one, never a partial
+    write.
+
+    Parameters
+    ----------
+    path : str
+        The destination file.
+    mode : str, optional
+        The mode to open the temporary file with ("w" or "wb", default is "w").
+
+    Yields
+    ------
+    IO
+        The temporary file.
+    """
+
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=f".{os.path.basename(path)}.",
+        suffix=".tmp"
+    )
+
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
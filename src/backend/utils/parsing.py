@@ -1,7 +1,21 @@
 import ast
+import bisect
 import json
+from dataclasses import dataclass, field
+from typing import Any, Generator, Iterable, TypeVar
 
-import regex
+from pydantic import BaseModel, ValidationError
+
+ModelType = TypeVar("ModelType", bound=BaseModel)
+
+OPENERS = {"{": "}", "[": "]"}
+CLOSERS = {"}": "{", "]": "["}
+QUOTES = {'"', "'"}
+STRING_PREFIXES = {"{", "[", ",", ":"}
+
+# How many levels below an unparsable literal are tried (e.g. the dictionaries of
+# a list that has a broken item). Bounds the parsing work to a few passes.
+MAX_DEPTH = 2
 
 
 class UnfoundPatternError(Exception):
@@ -10,38 +24,252 @@ class UnfoundPatternError(Exception):
         self.message = message
         super().__init__(self.message)
 
-def extract_pattern(
-        text: str,
-        patterns: list,
-        *args
-    ):
+@dataclass
+class Span:
     """
-    Extracts the first matching pattern from the given text.
+    A balanced literal (object or list) found in a text.
+    """
+
+    start: int
+    end: int
+    children: list["Span"] = field(default_factory=list)
+
+class BracketScanner:
+    """
+    Finds the balanced objects (`{...}`) and lists (`[...]`) of a text in a single
+    pass, without backtracking, possibly fed chunk by chunk (e.g. a streamed model
+    output). Brackets inside strings are ignored. Unbalanced brackets (e.g.
+    truncated outputs, or prose around the literals) are skipped, and the balanced
+    literals they contain are still found.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the scanner at the start of a text.
+        """
+
+        # The chunks of the text and their offsets, joined only for the literals
+        # (appending to a string would copy the whole text on every chunk)
+        self.chunks: list[str] = []
+        self.offsets: list[int] = []
+        self.length = 0
+
+        # The open brackets, and how many of each kind
+        self.stack: list[tuple[str, int]] = []
+        self.nb_open = dict.fromkeys(OPENERS, 0)
+
+        self.quote: str | None = None
+        self.escaped = False
+        self.previous = ""
+
+    def feed(self, chunk: str) -> list[tuple[Span, str | None]]:
+        """
+        Scans the next chunk of the text.
+
+        Parameters
+        ----------
+        chunk : str
+            The chunk.
+
+        Returns
+        -------
+        list of tuple
+            The literals closed in the chunk, in order, with the bracket of the
+            literal that contains them (None at the top level).
+        """
+
+        offset = self.length
+        self.chunks.append(chunk)
+        self.offsets.append(offset)
+        self.length += len(chunk)
+
+        spans = []
+        for i, char in enumerate(chunk, start=offset):
+
+            if self.quote is not None:
+                self.scan_string(char)
+                continue
+
+            span = self.scan_code(char, i)
+            if span is not None:
+                spans.append(span)
+
+        return spans
+
+    def scan_string(self, char: str) -> None:
+        """
+        Scans a character inside a string.
+
+        Parameters
+        ----------
+        char : str
+            The character.
+        """
+
+        if self.escaped:
+            self.escaped = False
+        elif char == "\\":
+            self.escaped = True
+        elif char == self.quote or char == "\n":
+            # A string cannot span lines, an unterminated quote ends there
+            self.quote = None
+
+    def scan_code(self, char: str, i: int) -> tuple[Span, str | None] | None:
+        """
+        Scans a character outside of the strings.
+
+        Parameters
+        ----------
+        char : str
+            The character.
+        i : int
+            The position of the character in the text.
+
+        Returns
+        -------
+        tuple or None
+            The literal closed by the character with the bracket of the literal
+            that contains it, or None.
+        """
+
+        span = None
+
+        if char in OPENERS:
+            self.stack.append((char, i))
+            self.nb_open[char] += 1
+
+        elif char in CLOSERS and self.nb_open[CLOSERS[char]] > 0:
+            span = self.close(char, i)
+
+        elif char in QUOTES and self.stack and self.previous in STRING_PREFIXES:
+            # Only a quote that starts a key or a value opens a string, not an
+            # apostrophe in prose
+            self.quote, self.escaped = char, False
+
+        if not char.isspace():
+            self.previous = char
+
+        return span
+
+    def close(self, char: str, i: int) -> tuple[Span, str | None]:
+        """
+        Closes the literal of a closing bracket, whose opening bracket is open.
+
+        Parameters
+        ----------
+        char : str
+            The closing bracket.
+        i : int
+            The position of the bracket in the text.
+
+        Returns
+        -------
+        tuple
+            The closed literal, with the bracket of the literal that contains it
+            (None at the top level).
+        """
+
+        # The brackets opened since the matching one are unbalanced, they are
+        # dropped (each bracket is pushed and popped once)
+        while True:
+            opener, start = self.stack.pop()
+            self.nb_open[opener] -= 1
+            if opener == CLOSERS[char]:
+                break
+
+        parent = self.stack[-1][0] if self.stack else None
+
+        return Span(start, i + 1), parent
+
+    def get_text(self, span: Span) -> str:
+        """
+        Gets the text of a literal from the chunks it spans.
+
+        Parameters
+        ----------
+        span : Span
+            The literal.
+
+        Returns
+        -------
+        str
+            The text of the literal.
+        """
+
+        first = bisect.bisect_right(self.offsets, span.start) - 1
+        last = bisect.bisect_left(self.offsets, span.end)
+        text = "".join(self.chunks[first:last])
+        offset = self.offsets[first]
+
+        return text[span.start - offset:span.end - offset]
+
+def find_literals(text: str) -> list[Span]:
+    """
+    Finds the balanced literals of a text (see `BracketScanner`).
 
     Parameters
     ----------
     text : str
-        The input text to search in.
-    patterns : list
-        A list of regex patterns to match.
+        The input text, e.g. a model output with code fences or comments.
 
     Returns
     -------
-    str
-        The first matching pattern.
+    list of Span
+        The outermost literals, in order, with the literals they contain.
+    """
 
-    Raises
+    spans = [span for span, _ in BracketScanner().feed(text)]
+
+    # Balanced literals are either nested or disjoint: sorted by start, each one
+    # belongs to the last one that is still open
+    roots: list[Span] = []
+    open_spans: list[Span] = []
+    for span in sorted(spans, key=lambda span: span.start):
+
+        while open_spans and open_spans[-1].end <= span.start:
+            open_spans.pop()
+
+        (open_spans[-1].children if open_spans else roots).append(span)
+        open_spans.append(span)
+
+    return roots
+
+def iter_streamed_dicts(chunks: Iterable[str]) -> Generator[dict, None, None]:
+    """
+    Parses the dictionaries of a streamed text as soon as they close, e.g. the items
+    of a list of dictionaries. Only the dictionaries at the top level or directly in
+    a list are returned, not the ones nested in another dictionary.
+
+    Parameters
+    ----------
+    chunks : Iterable of str
+        The chunks of the text.
+
+    Yields
     ------
-    UnfoundPatternError
-        If no matching pattern is found.
+    dict
+        The parsed dictionaries, in order.
     """
 
-    for pattern in patterns:
-        match = regex.search(pattern, text, *args)
-        if match is not None:
-            return match.group(0)
+    scanner = BracketScanner()
 
-    raise UnfoundPatternError("Pattern not found")
+    for chunk in chunks:
+        for span, parent in scanner.feed(chunk):
+
+            if parent == "{":
+                continue
+
+            text = scanner.get_text(span)
+            if text[0] != "{":
+                continue
+
+            try:
+                d = parse_str(text)
+            except UnfoundPatternError:
+                continue
+
+            if isinstance(d, dict):
+                yield correct_dict(d)
 
 def parse_str(text: str):
     """
@@ -67,7 +295,14 @@ def parse_str(text: str):
 
         try:
             return parser(text)
-        except (SyntaxError, ValueError, json.decoder.JSONDecodeError):
+        except (
+            SyntaxError,
+            ValueError,
+            TypeError,
+            MemoryError,
+            RecursionError,
+            json.decoder.JSONDecodeError
+        ):
             continue
 
     raise UnfoundPatternError("Pattern not found")
@@ -95,6 +330,35 @@ def correct_dict(d: dict):
 
     return d
 
+def iter_literals(text: str) -> Generator[Any, None, None]:
+    """
+    Parses the literals of a text, in order. A literal that cannot be parsed is
+    replaced by the literals it contains, down to `MAX_DEPTH` levels.
+
+    Parameters
+    ----------
+    text : str
+        The input text.
+
+    Yields
+    ------
+    Any
+        The parsed objects and lists.
+    """
+
+    def parse(span: Span, depth: int) -> Generator[Any, None, None]:
+        try:
+            yield parse_str(text[span.start:span.end])
+            return
+        except UnfoundPatternError:
+            pass
+        if depth < MAX_DEPTH:
+            for child in span.children:
+                yield from parse(child, depth + 1)
+
+    for span in find_literals(text):
+        yield from parse(span, 0)
+
 def extract_dict(text: str):
     """
     Extracts a dictionary from a text string.
@@ -107,7 +371,7 @@ def extract_dict(text: str):
     Returns
     -------
     dict
-        The extracted dictionary.
+        The extracted dictionary (the first one, or the first one of a list).
 
     Raises
     ------
@@ -115,22 +379,15 @@ def extract_dict(text: str):
         If no dictionary pattern is found or parsing fails.
     """
 
-    try:
-        d = parse_str(text)
-        if not isinstance(d, dict):
-            raise UnfoundPatternError("Unfound Pattern")
-    except UnfoundPatternError:
-        pattern = extract_pattern(
-            text=text,
-            patterns=[r"\{(?:[^{}]|(?R))*\}", r"\{\n([\s\S]*?)\n\}", r"\{([\s\S]*?)\}"]
-        )
-        d = parse_str(pattern)
-
-    d = correct_dict(d)
+    for value in iter_literals(text):
+        if isinstance(value, list):
+            value = next((v for v in value if isinstance(v, dict)), None)
+        if isinstance(value, dict):
+            return correct_dict(value)
 
-    return d
+    raise UnfoundPatternError("Pattern not found")
 
-def extract_list(text):
+def extract_list(text: str):
     """
     Extracts a list from a text string.
 
@@ -142,21 +399,12 @@ def extract_list(text):
     Returns
     -------
     list
-        The extracted list.
-
-    Raises
-    ------
-    UnfoundPatternError
-        If no list pattern is found or parsing fails.
+        The extracted list, empty if none is found.
     """
 
-    try:
-        pattern = extract_pattern(text, [r"\[\[.*?\]\]", r"\[.*?\]"], regex.DOTALL)
-        return parse_str(pattern)
-    except UnfoundPatternError:
-        return []
+    return next((v for v in iter_literals(text) if isinstance(v, list)), [])
 
-def extract_list_of_dicts(text):
+def extract_list_of_dicts(text: str):
     """
     Extracts a list of dictionaries from a text string.
 
@@ -168,34 +416,124 @@ def extract_list_of_dicts(text):
     Returns
     -------
     list of dict
-        The extracted list of dictionaries.
+        The extracted list of dictionaries (from the lists and the dictionaries of
+        the text).
     """
 
-    try:
-        parsed_text = parse_str(text)
-        if isinstance(parsed_text, list):
-            return parsed_text
-        elif isinstance(parsed_text, dict):
-            return [parsed_text]
-        else:
-            raise UnfoundPatternError("Unfound Pattern")
-    except UnfoundPatternError:
-        pass
-
     dict_list = []
-    patterns = regex.findall(r"\{[\s\S]*?\}", text)
-    for pattern in patterns:
-        try:
-            parsed_text = parse_str(pattern)
-            if isinstance(parsed_text, dict):
-                dict_list.append(parsed_text)
-        except UnfoundPatternError:
-            continue
+    for value in iter_literals(text):
+        if isinstance(value, dict):
+            dict_list.append(value)
+        elif isinstance(value, list):
+            dict_list += [v for v in value if isinstance(v, dict)]
 
     dict_list = [correct_dict(d) for d in dict_list]
 
     return dict_list
 
+def validate(
+        value: Any,
+        model: type[ModelType]
+    ) -> ModelType:
+    """
+    Validates a parsed literal against a model. A list is validated against a model
+    with a single list field (e.g. `SuggestedPrompts`).
+
+    Parameters
+    ----------
+    value : Any
+        The parsed literal.
+    model : type of BaseModel
+        The model.
+
+    Returns
+    -------
+    BaseModel
+        The validated model.
+
+    Raises
+    ------
+    ValidationError
+        If the literal does not match the model.
+    """
+
+    if isinstance(value, list) and len(model.model_fields) == 1:
+        value = {next(iter(model.model_fields)): value}
+
+    if isinstance(value, dict):
+        value = correct_dict(value)
+
+    return model.model_validate(value)
+
+def extract_model(
+        text: str,
+        model: type[ModelType]
+    ) -> ModelType:
+    """
+    Extracts the first literal of a text that matches a model.
+
+    Parameters
+    ----------
+    text : str
+        The input text, e.g. a model output.
+    model : type of BaseModel
+        The expected model (e.g. `Desc`, `Icon`, `SuggestedPrompts`).
+
+    Returns
+    -------
+    BaseModel
+        The validated model.
+
+    Raises
+    ------
+    UnfoundPatternError
+        If no literal matches the model.
+    """
+
+    for value in iter_literals(text):
+
+        candidates = [value]
+        if isinstance(value, list):
+            candidates += [v for v in value if isinstance(v, dict)]
+
+        for candidate in candidates:
+            try:
+                return validate(candidate, model)
+            except ValidationError:
+                continue
+
+    raise UnfoundPatternError(f"No `{model.__name__}` found")
+
+def extract_models(
+        text: str,
+        model: type[ModelType]
+    ) -> tuple[list[ModelType], list[dict]]:
+    """
+    Extracts the dictionaries of a text (see `extract_list_of_dicts`) and validates
+    them against a model.
+
+    Parameters
+    ----------
+    text : str
+        The input text, e.g. a model output.
+    model : type of BaseModel
+        The expected model of each dictionary (e.g. `Source`).
+
+    Returns
+    -------
+    tuple
+        The validated models, and the dictionaries that do not match the model.
+    """
+
+    models, invalid = [], []
+    for d in extract_list_of_dicts(text):
+        try:
+            models.append(model.model_validate(d))
+        except ValidationError:
+            invalid.append(d)
+
+    return models, invalid
+
 if __name__ == "__main__":
 
     texts_dict = [
@@ -0,0 +1,844 @@
+import inspect
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Generator
+
+from src.backend.utils.misc import get_query_shape
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """
+    A timed operation belonging to a trace.
+    """
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start_time: int
+    end_time: int | None = None
+    attributes: dict = field(default_factory=dict)
+    status: str = "OK"
+
+    @property
+    def duration(self) -> float:
+        """
+        Duration of the span in seconds (0 while the span is still open).
+        """
+
+        if self.end_time is None:
+            return 0.0
+
+        return (self.end_time - self.start_time) / 10**9
+
+    def set_attribute(
+            self,
+            key: str,
+            value: Any
+        ) -> None:
+        """
+        Sets an attribute on the span.
+
+        Parameters
+        ----------
+        key : str
+            The attribute name.
+        value : Any
+            The attribute value. Non-scalar values are serialized to JSON.
+        """
+
+        if not isinstance(value, (str, bool, int, float)):
+            value = json.dumps(value, default=str)
+
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        """
+        Converts the span into a JSON-serializable dictionary.
+
+        Returns
+        -------
+        dict
+            The span as a dictionary.
+        """
+
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "status": self.status
+        }
+
+class ConsoleSpanExporter:
+    """
+    Prints each finished trace to stdout as an indented tree of spans.
+    """
+
+    def export(self, spans: list[Span]) -> None:
+        """
+        Prints a trace.
+
+        Parameters
+        ----------
+        spans : list of Span
+            The spans of one trace.
+        """
+
+        children: dict[str | None, list[Span]] = {}
+        span_ids = {span.span_id for span in spans}
+        for span in sorted(spans, key=lambda s: s.start_time):
+            parent_id = span.parent_id if span.parent_id in span_ids else None
+            children.setdefault(parent_id, []).append(span)
+
+        lines = []
+
+        def walk(parent_id: str | None, depth: int) -> None:
+            for span in children.get(parent_id, []):
+                attributes = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+                lines.append(
+                    f"{'  ' * depth}{span.name} {span.duration * 1000:.1f} ms "
+                    f"[{span.status}] {attributes}"
+                )
+                walk(span.span_id, depth + 1)
+
+        walk(None, 0)
+
+        print(f"Trace {spans[0].trace_id}\n" + "\n".join(lines), flush=True)
+
+class OTLPSpanExporter:
+    """
+    Sends finished traces to an OpenTelemetry collector using OTLP/HTTP with a JSON
+    payload.
+    """
+
+    def __init__(
+            self,
+            endpoint: str | None = None,
+            service_name: str | None = None,
+            timeout: float = 2
+        ) -> None:
+        """
+        Initializes the exporter.
+
+        Parameters
+        ----------
+        endpoint : str or None, optional
+            The collector base URL (default is the `OTEL_EXPORTER_OTLP_ENDPOINT`
+            environment variable, or "http://localhost:4318").
+        service_name : str or None, optional
+            The reported service name (default is the `OTEL_SERVICE_NAME`
+            environment variable, or "docu-talk").
+        timeout : float, optional
+            The request timeout in seconds (default is 2).
+        """
+
+        if endpoint is None:
+            endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+        if service_name is None:
+            service_name = os.getenv("OTEL_SERVICE_NAME", "docu-talk")
+
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+
+    @staticmethod
+    def format_value(value: Any) -> dict:
+        """
+        Converts an attribute value to an OTLP `AnyValue`.
+        """
+
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        elif isinstance(value, int):
+            return {"intValue": str(value)}
+        elif isinstance(value, float):
+            return {"doubleValue": value}
+        else:
+            return {"stringValue": str(value)}
+
+    def get_payload(self, spans: list[Span]) -> dict:
+        """
+        Builds the OTLP `ExportTraceServiceRequest` for a trace.
+
+        Parameters
+        ----------
+        spans : list of Span
+            The spans of one trace.
+
+        Returns
+        -------
+        dict
+            The OTLP JSON payload.
+        """
+
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_time),
+                "endTimeUnixNano": str(span.end_time),
+                "attributes": [
+                    {"key": k, "value": self.format_value(v)}
+                    for k, v in span.attributes.items()
+                ],
+                "status": {"code": 1 if span.status == "OK" else 2}
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = span.parent_id
+            otlp_spans.append(otlp_span)
+
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name}
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "docu-talk"},
+                            "spans": otlp_spans
+                        }
+                    ]
+                }
+            ]
+        }
+
+        return payload
+
+    def export(self, spans: list[Span]) -> None:
+        """
+        Sends a trace to the collector. Failures are logged and never raised.
+
+        Parameters
+        ----------
+        spans : list of Span
+            The spans of one trace.
+        """
+
+        request = urllib.request.Request(  # noqa: S310
+            url=self.url,
+            data=json.dumps(self.get_payload(spans)).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):  # noqa: S310
+                pass
+        except OSError as e:
+            logger.warning(f"Failed to export trace to {self.url}: {e}")
+
+class InMemorySpanExporter:
+    """
+    Keeps finished traces in memory, so that they can be inspected in tests.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes an empty exporter.
+        """
+
+        self.traces: list[list[Span]] = []
+
+    def export(self, spans: list[Span]) -> None:
+        """
+        Stores a trace.
+
+        Parameters
+        ----------
+        spans : list of Span
+            The spans of one trace.
+        """
+
+        self.traces.append(spans)
+
+    def clear(self) -> None:
+        """
+        Removes all stored traces.
+        """
+
+        self.traces = []
+
+class LocalCollector:
+    """
+    A minimal OTLP/HTTP collector stand-in that accepts JSON trace payloads on a
+    local port and keeps them in memory. Point an `OTLPSpanExporter` to `endpoint`
+    to check what would be sent to a real collector.
+    """
+
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 0
+        ) -> None:
+        """
+        Initializes the collector (not started).
+
+        Parameters
+        ----------
+        host : str, optional
+            The interface to bind (default is "127.0.0.1").
+        port : int, optional
+            The port to bind (default is 0, i.e. a free port).
+        """
+
+        self.payloads: list[dict] = []
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self) -> None:  # noqa: N802
+                length = int(self.headers.get("Content-Length", 0))
+                collector.payloads.append(json.loads(self.rfile.read(length)))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.endpoint = f"http://{host}:{self.server.server_address[1]}"
+
+    @property
+    def spans(self) -> list[dict]:
+        """
+        All the OTLP spans received so far.
+        """
+
+        return [
+            span
+            for payload in self.payloads
+            for resource_spans in payload["resourceSpans"]
+            for scope_spans in resource_spans["scopeSpans"]
+            for span in scope_spans["spans"]
+        ]
+
+    def start(self) -> "LocalCollector":
+        """
+        Starts serving in a background thread.
+        """
+
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the server.
+        """
+
+        self.server.shutdown()
+        self.server.server_close()
+
+EXPORTERS = {
+    "console": ConsoleSpanExporter,
+    "otlp": OTLPSpanExporter,
+    "memory": InMemorySpanExporter
+}
+
+class Tracer:
+    """
+    A lightweight tracer. Spans are collected per trace and handed to the exporter
+    once the root span of the trace ends, so that one Streamlit rerun produces one
+    exported trace.
+    """
+
+    def __init__(self, exporter: Any | None = None) -> None:
+        """
+        Initializes the tracer.
+
+        Parameters
+        ----------
+        exporter : Any or None, optional
+            An object with an `export(spans)` method. When None, tracing is disabled
+            and spans cost almost nothing.
+        """
+
+        self.exporter = exporter
+        self.current_span: ContextVar[Span | None] = ContextVar(
+            "current_span", default=None
+        )
+        self.pending: dict[str, list[Span]] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether spans are recorded.
+        """
+
+        return self.exporter is not None
+
+    def start_span(
+            self,
+            name: str,
+            attributes: dict | None = None,
+            parent: Span | None = None
+        ) -> Span:
+        """
+        Creates and opens a span without making it the current one.
+
+        Parameters
+        ----------
+        name : str
+            The span name.
+        attributes : dict or None, optional
+            Initial attributes of the span.
+        parent : Span or None, optional
+            The parent span (default is the current span).
+
+        Returns
+        -------
+        Span
+            The opened span.
+        """
+
+        if parent is None:
+            parent = self.current_span.get()
+
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent is not None else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent is not None else None,
+            start_time=time.time_ns()
+        )
+
+        for k, v in (attributes or {}).items():
+            span.set_attribute(k, v)
+
+        with self.lock:
+            self.pending.setdefault(span.trace_id, []).append(span)
+
+        return span
+
+    def end_span(self, span: Span) -> None:
+        """
+        Closes a span, and exports its trace if it is the root span.
+
+        Parameters
+        ----------
+        span : Span
+            The span to close.
+        """
+
+        span.end_time = time.time_ns()
+
+        with self.lock:
+            spans = self.pending.get(span.trace_id, [])
+            if span.parent_id is None:
+                # Root span: export the trace, keep spans still open (e.g.
+                # unconsumed generators), they will be exported on their own
+                unfinished = [s for s in spans if s.end_time is None]
+                spans = [s for s in spans if s.end_time is not None]
+                if len(unfinished) > 0:
+                    self.pending[span.trace_id] = unfinished
+                else:
+                    self.pending.pop(span.trace_id, None)
+            elif any(s.span_id == span.parent_id for s in spans):
+                # Exported later, together with its root span
+                return
+            else:
+                # A straggler whose trace was already exported
+                spans.remove(span)
+                if len(spans) == 0:
+                    self.pending.pop(span.trace_id, None)
+                spans = [span]
+
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            logger.warning(f"Failed to export trace {span.trace_id}: {e}")
+
+    @contextmanager
+    def start_as_current_span(
+            self,
+            name: str,
+            attributes: dict | None = None
+        ) -> Generator[Span | None, None, None]:
+        """
+        Opens a span and makes it the current one for the duration of the block.
+
+        Parameters
+        ----------
+        name : str
+            The span name.
+        attributes : dict or None, optional
+            Initial attributes of the span.
+
+        Yields
+        ------
+        Span or None
+            The opened span, or None when tracing is disabled.
+        """
+
+        if not self.enabled:
+            yield None
+            return
+
+        span = self.start_span(name, attributes)
+        token = self.current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.status = "ERROR"
+            span.set_attribute("exception.type", type(e).__name__)
+            raise
+        except BaseException as e:
+            # Control flow exceptions (e.g. Streamlit's rerun and stop)
+            span.set_attribute("exception.type", type(e).__name__)
+            raise
+        finally:
+            self.current_span.reset(token)
+            self.end_span(span)
+
+tracer = Tracer()
+
+def run_in_span(
+        generator: Generator,
+        span: Span
+    ) -> Generator:
+    """
+    Runs a generator with a span as the current one while it runs, and the
+    caller's span in between, so that the spans it opens are nested in its own.
+
+    Parameters
+    ----------
+    generator : Generator
+        The generator.
+    span : Span
+        The span of the generator.
+
+    Yields
+    ------
+    Any
+        The items of the generator, whose return value is returned.
+    """
+
+    sent, thrown = None, None
+
+    while True:
+
+        token = tracer.current_span.set(span)
+        try:
+            if thrown is not None:
+                item = generator.throw(thrown)
+            else:
+                item = generator.send(sent)
+        except StopIteration as e:
+            return e.value
+        finally:
+            tracer.current_span.reset(token)
+
+        sent, thrown = None, None
+        try:
+            sent = yield item
+        except GeneratorExit:
+            token = tracer.current_span.set(span)
+            try:
+                generator.close()
+            finally:
+                tracer.current_span.reset(token)
+            raise
+        except BaseException as e:
+            thrown = e
+
+def trace_generator_function(
+        func: Callable,
+        name: str,
+        get_attributes: Callable[[tuple, dict, Any], dict]
+    ) -> Callable:
+    """
+    Wraps a generator function in a span, from its first iteration until it is
+    exhausted. See `traced`.
+    """
+
+    @wraps(func)
+    def generator_wrapper(*args, **kwargs):
+
+        if not tracer.enabled:
+            return (yield from func(*args, **kwargs))
+
+        span = tracer.start_span(name)
+        try:
+            return (yield from run_in_span(func(*args, **kwargs), span))
+        except Exception as e:
+            span.status = "ERROR"
+            span.set_attribute("exception.type", type(e).__name__)
+            raise
+        finally:
+            for k, v in get_attributes(args, kwargs, None).items():
+                span.set_attribute(k, v)
+            tracer.end_span(span)
+
+    return generator_wrapper
+
+def trace_function(
+        func: Callable,
+        name: str,
+        get_attributes: Callable[[tuple, dict, Any], dict]
+    ) -> Callable:
+    """
+    Wraps a function in a span, current during each call. See `traced`.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+
+        if not tracer.enabled:
+            return func(*args, **kwargs)
+
+        with tracer.start_as_current_span(name) as span:
+            result = func(*args, **kwargs)
+            for k, v in get_attributes(args, kwargs, result).items():
+                span.set_attribute(k, v)
+
+        return result
+
+    return wrapper
+
+def traced(
+        name: str,
+        attributes: Callable[[dict, Any], dict] | None = None
+    ):
+    """
+    A decorator recording a span around each call of the function. Generator
+    functions are traced from their first iteration until they are exhausted, with
+    their span current while they run.
+
+    Parameters
+    ----------
+    name : str
+        The span name.
+    attributes : Callable or None, optional
+        A function receiving the bound call arguments and the result (None for
+        generators) and returning span attributes.
+
+    Returns
+    -------
+    function
+        The wrapped function.
+    """
+
+    def decorator(func):
+
+        signature = inspect.signature(inspect.unwrap(func))
+
+        def get_attributes(args, kwargs, result) -> dict:
+            if attributes is None:
+                return {}
+            try:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                return attributes(bound.arguments, result)
+            except Exception as e:
+                logger.debug(f"Failed to compute span attributes of {name}: {e}")
+                return {}
+
+        if inspect.isgeneratorfunction(func):
+            return trace_generator_function(func, name, get_attributes)
+
+        return trace_function(func, name, get_attributes)
+
+    return decorator
+
+def instrument_class(
+        cls: type,
+        prefix: str,
+        attributes: Callable[[str, dict, Any], dict] | None = None
+    ) -> None:
+    """
+    Wraps every public method defined on a class with `traced`, without changing
+    any call site. Calling it twice on the same class has no effect.
+
+    Parameters
+    ----------
+    cls : type
+        The class to instrument.
+    prefix : str
+        The prefix of the span names (e.g. "db" gives "db.get_data").
+    attributes : Callable or None, optional
+        A function receiving the method name, the bound call arguments and the
+        result, and returning span attributes.
+    """
+
+    if cls.__dict__.get("__traced__", False):
+        return
+
+    for method_name, method in list(cls.__dict__.items()):
+
+        if method_name.startswith("_") or not inspect.isfunction(method):
+            continue
+
+        method_attributes = None
+        if attributes is not None:
+            def method_attributes(arguments, result, method_name=method_name):
+                return attributes(method_name, arguments, result)
+
+        setattr(
+            cls,
+            method_name,
+            traced(f"{prefix}.{method_name}", method_attributes)(method)
+        )
+
+    cls.__traced__ = True
+
+def get_bson_size(documents: list | dict) -> int:
+    """
+    Computes the BSON size of one or several documents.
+
+    Parameters
+    ----------
+    documents : list or dict
+        The documents.
+
+    Returns
+    -------
+    int
+        The size in bytes.
+    """
+
+    import bson
+
+    if isinstance(documents, dict):
+        documents = [documents]
+
+    return sum(len(bson.encode(document)) for document in documents)
+
+def get_database_attributes(
+        method_name: str,
+        arguments: dict,
+        result: Any
+    ) -> dict:
+    """
+    Span attributes of `Database` methods: table, filter shape, documents returned
+    and BSON bytes.
+    """
+
+    attributes = {}
+
+    if "table" in arguments:
+        attributes["db.table"] = arguments["table"]
+
+    if arguments.get("filter") is not None:
+        attributes["db.filter_shape"] = get_query_shape(arguments["filter"])
+
+    if isinstance(result, list):
+        attributes["db.documents"] = len(result)
+        attributes["db.bytes"] = get_bson_size(result)
+    elif method_name == "insert_data":
+        attributes["db.documents"] = 1
+        attributes["db.bytes"] = get_bson_size(arguments["data"])
+    elif method_name == "insert_many":
+        attributes["db.documents"] = len(arguments["data"])
+        attributes["db.bytes"] = get_bson_size(arguments["data"])
+    elif hasattr(result, "modified_count"):
+        attributes["db.documents"] = result.modified_count
+    elif hasattr(result, "deleted_count"):
+        attributes["db.documents"] = result.deleted_count
+
+    return attributes
+
+def get_storage_attributes(
+        method_name: str,
+        arguments: dict,
+        result: Any
+    ) -> dict:
+    """
+    Span attributes of `GoogleCloudStorageManager` methods.
+    """
+
+    attributes = {}
+
+    for key in ("uri", "gcs_path", "directory_path"):
+        if key in arguments:
+            attributes[f"gcs.{key}"] = arguments[key]
+
+    if isinstance(arguments.get("file"), (bytes, str)):
+        attributes["gcs.bytes"] = len(arguments["file"])
+
+    return attributes
+
+def get_gemini_attributes(
+        method_name: str,
+        arguments: dict,
+        result: Any
+    ) -> dict:
+    """
+    Span attributes of `Gemini` calls: model, streaming mode and usage.
+    """
+
+    attributes = {}
+
+    if "model" in arguments:
+        attributes["llm.model"] = arguments["model"]
+    if "stream" in arguments:
+        attributes["llm.stream"] = arguments["stream"]
+    if "messages" in arguments:
+        attributes["llm.messages"] = len(arguments["messages"])
+
+    if isinstance(result, dict) and "usages" in result:
+        attributes["llm.qty"] = result["usages"]["qty"]
+        for key in ("input_tokens", "cached_tokens", "output_tokens"):
+            if key in result["usages"]:
+                attributes[f"llm.{key}"] = result["usages"][key]
+
+    return attributes
+
+def instrument() -> None:
+    """
+    Enables tracing according to the `TRACING_EXPORTER` environment variable
+    ("console", "otlp" or "memory"), then instruments DocuTalk, the database, the
+    storage manager, the chatbot service and the Gemini wrapper. Does nothing when
+    the variable is not set.
+    """
+
+    exporter_name = os.getenv("TRACING_EXPORTER")
+
+    if exporter_name is None:
+        return
+
+    if tracer.exporter is None:
+        tracer.exporter = EXPORTERS[exporter_name]()
+
+    from src.backend.docu_talk.agents import (
+        ChatBotService,
+        GoogleCloudStorageManager,
+        Predictor,
+    )
+    from src.backend.docu_talk.agents.chatbot.generator import Gemini
+    from src.backend.docu_talk.database.database import Database
+    from src.backend.docu_talk.docu_talk import DocuTalk
+
+    instrument_class(DocuTalk, "docu_talk")
+    instrument_class(ChatBotService, "chatbot")
+    instrument_class(Predictor, "predictor")
+    instrument_class(Database, "db", get_database_attributes)
+    instrument_class(GoogleCloudStorageManager, "gcs", get_storage_attributes)
+    instrument_class(Gemini, "gemini", get_gemini_attributes)
@@ -9,8 +9,9 @@ from src.frontend.config import (
     USER_PERIOD_DOLLAR_AMOUNT,
 )
 from src.backend.docu_talk.docu_talk import DocuTalk
+from src.backend.docu_talk.exceptions import ServerBusyError, TooManyAttemptsError
 from src.backend.mailing.mailing_bot import MailingBot
-from src.backend.utils.auth import is_valid_email
+from src.backend.utils.auth import get_client_ip, is_valid_email
 
 
 class Auth:
@@ -72,6 +73,17 @@ class Auth:
         self.logged_in = False
         st.logout()
 
+    def get_ip_address(self) -> str | None:
+        """
+        Returns the IP address of the client, read from the `X-Forwarded-For`
+        header appended by the `TRUSTED_PROXIES` proxies in front of the application.
+        """
+
+        return get_client_ip(
+            forwarded_for=st.context.headers.get("X-Forwarded-For"),
+            nb_proxies=int(os.getenv("TRUSTED_PROXIES", "1"))
+        )
+
     def sign_up(
             self,
             email: str,
@@ -93,8 +105,8 @@ class Auth:
         Raises
         ------
         streamlit.error
-            If the email, first name, or last name format is invalid or the email
-            already exists.
+            If the email, first name, or last name format is invalid, the email
+            already exists, or there are too many attempts.
         """
 
         if not is_valid_email(email):
@@ -108,22 +120,31 @@ class Auth:
 
         else:
 
+            try:
+                self.docu_talk.login_throttle.check(ip_address=self.get_ip_address())
+            except TooManyAttemptsError as e:
+                st.error(e.message)
+                return
+
             existing_users = self.docu_talk.get_users()
             if email in existing_users:
                 st.error("Email already exists")
             else:
-                password = self.docu_talk.create_user(
-                    email=email,
-                    first_name=first_name,
-                    last_name=last_name,
-                    period_dollar_amount=USER_PERIOD_DOLLAR_AMOUNT
-                )
+                try:
+                    self.docu_talk.create_user(
+                        email=email,
+                        first_name=first_name,
+                        last_name=last_name,
+                        period_dollar_amount=USER_PERIOD_DOLLAR_AMOUNT
+                    )
+                except (TooManyAttemptsError, ServerBusyError) as e:
+                    st.error(e.message)
+                    return
 
                 self.mailing_bot.send_welcome_email(
                     recipient=email,
                     first_name=first_name,
-                    id=email,
-                    password=password
+                    id=email
                 )
 
                 st.success(
@@ -154,7 +175,17 @@ class Auth:
             If the email or password is invalid.
         """
 
-        if self.docu_talk.check_login(email, password) is True:
+        try:
+            logged_in = self.docu_talk.check_login(
+                email,
+                password,
+                self.get_ip_address()
+            )
+        except (TooManyAttemptsError, ServerBusyError) as e:
+            st.error(e.message)
+            return
+
+        if logged_in is True:
             self.token_manager.create_token(email)
             self.user = self.docu_talk.get_user(email)
             self.logged_in = True
@@ -165,7 +196,7 @@ class Auth:
     def sign_up_from_provider(
             self,
             email: str
-        ):
+        ) -> bool:
         """
         Registers a new user using an external authentication provider such as Microsoft
         or Google.
@@ -175,6 +206,11 @@ class Auth:
         email : str
             The email address of the user.
 
+        Returns
+        -------
+        bool
+            True if the user was created, False otherwise (the error is displayed).
+
         Notes
         -----
         - Extracts the first and last name from the authentication provider's user data.
@@ -190,18 +226,24 @@ class Auth:
             first_name = st.experimental_user.given_name
             last_name = st.experimental_user.family_name
 
-        self.docu_talk.create_user(
-            email=email,
-            first_name=first_name,
-            last_name=last_name,
-            period_dollar_amount=USER_PERIOD_DOLLAR_AMOUNT
-        )
+        try:
+            self.docu_talk.create_user(
+                email=email,
+                first_name=first_name,
+                last_name=last_name,
+                period_dollar_amount=USER_PERIOD_DOLLAR_AMOUNT
+            )
+        except (TooManyAttemptsError, ServerBusyError) as e:
+            st.error(e.message)
+            return False
 
         self.mailing_bot.send_welcome_email(
             recipient=email,
             first_name=first_name
         )
 
+        return True
+
     def sign_in_from_provider(self):
         """
         Logs in an existing user using an external authentication provider such as
@@ -218,8 +260,8 @@ class Auth:
         email = st.experimental_user.email.lower() #type: ignore
 
         existing_users = self.docu_talk.get_users()
-        if email not in existing_users:
-            self.sign_up_from_provider(email=email)
+        if email not in existing_users and not self.sign_up_from_provider(email):
+            return
 
         self.token_manager.create_token(email)
         self.user = self.docu_talk.get_user(email)
@@ -233,13 +275,18 @@ class Auth:
 
         email = f"guest-{uuid4()}@ai-apps.cloud"
 
-        self.docu_talk.create_user(
-            email=email,
-            first_name="Guest",
-            last_name="GUEST",
-            period_dollar_amount=GUEST_PERIOD_DOLLAR_AMOUNT,
-            is_guest=True
-        )
+        try:
+            self.docu_talk.login_throttle.check(ip_address=self.get_ip_address())
+            self.docu_talk.create_user(
+                email=email,
+                first_name="Guest",
+                last_name="GUEST",
+                period_dollar_amount=GUEST_PERIOD_DOLLAR_AMOUNT,
+                is_guest=True
+            )
+        except (TooManyAttemptsError, ServerBusyError) as e:
+            st.error(e.message)
+            return
 
         self.token_manager.create_token(email)
         self.user = self.docu_talk.get_user(email)
@@ -1,8 +1,7 @@
 import time
-from datetime import datetime, timedelta, timezone
 
-import jwt
 from streamlit_cookies_controller import CookieController
+from src.backend.utils.auth import generate_token, verify_token
 from src.backend.utils.misc import get_param_or_env
 
 
@@ -53,19 +52,12 @@ class TokenManager:
             The generated JWT token.
         """
 
-        data = {
-            "user_id": user_id,
-            "exp": datetime.now(timezone.utc) + timedelta(hours=self.token_expiration)
-        }
-
-        token = jwt.encode(
-            payload=data,
-            key=self.secret_key,
-            algorithm="HS256"
+        return generate_token(
+            user_id=user_id,
+            secret_key=self.secret_key,
+            expiration_hours=self.token_expiration
         )
 
-        return token
-
     def verify_token(
             self,
             token: str
@@ -84,18 +76,7 @@ class TokenManager:
             The user ID if the token is valid, otherwise None.
         """
 
-        try:
-
-            decoded_token = jwt.decode(
-                jwt=token,
-                key=self.secret_key,
-                algorithms=["HS256"]
-            )
-
-            return decoded_token["user_id"]
-
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, KeyError):
-            return None
+        return verify_token(token=token, secret_key=self.secret_key)
 
     def get_token(self) -> str | None:
         """
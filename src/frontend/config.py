@@ -4,29 +4,51 @@ import os
 import toml
 from src.backend.utils.file_io import get_encoded_image, recursive_read
 
+def write_gcp_credentials(
+        data: dict,
+        path: str = "credentials/gcp_credentials.json"
+    ) -> None:
+    """
+    Writes the GCP credentials found in the secrets to a file. The file is only
+    rewritten when its content changed, so that a warm container does no write.
+
+    Parameters
+    ----------
+    data : dict
+        The content of the secrets file.
+    path : str, optional
+        The credentials file (default is "credentials/gcp_credentials.json").
+    """
+
+    credentials = data.get("gcp_credentials", {})
+    if isinstance(credentials, str):
+        try:
+            # If it's a JSON string, parse it first
+            credentials = json.loads(credentials)
+        except json.JSONDecodeError:
+            # If parsing fails, write it directly
+            pass
+
+    if isinstance(credentials, str):
+        content = credentials
+    else:
+        content = json.dumps(credentials, indent=2)
+
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            if f.read() == content:
+                return
+
+    # Create credentials directory if it doesn't exist
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as f:
+        f.write(content)
+
 with open(".streamlit/secrets.toml", "r") as file:
     data = toml.load(file)
 
-# Create credentials directory if it doesn't exist
-os.makedirs("credentials", exist_ok=True)
-
-# Fix the missing file handle
-with open("credentials/gcp_credentials.json", "w") as f:
-    if "gcp_credentials" in data:
-        # Parse the string as JSON first, then write the resulting object
-        if isinstance(data["gcp_credentials"], str):
-            try:
-                # If it's a JSON string, parse it first
-                credential_json = json.loads(data["gcp_credentials"])
-                json.dump(credential_json, f, indent=2)
-            except json.JSONDecodeError:
-                # If parsing fails, write it directly
-                f.write(data["gcp_credentials"])
-        else:
-            # It's already an object
-            json.dump(data["gcp_credentials"], f, indent=2)
-    else:
-        json.dump({}, f)  # Empty JSON object as placeholder
+write_gcp_credentials(data)
 
 for k, v in data["dotenv"].items():
     os.environ[k] = v
@@ -51,6 +73,7 @@ PREMIUM_MODEL_NAME = CONFIG["models"]["premium"]
 USER_PERIOD_DOLLAR_AMOUNT = CONFIG["credits"]["period_dollar_amount"]["user"]
 GUEST_PERIOD_DOLLAR_AMOUNT = CONFIG["credits"]["period_dollar_amount"]["guest"]
 CREDIT_EXCHANGE_RATE = CONFIG["credits"]["credit_exchange_rate"]
+EXPENSIVE_QUERY_CREDITS = CONFIG["credits"]["expensive_query_credits"]
 MAX_ICON_FILE_SIZE = CONFIG["limits"]["max_icon_file_size"]
 MAX_NB_DOC_PER_CHATBOT = CONFIG["limits"]["max_nb_doc_per_chatbot"]
 MAX_NB_PAGES_PER_CHATBOT = CONFIG["limits"]["max_nb_pages_per_chatbot"]
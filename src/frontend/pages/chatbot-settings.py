@@ -24,19 +24,15 @@ if "chatbot_id" not in st.query_params:
 
 chatbot_id = st.query_params.chatbot_id
 
-if chatbot_id not in app.chatbots:
-
-    if chatbot_id not in app.auth.user["chatbots"]:
-        st.error("You do not have access to this Chat Bot or it does not exist.")
-        st.stop()
-
-    app.chatbots[chatbot_id] = app.docu_talk.start_chat(chatbot_id)
+if chatbot_id not in app.auth.user["chatbots"]:
+    st.error("You do not have access to this Chat Bot or it does not exist.")
+    st.stop()
 
 if app.auth.user["chatbots"][chatbot_id]["user_role"] != "Admin":
     st.error("You are not Admin of this Chat Bot")
     st.stop()
 
-chatbot : ChatBot = app.chatbots[chatbot_id]
+chatbot : ChatBot = app.get_chatbot(chatbot_id)
 
 st.markdown(f"# {chatbot.title} - Settings")
 
@@ -2,7 +2,13 @@ import random
 from datetime import datetime
 
 import streamlit as st
-from src.frontend.config import BASIC_MODEL_NAME, PREMIUM_MODEL_NAME, TEXTS
+from src.frontend.config import (
+    BASIC_MODEL_NAME,
+    EXPENSIVE_QUERY_CREDITS,
+    PREMIUM_MODEL_NAME,
+    TEXTS,
+)
+from src.backend.docu_talk.agents.chatbot.icons import get_thumbnail
 from src.backend.docu_talk.base import ChatBot
 from src.backend.docu_talk.exceptions import BadOutputFormatError
 from src.frontend.st_docu_talk import StreamlitDocuTalk
@@ -22,15 +28,11 @@ if "chatbot_id" not in st.query_params:
 
 chatbot_id = st.query_params.chatbot_id
 
-if chatbot_id not in app.chatbots:
-
-    if chatbot_id not in app.auth.user["chatbots"]:
-        st.error("You do not have access to this Chat Bot or it does not exist.")
-        st.stop()
-
-    app.chatbots[chatbot_id] = app.docu_talk.start_chat(chatbot_id)
+if chatbot_id not in app.auth.user["chatbots"]:
+    st.error("You do not have access to this Chat Bot or it does not exist.")
+    st.stop()
 
-chatbot : ChatBot = app.chatbots[chatbot_id]
+chatbot : ChatBot = app.get_chatbot(chatbot_id)
 
 best_model = st.toggle(
     label="Use Premium AI Model",
@@ -43,7 +45,12 @@ if best_model:
 else:
     model = BASIC_MODEL_NAME
 
-new_message = st.chat_message("assistant", avatar=chatbot.icon)
+premium_warning_placeholder = st.empty()
+
+# Avatars are displayed at 32 px, 64 px is enough for high-density screens
+avatar = get_thumbnail(chatbot.icon, size=64)
+
+new_message = st.chat_message("assistant", avatar=avatar)
 new_message.markdown(
     f"Hello {app.auth.user['first_name']}👋 "
     f"I am the Chat Bot **{chatbot.title}**!"
@@ -91,6 +98,23 @@ open_chatbot_settings = col1.button(
 if open_chatbot_settings:
     st.switch_page("src/frontend/pages/chatbot-settings.py")
 
+estimates = app.estimate_question(
+    nb_documents=len(selected_document_ids),
+    total_pages=total_pages,
+    model_name=model
+)
+
+if (
+    best_model
+    and "credits" in estimates
+    and estimates["credits"]["p90"] > EXPENSIVE_QUERY_CREDITS
+):
+    premium_warning_placeholder.warning(
+        "With the Premium AI Model, a question on the selected documents is "
+        f"estimated at {app.format_range(estimates['credits'], 'credits')}.",
+        icon=":material/paid:"
+    )
+
 if len(chatbot.suggested_prompts) > 2:
     random_prompts = random.sample(chatbot.suggested_prompts, 3)
 
@@ -105,8 +129,10 @@ if len(chatbot.suggested_prompts) > 2:
     new_message.markdown(markdown)
 
 for msg in chatbot.service.messages:
-    avatar = chatbot.icon if (msg["role"] == "assistant") else "👤"
-    new_message = st.chat_message(msg["role"], avatar=avatar)
+    new_message = st.chat_message(
+        msg["role"],
+        avatar=avatar if (msg["role"] == "assistant") else "👤"
+    )
     new_message.markdown(msg["content"])
 
 if message := st.chat_input("Your message"):
@@ -114,22 +140,12 @@ if message := st.chat_input("Your message"):
     new_message = st.chat_message("user", avatar="👤")
     new_message.markdown(message)
 
-    new_message = st.chat_message("assistant", avatar=chatbot.icon)
+    new_message = st.chat_message("assistant", avatar=avatar)
     with new_message:
 
-        estimated_duration = app.docu_talk.predictor.predict(
-            metric="ask_chatbot_duration",
-            data={
-                "nb_documents": len(selected_document_ids),
-                "total_pages": total_pages,
-                "model": model,
-                "timestamp": datetime.now()
-            }
-        )
-
         message_placeholder = st.empty()
 
-        with st.spinner(f"Estimated duration: {estimated_duration:.0f} seconds..."):
+        with st.spinner(app.get_waiting_message(estimates)):
 
             start_time = datetime.now()
 
@@ -141,10 +157,7 @@ if message := st.chat_input("Your message"):
 
             message_placeholder.write_stream(answer)
 
-            app.store_usage(
-                model_name=chatbot.service.last_usages["model"],
-                qty=chatbot.service.last_usages["qty"] * 4
-            )
+            app.store_usage(chatbot.service.last_usages)
 
             end_time = datetime.now()
 
@@ -154,7 +167,8 @@ if message := st.chat_input("Your message"):
                 nb_documents=len(selected_document_ids),
                 total_pages=total_pages,
                 model=model,
-                chatbot_id=chatbot_id
+                chatbot_id=chatbot_id,
+                ttft=chatbot.service.last_ttft
             )
 
 if len(chatbot.service.messages) > 0:
@@ -163,37 +177,28 @@ if len(chatbot.service.messages) > 0:
 
         if st.button(label="✨ Try source identification ✨"):
 
-            estimated_duration = app.docu_talk.predictor.predict(
-                metric="ask_chatbot_duration",
-                data={
-                    "nb_documents": len(selected_document_ids),
-                    "total_pages": total_pages,
-                    "model": model,
-                    "timestamp": datetime.now()
-                }
-            )
-
             message_placeholder = st.empty()
 
-            with st.spinner(f"Estimated duration: {estimated_duration:.0f} seconds..."):
+            with st.spinner(app.get_waiting_message(estimates, streamed=False)):
 
                 try:
 
                     start_time = datetime.now()
 
-                    sources = chatbot.service.get_last_message_sources(
+                    sources = chatbot.service.stream_last_message_sources(
                         model=model,
                         document_ids=selected_document_ids
                     )
 
-                    if sources == []:
-                        st.warning("Unable to identify sources")
-                    else:
-                        parts = []
-                        for source in sources:
-                            parts.append(TEXTS["source_citation"].format(**source))
+                    # Each source is displayed as soon as the model has written it
+                    parts = []
+                    for source in sources:
+                        parts.append(TEXTS["source_citation"].format(**source))
                         message_placeholder.markdown("\n\n".join(parts))
 
+                    if parts == []:
+                        st.warning("Unable to identify sources")
+
                     end_time = datetime.now()
 
                     app.docu_talk.predictor.log_ask_chatbot_metrics(
@@ -209,10 +214,7 @@ if len(chatbot.service.messages) > 0:
                     st.markdown("Sorry, an internal error has occurred.")
 
                 finally:
-                    app.store_usage(
-                        model_name=chatbot.service.last_usages["model"],
-                        qty=chatbot.service.last_usages["qty"] * 4
-                    )
+                    app.store_usage(chatbot.service.last_usages)
 
     st.button(
         label="🔄 Reset conversation",
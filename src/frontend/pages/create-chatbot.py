@@ -1,5 +1,4 @@
 from datetime import datetime
-from uuid import uuid4
 
 import streamlit as st
 from src.frontend.config import (
@@ -9,7 +8,6 @@ from src.frontend.config import (
     PREMIUM_MODEL_NAME,
     TEXTS,
 )
-from src.backend.docu_talk.exceptions import BadOutputFormatError
 from src.frontend.st_docu_talk import StreamlitDocuTalk
 from src.backend.utils.file_io import get_nb_pages_pdf
 
@@ -21,8 +19,123 @@ app.set_page_config(
     back_page_name="Home"
 )
 
+def show_creation(job: dict) -> None:
+    """
+    Displays the progress of a chatbot creation from the results of its stages.
+    """
+
+    state = job["state"]
+
+    label = "Chatbot Deployment"
+    if job["params"]["estimated_duration"] is not None:
+        label += (
+            " | Estimated duration: "
+            f"{app.format_range(job['params']['estimated_duration'], 'seconds')}"
+        )
+
+    status = st.status(
+        label=label,
+        expanded=True,
+        state={"done": "complete", "failed": "error"}.get(job["status"], "running")
+    )
+
+    with status:
+
+        new_message = st.chat_message("assistant", avatar=LOGO_PATH)
+        new_message.markdown("I'm looking at your documents...")
+
+        if "title" in state:
+
+            new_message = st.chat_message("assistant", avatar=LOGO_PATH)
+            if state["title_description_failed"]:
+                new_message.markdown(
+                    TEXTS["failed_title_description"].format(
+                        title=state["title"],
+                        description=state["description"]
+                    )
+                )
+            else:
+                new_message.markdown(
+                    f"Your chatbot can be named like this: **{state['title']}**"
+                )
+                new_message.markdown(
+                    f"And I'll give him this description: **{state['description']}**"
+                )
+
+        if "icon" in state:
+            new_message = st.chat_message("assistant", avatar=LOGO_PATH)
+            new_message.markdown(
+                "To illustrate the chatbot, I suggest the following icon:"
+            )
+            new_message.image(state["icon"], width=80)
+
+        if "suggested_prompts" in state:
+
+            new_message = st.chat_message("assistant", avatar=LOGO_PATH)
+            if len(state["suggested_prompts"]) > 0:
+                md_suggested_prompts = "\n".join(
+                    [f"* *{prompt}*" for prompt in state["suggested_prompts"]]
+                )
+                new_message.markdown(
+                    "Finally, I suggest the following examples of prompts:\n\n"
+                    f"{md_suggested_prompts}"
+                )
+            else:
+                new_message.markdown(
+                    "Hmm... I failed to define example prompts for your chatbot. "
+                    "I'll leave this blank for now."
+                )
+
+        if job["status"] == "done":
+            new_message = st.chat_message("assistant", avatar=LOGO_PATH)
+            new_message.markdown(
+                """
+                **Your Chatbot is ready!**
+                You can access it from the welcome page.
+                """
+            )
+        elif job["status"] == "failed":
+            st.error(f"Sorry, the chatbot could not be created: {job['error']}")
+
+@st.fragment(run_every=1)
+def follow_creation() -> None:
+    """
+    Polls the creation in progress, until it ends.
+    """
+
+    job = app.get_creation_job()
+
+    show_creation(job)
+
+    if job["status"] in ("done", "failed"):
+        st.rerun()
+
 st.markdown(TEXTS["create_chatbot_header"])
 
+# The creation runs in the background (see `DocuTalk.submit_chatbot_creation`),
+# so that it survives reruns, page changes and reconnections
+job = app.get_creation_job()
+
+if job is not None and job["status"] in ("pending", "running"):
+    follow_creation()
+    st.stop()
+
+if job is not None:
+
+    show_creation(job)
+
+    if job["status"] == "done" and app.chatbot_id != job["params"]["chatbot_id"]:
+        app.auth.user["chatbots"] = app.docu_talk.get_user_chatbots(
+            user_id=app.auth.user["email"]
+        )
+        app.chatbot_id = job["params"]["chatbot_id"]
+
+    if st.button(label="Create another chatbot", icon=":material/add:"):
+        app.creation_job_id = None
+        st.rerun()
+
+    st.stop()
+
 with st.container(border=True):
     documents_files = app.form_documents()
 
@@ -33,7 +146,6 @@ create_chatbot = st.button(
     disabled=(len(documents_files) == 0)
 )
 
-open_chat = False
 if create_chatbot:
 
     model = PREMIUM_MODEL_NAME
@@ -72,136 +184,26 @@ if create_chatbot:
             )
             st.stop()
 
-        estimated_duration = app.docu_talk.predictor.predict(
-            metric="create_chatbot_duration",
+        estimated_duration = app.docu_talk.predictor.predict_quantiles(
             data={
                 "nb_documents": nb_documents,
                 "total_pages": total_pages,
                 "model": model,
                 "timestamp": datetime.now()
+            },
+            metrics=["create_chatbot_duration"]
+        ).get("create_chatbot_duration")
+        if estimated_duration is not None:
+            estimated_duration = {
+                quantile: float(value)
+                for quantile, value in estimated_duration.items()
             }
-        )
-
-    start_time = datetime.now()
 
-    status_placeholder = st.status(
-        label=(
-            "Chatbot Deployment | Estimated duration: "
-            f"{estimated_duration:.0f} seconds"
-        ),
-        expanded=True
-    )
-
-    with status_placeholder:
-
-        chatbot_id = str(uuid4())
-
-        new_message = st.chat_message("assistant", avatar=LOGO_PATH)
-        new_message.markdown("I'm looking at your documents...")
-
-        chatbot = app.docu_talk.get_chatbot_service(
-            chatbot_id=chatbot_id,
-            documents=documents
-        )
-
-        new_message = st.chat_message("assistant", avatar=LOGO_PATH)
-        try:
-            title, description = chatbot.generate_title_description(
-                model=model
-            )
-            new_message.markdown(
-                f"Your chatbot can be named like this: **{title}**"
-            )
-            new_message.markdown(
-                f"And I'll give him this description: **{description}**"
-            )
-        except BadOutputFormatError:
-
-            title, description = "<TITLE>", "<DESCRIPTION>"
-            message = TEXTS["failed_title_description"].format(
-                title=title,
-                description=description
-            )
-
-            new_message.markdown(message)
-
-        app.store_usage(
-            model_name=chatbot.last_usages["model"],
-            qty=chatbot.last_usages["qty"]
-        )
-
-        icon = chatbot.generate_icon(
-            description=description,
-            model=model
-        )
-
-        new_message = st.chat_message("assistant", avatar=LOGO_PATH)
-        new_message.markdown("To illustrate the chatbot, I suggest the following icon:")
-        new_message.image(icon, width=80)
-
-        app.store_usage(
-            model_name=chatbot.last_usages["model"],
-            qty=chatbot.last_usages["qty"]
-        )
-
-        new_message = st.chat_message("assistant", avatar=LOGO_PATH)
-        try:
-
-            suggested_prompts = chatbot.get_suggested_prompts(
-                model=model
-            )
-
-            md_suggested_prompts = "\n".join(
-                [f"* *{prompt}*" for prompt in suggested_prompts]
-            )
-
-            new_message.markdown(
-                "Finally, I suggest the following examples of prompts:\n\n"
-                f"{md_suggested_prompts}"
-            )
-
-        except BadOutputFormatError:
-            suggested_prompts = []
-            new_message.markdown(
-                "Hmm... I failed to define example prompts for your chatbot. "
-                "I'll leave this blank for now."
-            )
-
-        app.store_usage(
-            model_name=chatbot.last_usages["model"],
-            qty=chatbot.last_usages["qty"]
-        )
-
-        app.docu_talk.create_chatbot(
-            chatbot_id=chatbot_id,
+        app.creation_job_id = app.docu_talk.submit_chatbot_creation(
             created_by=app.auth.user["email"],
-            title=title,
-            description=description,
-            icon=icon,
-            access="private",
-            documents=chatbot.documents,
-            suggested_prompts=suggested_prompts
-        )
-
-        end_time = datetime.now()
-
-        app.docu_talk.predictor.log_create_chatbot_metric(
-            duration=(end_time - start_time).total_seconds(),
-            nb_documents=nb_documents,
-            total_pages=total_pages,
+            documents=documents,
             model=model,
-            chatbot_id=chatbot_id
-        )
-
-        app.auth.user["chatbots"] = app.docu_talk.get_user_chatbots(
-            user_id=app.auth.user["email"]
+            estimated_duration=estimated_duration
         )
-        app.chatbot_id = chatbot_id
 
-        new_message = st.chat_message("assistant", avatar=LOGO_PATH)
-        new_message.markdown(
-            """
-            **Your Chatbot is ready!**
-            You can access it from the welcome page.
-            """
-        )
+    st.rerun()
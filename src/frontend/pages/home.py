@@ -1,4 +1,5 @@
 import streamlit as st
+from src.backend.docu_talk.agents.chatbot.icons import get_thumbnail
 from src.frontend.st_docu_talk import StreamlitDocuTalk
 
 app : StreamlitDocuTalk = st.session_state["app"]
@@ -36,7 +37,7 @@ else:
         )
 
         subcol0.image(
-            image=chatbot["icon"],
+            image=get_thumbnail(chatbot["icon"], size=40),
             width=40
         )
 
@@ -83,7 +84,7 @@ for id, chatbot in public_chatbots.items():
     )
 
     subcol0.image(
-        image=chatbot["icon"],
+        image=get_thumbnail(chatbot["icon"], size=40),
         width=40
     )
 
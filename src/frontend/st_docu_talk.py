@@ -2,12 +2,13 @@ import streamlit as st
 from src.frontend.auth.auth import Auth
 from src.frontend.config import (
     CREDIT_EXCHANGE_RATE,
-    ENCODED_LOGO,
     LOGO_PATH,
     MAX_NB_DOC_PER_CHATBOT,
     MAX_NB_PAGES_PER_CHATBOT,
     TEXTS,
 )
+from src.backend.docu_talk.base import ChatBot
+from src.backend.docu_talk.database.invalidation import InvalidationEvent
 from src.backend.docu_talk.docu_talk import DocuTalk
 from src.backend.mailing.mailing_bot import MailingBot
 from src.frontend.sidebar import Sidebar
@@ -21,6 +22,7 @@ class StreamlitDocuTalk:
 
     chatbot_id: str | None
     chatbots: dict
+    creation_job_id: str | None
 
     def __init__(self) -> None:
         """
@@ -31,7 +33,9 @@ class StreamlitDocuTalk:
         self.docu_talk = DocuTalk()
 
         self.mailing_bot = MailingBot(
-            encoded_logo=ENCODED_LOGO
+            logo_path=LOGO_PATH,
+            db=self.docu_talk.db,
+            reset_password=self.docu_talk.reset_password
         )
 
         self.auth = Auth(
@@ -47,6 +51,84 @@ class StreamlitDocuTalk:
         self.chatbot_id: str | None = None
         self.chatbots = {}
 
+        # The chatbot creation followed by the session (see `get_creation_job`)
+        self.creation_job_id: str | None = None
+
+        # Set when the user, their accesses or the chatbots changed, on any instance
+        self.user_outdated = False
+        if self.docu_talk.invalidation_bus is not None:
+            self.docu_talk.invalidation_bus.subscribe(
+                tables=["Users", "Access", "Chatbots"],
+                callback=self.on_user_change
+            )
+
+    def on_user_change(self, event: InvalidationEvent) -> None:
+        """
+        Marks the user as outdated when their record, their accesses or one of
+        their chatbots (e.g. its title, or a chatbot made public) change, or when
+        changes may have been missed ("resync"). It is reloaded, with their
+        chatbots, by the next `set_page_config`.
+
+        Parameters
+        ----------
+        event : InvalidationEvent
+            A change of the Users, Access or Chatbots table.
+        """
+
+        if not self.auth.logged_in:
+            return
+
+        if event.operation == "resync":
+            self.user_outdated = True
+            return
+
+        email = self.auth.user["email"]
+
+        if event.table == "Users":
+            outdated = event.get("email") == email
+        elif event.table == "Access":
+            outdated = event.get("user_id") == email
+        else:
+            outdated = (
+                event.get("created_by") == email
+                or event.get("access") == "public"
+                or event.get("id") in self.auth.user["chatbots"]
+            )
+
+        if outdated:
+            self.user_outdated = True
+
+    def get_chatbot(
+            self,
+            chatbot_id: str
+        ) -> ChatBot:
+        """
+        Returns the chat session of the user with a chatbot, started again when the
+        chatbot changed since (the conversation is restored).
+
+        Parameters
+        ----------
+        chatbot_id : str
+            ID of the chatbot.
+
+        Returns
+        -------
+        ChatBot
+            The chat session.
+        """
+
+        chatbot = self.chatbots.get(chatbot_id)
+        version = self.docu_talk.descriptors.get_version(chatbot_id)
+
+        if chatbot is None or chatbot.version != version:
+            chatbot = self.docu_talk.start_chat(
+                chatbot_id=chatbot_id,
+                user_id=self.auth.user["email"]
+            )
+            self.chatbots[chatbot_id] = chatbot
+
+        return chatbot
+
     def set_page_config(
             self,
             layout: str,
@@ -76,6 +158,10 @@ class StreamlitDocuTalk:
             initial_sidebar_state="auto"
         )
 
+        if self.user_outdated and self.auth.logged_in:
+            self.user_outdated = False
+            self.auth.user = self.docu_talk.get_user(self.auth.user["email"])
+
         if display_sidebar:
             if not self.auth.user["terms_of_use_displayed"]:
                 self.sidebar.display_terms_of_use()
@@ -92,26 +178,48 @@ class StreamlitDocuTalk:
             if return_back_page:
                 st.switch_page(back_page_path)
 
+    def get_creation_job(self) -> dict | None:
+        """
+        Retrieves the chatbot creation followed by the session or, if there is none,
+        the one of the user in progress (e.g. submitted before a reconnection).
+
+        Returns
+        -------
+        dict or None
+            The job record, or None if there is none.
+        """
+
+        if self.creation_job_id is None:
+
+            jobs = self.docu_talk.jobs.get_jobs(
+                created_by=self.auth.user["email"],
+                kind="create_chatbot",
+                statuses=["pending", "running"]
+            )
+            if len(jobs) == 0:
+                return None
+
+            self.creation_job_id = jobs[0]["id"]
+
+        return self.docu_talk.jobs.get_job(self.creation_job_id)
+
     def store_usage(
             self,
-            model_name: str,
-            qty: int
+            usages: dict
         ) -> None:
         """
         Records usage and updates user credits.
 
         Parameters
         ----------
-        model_name : str
-            Name of the model used.
-        qty : int
-            Quantity of usage.
+        usages : dict
+            The usages of a Gemini call: model, total token count ("qty") and the
+            token count of each component.
         """
 
-        price = self.docu_talk.store_usage(
+        price = self.docu_talk.store_usages(
             user_id=self.auth.user["email"],
-            model_name=model_name,
-            qty=qty
+            usages=usages
         )
 
         credits = price * CREDIT_EXCHANGE_RATE
@@ -119,6 +227,109 @@ class StreamlitDocuTalk:
         st.toast(f"{credits:.1f} Credits", icon="💰")
         self.sidebar.update_credit_placeholder()
 
+    def estimate_question(
+            self,
+            nb_documents: int,
+            total_pages: int,
+            model_name: str
+        ) -> dict[str, dict[str, float]]:
+        """
+        Estimates the duration and the cost of a question before it is sent.
+
+        Parameters
+        ----------
+        nb_documents : int
+            The number of selected documents.
+        total_pages : int
+            The total number of pages of the selected documents.
+        model_name : str
+            Name of the model used.
+
+        Returns
+        -------
+        dict
+            The p50 and p90 estimates keyed by "duration", "ttft", "token_count",
+            "price" and "credits".
+        """
+
+        estimates = self.docu_talk.estimate_question(
+            nb_documents=nb_documents,
+            total_pages=total_pages,
+            model_name=model_name
+        )
+
+        if "price" in estimates:
+            estimates["credits"] = {
+                quantile: price * CREDIT_EXCHANGE_RATE
+                for quantile, price in estimates["price"].items()
+            }
+
+        return estimates
+
+    @staticmethod
+    def format_range(
+            quantiles: dict[str, float],
+            unit: str
+        ) -> str:
+        """
+        Formats a p50-p90 range.
+
+        Parameters
+        ----------
+        quantiles : dict
+            The "p50" and "p90" estimates.
+        unit : str
+            The unit of the estimates.
+
+        Returns
+        -------
+        str
+            The range, e.g. "5-9 seconds", or "about 5 seconds" when both ends
+            round to the same value.
+        """
+
+        low = max(quantiles["p50"], 0)
+        high = max(quantiles["p90"], low)
+
+        if f"{low:.0f}" == f"{high:.0f}":
+            return f"about {low:.0f} {unit}"
+
+        return f"{low:.0f}-{high:.0f} {unit}"
+
+    def get_waiting_message(
+            self,
+            estimates: dict[str, dict[str, float]],
+            streamed: bool = True
+        ) -> str:
+        """
+        Formats the estimates displayed while waiting for an answer.
+
+        Parameters
+        ----------
+        estimates : dict
+            The estimates returned by `estimate_question`.
+        streamed : bool, optional
+            Whether the answer is streamed, in which case the time to the first
+            words is shown (default is True).
+
+        Returns
+        -------
+        str
+            The waiting message.
+        """
+
+        if "duration" not in estimates:
+            return "..."
+
+        duration = self.format_range(estimates["duration"], "seconds")
+        message = f"Estimated duration: {duration}"
+
+        if streamed and "ttft" in estimates:
+            ttft = self.format_range(estimates["ttft"], "seconds")
+            message += f", first words in {ttft}"
+
+        return f"{message}..."
+
     @st_confirmation_dialog(
         title="Are you sure to delete your account?",
         content=(
@@ -155,15 +366,12 @@ class StreamlitDocuTalk:
             The new prompt text.
         """
 
-        self.docu_talk.db.update_data(
-            table="SuggestedPrompts",
-            filter={"chatbot_id": chatbot_id, "id": prompt_id},
-            updates={"prompt": new_prompt}
+        self.docu_talk.update_suggested_prompt(
+            chatbot_id=chatbot_id,
+            prompt_id=prompt_id,
+            prompt=new_prompt
         )
 
-        if chatbot_id in self.chatbots:
-            del self.chatbots[chatbot_id]
-
     @st_progress()
     def update_chatbot(
             self,
@@ -198,9 +406,6 @@ class StreamlitDocuTalk:
             user_id=self.auth.user["email"]
         )
 
-        if chatbot_id in self.chatbots:
-            del self.chatbots[chatbot_id]
-
     @st_confirmation_dialog(
         title="Are you sure you want to delete this Chat Bot?",
         content="By deleting this Chat Bot, nobody will be able to access it.",
@@ -227,9 +432,6 @@ class StreamlitDocuTalk:
             user_id=self.auth.user["email"]
         )
 
-        if chatbot_id in self.chatbots:
-            del self.chatbots[chatbot_id]
-
         st.switch_page("src/frontend/pages/home.py")
 
     @st_progress()
@@ -303,15 +505,11 @@ class StreamlitDocuTalk:
             ID of the chatbot to request sharing for.
         """
 
-        self.docu_talk.db.update_data(
-            table="Chatbots",
-            filter={"id": chatbot_id},
-            updates={"access": "pending_public_request"}
+        self.docu_talk.update_chatbot(
+            chatbot_id=chatbot_id,
+            access="pending_public_request"
         )
 
-        if chatbot_id in self.chatbots:
-            del self.chatbots[chatbot_id]
-
     @st_progress()
     def add_documents(
             self,
@@ -339,9 +537,6 @@ class StreamlitDocuTalk:
                 nb_pages=document["nb_pages"]
             )
 
-        if chatbot_id in self.chatbots:
-            self.chatbots[chatbot_id] = self.docu_talk.start_chat(chatbot_id)
-
     @st_progress()
     def delete_documents(
             self,
@@ -365,9 +560,6 @@ class StreamlitDocuTalk:
                 filename=filename
             )
 
-        if chatbot_id in self.chatbots:
-            del self.chatbots[chatbot_id]
-
     def form_documents(self):
         """
         Displays a form for uploading chatbot documents.